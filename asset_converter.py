@@ -1,27 +1,183 @@
+import io
 import os
-import subprocess
 import imageio
 import json
 from pathlib import Path
 from PIL import Image
 import numpy as np
-import requests
-import base64
+import dds_codec
+import vtf_codec
+import enhance_cache
+import metrics
+import resolution
+import texture_roles
+import tiling
+
+# Upload limit; large textures are enhanced tile by tile, so this only guards memory
+MAX_UPLOAD_BYTES = 64 * 1024 * 1024
 
 class AssetConverter:
-    def __init__(self, vtflib_path="vtflib132-bin/bin/x64/VTFCmd.exe"):
+    def __init__(self, dds_quality="fast", temp_dir="temp"):
         """
-        Initialize the asset converter with paths to necessary tools.
+        Initialize the asset converter.
         
         Args:
-            vtflib_path: Path to VTFCmd.exe for VTF conversion
+            dds_quality: Block compression quality for DDS/VTF output ('fast' or 'high')
+            temp_dir: Folder for intermediate PNG and metadata files (created on first write)
         """
-        self.vtflib_path = vtflib_path
-        
-        # Create necessary directories
-        self.temp_dir = Path("temp")
-        self.temp_dir.mkdir(exist_ok=True)
-        os.makedirs("output", exist_ok=True)
+        self.dds_quality = dds_quality
+        self.temp_dir = Path(temp_dir)
+
+    def _temp_path(self, filename):
+        """
+        Path inside temp_dir, creating the folder only when a file is actually written.
+        """
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        return self.temp_dir / filename
+
+    def load(self, data, format_name=None):
+        """
+        Decode a texture held in memory.
+
+        Args:
+            data: bytes, bytearray, memoryview or uint8 NumPy buffer with the file contents
+            format_name: 'dds', 'vtf' or 'png' (detected from the file signature if omitted)
+
+        Returns:
+            Tuple of (uint8 RGBA array, metadata dictionary); array elements, frames and
+            faces are stacked vertically, and PNGs have empty metadata
+        """
+        if isinstance(data, np.ndarray):
+            data = memoryview(np.ascontiguousarray(data, dtype=np.uint8)).cast("B")
+        signature = bytes(data[:4])
+        if format_name is None:
+            format_name = {b"DDS ": "dds", b"VTF\x00": "vtf"}.get(signature, "png")
+
+        format_name = format_name.lower()
+        with metrics.span(f"decode_{format_name}"):
+            if format_name == "dds":
+                metadata = dds_codec.parse_dds_header(data)
+                # Fall back to imageio for formats the built-in decoder does not handle
+                try:
+                    image = dds_codec.decode_dds_array(data, metadata)
+                    image = image.reshape((-1,) + image.shape[2:])
+                except NotImplementedError:
+                    image = imageio.imread(bytes(data), format='dds')
+                return image, metadata
+            if format_name == "vtf":
+                metadata = vtf_codec.parse_vtf_header(data)
+                # Fall back to imageio (a plugin may read it); otherwise name the format
+                try:
+                    image = vtf_codec.decode_vtf_array(data, metadata)
+                    image = image.reshape((-1,) + image.shape[2:])
+                except NotImplementedError as e:
+                    try:
+                        image = imageio.imread(bytes(data))
+                    except Exception:
+                        raise NotImplementedError(
+                            f"VTF image format {metadata['format']} cannot be decoded") from e
+                return image, metadata
+            return np.array(Image.open(io.BytesIO(data)).convert("RGBA")), {}
+
+    def save(self, image, format_name, metadata=None):
+        """
+        Encode an image in memory.
+
+        Args:
+            image: uint8 array of shape (height, width[, channels]), or PNG bytes
+            format_name: 'png', 'dds' or 'vtf'
+            metadata: Source metadata; DDS/VTF output reuses its format, flags and mips
+
+        Returns:
+            bytes with the encoded file
+        """
+        format_name = format_name.lower()
+        if format_name == "png":
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                return bytes(image)
+            with metrics.span("encode_png"):
+                buffer = io.BytesIO()
+                Image.fromarray(image).save(buffer, format="PNG")
+                return buffer.getvalue()
+
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            with metrics.span("decode_png"):
+                image = np.array(Image.open(io.BytesIO(image)).convert("RGBA"))
+        with metrics.span(f"encode_{format_name}"):
+            if format_name == "dds":
+                return dds_codec.encode_dds_like(image, metadata or {}, quality=self.dds_quality)
+            if format_name == "vtf":
+                return vtf_codec.encode_vtf_like(image, metadata or {}, quality=self.dds_quality)
+            raise ValueError(f"Unsupported format: {format_name}")
+
+    def repack_dds(self, image, header, output_path):
+        """
+        Write an image as DDS under the source texture's original header.
+
+        The header and DX10 extension are kept byte for byte (engine-specific fields
+        included); only size-dependent fields change if the image was resized. The
+        payload is streamed to the output file surface by surface.
+
+        Args:
+            image: uint8 array of shape (height, width[, channels]), or PNG bytes
+            header: Original header bytes (e.g. the .ddsh sidecar written by dds_to_png)
+            output_path: Path to save the DDS file
+
+        Returns:
+            Path to the DDS file
+        """
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            with metrics.span("decode_png"):
+                image = np.array(Image.open(io.BytesIO(image)).convert("RGBA"))
+        with metrics.span("encode_dds"), open(output_path, "wb") as f:
+            dds_codec.repack_dds(f, image, header, quality=self.dds_quality)
+        return output_path
+
+    def enhance(self, image, denoising_strength=0.25, cfg_scale=4, steps=40,
+                prompt="semi-realistic pixel art remaster, detailed, high-res", negative_prompt="", client=None,
+                tile_size=tiling.DEFAULT_TILE_SIZE, seamless=False, working_area=resolution.DEFAULT_AREA,
+                role=texture_roles.ROLE_ALBEDO):
+        """
+        Enhance an image in memory using Stable Diffusion.
+
+        Only colour textures reach Stable Diffusion; normal maps and masks are upscaled
+        on the CPU instead (see texture_roles).
+
+        Args:
+            image: uint8 array, or PNG bytes
+            denoising_strength: Denoising strength for Stable Diffusion
+            cfg_scale: CFG scale for Stable Diffusion
+            steps: Steps for Stable Diffusion
+            prompt: Prompt for Stable Diffusion
+            negative_prompt: Negative prompt for Stable Diffusion
+            client: SDClient or sd_batch.BatchDispatcher (defaults to the shared cached client)
+            tile_size: Images larger than this are enhanced as overlapping tiles
+            seamless: Wrap tiles around the edges so tileable textures stay seamless
+            working_area: Area budget of the SD working resolution for untiled images
+            role: Texture role (texture_roles.ROLES)
+
+        Returns:
+            PNG bytes of the enhanced image
+        """
+        if role != texture_roles.ROLE_ALBEDO:
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                with metrics.span("decode_png"):
+                    image = np.array(Image.open(io.BytesIO(image)))
+            with metrics.span("upscale_cpu"):
+                upscaled = texture_roles.upscale(image, role, wrap=seamless)
+            return self.save(upscaled, "png")
+        return tiling.enhance_png(
+            self.save(image, "png"),
+            client or enhance_cache.get_cached_client(),
+            prompt,
+            negative_prompt=negative_prompt,
+            denoising_strength=denoising_strength,
+            cfg_scale=cfg_scale,
+            steps=steps,
+            tile_size=tile_size,
+            seamless=seamless,
+            working_area=working_area,
+        )
         
     def dds_to_png(self, dds_path):
         """
@@ -34,20 +190,26 @@ class AssetConverter:
             Path to the converted PNG file
         """
         try:
-            # Load image using imageio
-            image = imageio.imread(dds_path, format='dds')
-            
+            # Read the whole file once and decode it in memory
+            with metrics.span("read_input"), open(dds_path, "rb") as f:
+                data = f.read()
+            image, metadata = self.load(data, "dds")
+
             # Save as PNG
             png_filename = os.path.splitext(os.path.basename(dds_path))[0] + ".png"
-            png_path = self.temp_dir / png_filename
-            imageio.imwrite(png_path, image, format='png')
+            png_path = self._temp_path(png_filename)
+            with metrics.span("write_png"):
+                imageio.imwrite(png_path, image, format='png')
             
-            # Extract and save metadata
-            metadata = self._extract_dds_metadata(dds_path)
+            # Save metadata
             meta_filename = os.path.splitext(os.path.basename(dds_path))[0] + ".json"
-            meta_path = self.temp_dir / meta_filename
+            meta_path = self._temp_path(meta_filename)
             with open(meta_path, "w") as f:
                 json.dump(metadata, f, indent=2)
+
+            # Keep the raw header next to it for lossless repacking
+            with open(os.path.splitext(meta_path)[0] + dds_codec.HEADER_SIDECAR_EXT, "wb") as f:
+                f.write(dds_codec.dds_header_bytes(data))
                 
             return png_path, meta_path
         except Exception as e:
@@ -56,7 +218,7 @@ class AssetConverter:
     
     def vtf_to_png(self, vtf_path):
         """
-        Convert a VTF file to PNG using VTFCmd.
+        Convert a VTF file to PNG.
         
         Args:
             vtf_path: Path to the VTF file
@@ -65,21 +227,20 @@ class AssetConverter:
             Path to the converted PNG file
         """
         try:
-            # Use VTFCmd to convert VTF to PNG
+            # Read the whole file once and decode it in memory
+            with metrics.span("read_input"), open(vtf_path, "rb") as f:
+                data = f.read()
+            image, metadata = self.load(data, "vtf")
+
+            # Save as PNG
             png_filename = os.path.splitext(os.path.basename(vtf_path))[0] + ".png"
-            png_path = self.temp_dir / png_filename
-            
-            subprocess.run([
-                self.vtflib_path,
-                "-file", vtf_path,
-                "-output", str(png_path),
-                "-exportformat", "png"
-            ], check=True)
+            png_path = self._temp_path(png_filename)
+            with metrics.span("write_png"):
+                imageio.imwrite(png_path, image, format='png')
             
-            # Extract and save metadata
-            metadata = self._extract_vtf_metadata(vtf_path)
+            # Save metadata
             meta_filename = os.path.splitext(os.path.basename(vtf_path))[0] + ".json"
-            meta_path = self.temp_dir / meta_filename
+            meta_path = self._temp_path(meta_filename)
             with open(meta_path, "w") as f:
                 json.dump(metadata, f, indent=2)
                 
@@ -91,6 +252,9 @@ class AssetConverter:
     def png_to_dds(self, png_path, metadata_path=None, output_path=None):
         """
         Convert a PNG file back to DDS using the original metadata.
+
+        If a header sidecar (.ddsh) sits next to the metadata file, the texture is
+        repacked under the original header and the JSON is not read.
         
         Args:
             png_path: Path to the PNG file
@@ -101,6 +265,22 @@ class AssetConverter:
             Path to the converted DDS file
         """
         try:
+            # Determine output path
+            if output_path is None:
+                output_path = os.path.splitext(png_path)[0] + ".dds"
+
+            # Lossless header-preserving repack
+            header_path = metadata_path and os.path.splitext(metadata_path)[0] + dds_codec.HEADER_SIDECAR_EXT
+            if header_path and os.path.exists(header_path):
+                with open(header_path, "rb") as f:
+                    header = f.read()
+                with metrics.span("decode_png"):
+                    img_array = np.array(Image.open(png_path).convert("RGBA"))
+                try:
+                    return self.repack_dds(img_array, header, output_path)
+                except NotImplementedError:
+                    pass  # Formats the encoder cannot write fall back to the metadata path
+
             # Load metadata if provided
             metadata = {}
             if metadata_path and os.path.exists(metadata_path):
@@ -108,27 +288,14 @@ class AssetConverter:
                     metadata = json.load(f)
             
             # Load PNG image
-            img = Image.open(png_path)
-            img_array = np.array(img)
-            
-            # Determine output path
-            if output_path is None:
-                output_path = os.path.splitext(png_path)[0] + ".dds"
-            
-            # Get format from metadata or use default
-            format_str = metadata.get('format', 'DXT5')
+            with metrics.span("decode_png"):
+                img = Image.open(png_path).convert("RGBA")
+                img_array = np.array(img)
             
-            # Convert format string to imageio format
-            format_map = {
-                'DXT1': 'dxt1',
-                'DXT3': 'dxt3',
-                'DXT5': 'dxt5',
-                'BC7': 'bc7'
-            }
-            dds_format = format_map.get(format_str.upper(), 'dxt5')
-            
-            # Save as DDS
-            imageio.imwrite(output_path, img_array, format='dds', compression=dds_format)
+            # Block-compress in the original format (DX10 DXGI format or legacy FourCC)
+            dds_data = self.save(img_array, "dds", metadata)
+            with metrics.span("write_output"), open(output_path, "wb") as f:
+                f.write(dds_data)
             
             return output_path
         except Exception as e:
@@ -137,7 +304,7 @@ class AssetConverter:
     
     def png_to_vtf(self, png_path, metadata_path=None, output_path=None):
         """
-        Convert a PNG file back to VTF using VTFCmd.
+        Convert a PNG file back to VTF using the original metadata.
         
         Args:
             png_path: Path to the PNG file
@@ -154,41 +321,19 @@ class AssetConverter:
                 with open(metadata_path, 'r') as f:
                     metadata = json.load(f)
             
+            # Load PNG image
+            with metrics.span("decode_png"):
+                img = Image.open(png_path).convert("RGBA")
+                img_array = np.array(img)
+            
             # Determine output path
             if output_path is None:
                 output_path = os.path.splitext(png_path)[0] + ".vtf"
             
-            # Get format from metadata or use default
-            format_str = metadata.get('format', 'DXT5')
-            
-            # Convert format string to VTFCmd format
-            format_map = {
-                'DXT1': 'dxt1',
-                'DXT3': 'dxt3',
-                'DXT5': 'dxt5',
-                'BC7': 'bc7'
-            }
-            vtf_format = format_map.get(format_str.upper(), 'dxt5')
-            
-            # Build VTFCmd command
-            cmd = [
-                self.vtflib_path,
-                "-file", png_path,
-                "-output", output_path,
-                "-format", vtf_format,
-                "-resize", "1",  # No resize
-                "-normal", "0",  # Not a normal map
-                "-mipmaps", "1"  # Generate mipmaps
-            ]
-            
-            # Add additional options from metadata if available
-            if 'flags' in metadata:
-                cmd.extend(["-flags", str(metadata['flags'])])
-            if 'bumpmap' in metadata:
-                cmd.extend(["-bumpmap", str(metadata['bumpmap'])])
-            
-            # Run VTFCmd
-            subprocess.run(cmd, check=True)
+            # Encode with the original format, flags, version and mipmap count
+            vtf_data = self.save(img_array, "vtf", metadata)
+            with metrics.span("write_output"), open(output_path, "wb") as f:
+                f.write(vtf_data)
             
             return output_path
         except Exception as e:
@@ -206,44 +351,9 @@ class AssetConverter:
             Dictionary containing metadata
         """
         try:
-            metadata = {}
             with open(dds_path, "rb") as f:
-                header = f.read(128)  # Standard DDS header
-                if header[0:4] != b'DDS ':
-                    raise ValueError("Invalid DDS magic number")
-
-                # Extract basic information
-                metadata["magic"] = "DDS "
-                metadata["header_hex"] = header.hex()
-                
-                # Extract dimensions
-                metadata["width"] = int.from_bytes(header[12:16], 'little')
-                metadata["height"] = int.from_bytes(header[16:20], 'little')
-                
-                # Extract format information
-                fourcc = header[84:88]
-                fourcc_str = fourcc.decode("ascii", errors="ignore")
-                metadata["fourcc"] = fourcc_str
-                
-                # Map FourCC to format name
-                format_map = {
-                    'DXT1': 'DXT1',
-                    'DXT3': 'DXT3',
-                    'DXT5': 'DXT5',
-                    'DX10': 'BC7'
-                }
-                metadata["format"] = format_map.get(fourcc_str, 'DXT5')
-
-                # Check for DX10 extended header
-                if fourcc_str == "DX10":
-                    dx10_header = f.read(20)
-                    metadata["dx10_header_hex"] = dx10_header.hex()
-                    metadata["has_dx10_header"] = True
-                    # Extract additional DX10 format information
-                    dx10_format = int.from_bytes(dx10_header[0:4], 'little')
-                    metadata["dx10_format"] = dx10_format
-                else:
-                    metadata["has_dx10_header"] = False
+                header = f.read(148)  # Standard DDS header plus optional DX10 extension
+            metadata = dds_codec.parse_dds_header(header)
 
             return metadata
         except Exception as e:
@@ -252,7 +362,7 @@ class AssetConverter:
     
     def _extract_vtf_metadata(self, vtf_path):
         """
-        Extract metadata from a VTF file using VTFCmd.
+        Extract metadata from a VTF file.
         
         Args:
             vtf_path: Path to the VTF file
@@ -261,52 +371,13 @@ class AssetConverter:
             Dictionary containing metadata
         """
         try:
-            metadata = {"format": "vtf", "source": vtf_path}
-            
-            # Create a temporary info file
-            info_path = os.path.splitext(vtf_path)[0] + "_info.txt"
-            
-            # Run VTFCmd to get VTF information
-            subprocess.run([
-                self.vtflib_path,
-                "-file", vtf_path,
-                "-info",
-                "-output", info_path
-            ], check=True)
-            
-            # Read the info file
-            if os.path.exists(info_path):
-                with open(info_path, 'r') as f:
-                    info_text = f.read()
-                    
-                    # Extract format
-                    if "DXT1" in info_text:
-                        metadata["format"] = "DXT1"
-                    elif "DXT3" in info_text:
-                        metadata["format"] = "DXT3"
-                    elif "DXT5" in info_text:
-                        metadata["format"] = "DXT5"
-                    elif "BC7" in info_text:
-                        metadata["format"] = "BC7"
-                    
-                    # Extract flags
-                    if "NORMAL" in info_text:
-                        metadata["flags"] = "NORMAL"
-                    if "BUMPMAP" in info_text:
-                        metadata["bumpmap"] = True
-                    
-                    # Extract dimensions
-                    import re
-                    width_match = re.search(r"Width:\s*(\d+)", info_text)
-                    height_match = re.search(r"Height:\s*(\d+)", info_text)
-                    if width_match:
-                        metadata["width"] = int(width_match.group(1))
-                    if height_match:
-                        metadata["height"] = int(height_match.group(1))
-                
-                # Clean up info file
-                os.remove(info_path)
-            
+            with open(vtf_path, "rb") as f:
+                header = f.read(80)
+                # 7.3+ headers continue with the resource directory
+                header_size = int.from_bytes(header[12:16], 'little')
+                header += f.read(max(0, header_size - len(header)))
+            metadata = vtf_codec.parse_vtf_header(header)
+
             return metadata
         except Exception as e:
             print(f"Error extracting VTF metadata: {str(e)}")
@@ -352,7 +423,10 @@ class AssetConverter:
             print(f"Unsupported format: {original_format}")
             return None
 
-    def enhance_image(self, png_path, denoising_strength, cfg_scale, steps):
+    def enhance_image(self, png_path, denoising_strength, cfg_scale, steps,
+                      prompt="semi-realistic pixel art remaster, detailed, high-res", negative_prompt="", client=None,
+                      tile_size=tiling.DEFAULT_TILE_SIZE, seamless=False, working_area=resolution.DEFAULT_AREA,
+                      role=texture_roles.ROLE_ALBEDO):
         """
         Enhance an image using Stable Diffusion.
         
@@ -361,34 +435,39 @@ class AssetConverter:
             denoising_strength: Denoising strength for Stable Diffusion
             cfg_scale: CFG scale for Stable Diffusion
             steps: Steps for Stable Diffusion
+            prompt: Prompt for Stable Diffusion
+            negative_prompt: Negative prompt for Stable Diffusion
+            client: SDClient or sd_batch.BatchDispatcher (defaults to the shared cached client)
+            tile_size: Images larger than this are enhanced as overlapping tiles
+            seamless: Wrap tiles around the edges so tileable textures stay seamless
+            working_area: Area budget of the SD working resolution for untiled images
+            role: Texture role; normal maps and masks are upscaled on the CPU
             
         Returns:
             Path to the enhanced PNG file
         """
         try:
-            # Encode the image as base64
-            with open(png_path, "rb") as f:
-                encoded_image = base64.b64encode(f.read()).decode("utf-8")
-
-            # Send request to Stable Diffusion API
-            response = requests.post(
-                "http://127.0.0.1:7860/sdapi/v1/img2img",
-                json={
-                    "init_images": [encoded_image],
-                    "prompt": "semi-realistic pixel art remaster, detailed, high-res",
-                    "denoising_strength": denoising_strength,
-                    "cfg_scale": cfg_scale,
-                    "steps": steps
-                }
+            # Send request to Stable Diffusion over the shared pooled session, unless cached
+            with metrics.span("read_input"), open(png_path, "rb") as f:
+                image_bytes = f.read()
+            enhanced_image = self.enhance(
+                image_bytes,
+                denoising_strength,
+                cfg_scale,
+                steps,
+                prompt=prompt,
+                negative_prompt=negative_prompt,
+                client=client,
+                tile_size=tile_size,
+                seamless=seamless,
+                working_area=working_area,
+                role=role,
             )
 
-            # Decode the response
-            enhanced_image = base64.b64decode(response.json()["images"][0])
-
             # Save the enhanced image
             enhanced_filename = os.path.splitext(os.path.basename(png_path))[0] + "_enhanced.png"
-            enhanced_path = self.temp_dir / enhanced_filename
-            with open(enhanced_path, "wb") as f:
+            enhanced_path = self._temp_path(enhanced_filename)
+            with metrics.span("write_output"), open(enhanced_path, "wb") as f:
                 f.write(enhanced_image)
 
             return enhanced_path
@@ -396,17 +475,18 @@ class AssetConverter:
             print(f"Error enhancing image: {str(e)}")
             return None
 
-    def check_file_size(self, uploaded_file):
+    def check_file_size(self, uploaded_file, max_bytes=MAX_UPLOAD_BYTES):
         """
-        Check if the file size is under 25KB.
+        Check if the file size is within the upload limit.
         
         Args:
             uploaded_file: The uploaded file object
+            max_bytes: Maximum file size in bytes
             
         Returns:
-            True if the file size is under 25KB, False otherwise
+            True if the file size is within the limit, False otherwise
         """
-        if uploaded_file.size > 25000:
-            print(f"{uploaded_file.name} is too large! Please upload files under 25KB.")
+        if uploaded_file.size > max_bytes:
+            print(f"{uploaded_file.name} is too large! Please upload files under {max_bytes // (1024 * 1024)}MB.")
             return False
-        return True 
\ No newline at end of file
+        return True
\ No newline at end of file
@@ -0,0 +1,320 @@
+"""Atlas packing: many small textures enhanced together on one SD-native canvas."""
+import io
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import imageio.v3 as iio
+import numpy as np
+from PIL import Image
+
+import metrics
+from sd_batch import _checkpoint
+from sd_client import DEFAULT_CONCURRENCY, get_client
+
+# Canvas edge (SD-native), the largest sprite packed into it and the gutter around each sprite
+DEFAULT_ATLAS_SIZE = 1024
+DEFAULT_MAX_SPRITE = 256
+DEFAULT_GUTTER = 16
+
+# Sprites start on the latent grid (8 pixels) and canvases are trimmed to multiples of 64
+ALIGN = 8
+CANVAS_MULTIPLE = 64
+
+# How long a partly filled atlas waits for more sprites before it is sent (seconds)
+DEFAULT_MAX_WAIT = 0.25
+
+# Colour of canvas area no sprite covers
+BACKGROUND = 127
+
+
+def _align(value, multiple):
+    return -(-value // multiple) * multiple
+
+
+def pack_shelves(sizes, width, height, gutter=DEFAULT_GUTTER, align=ALIGN):
+    """
+    Place rectangles on a canvas in shelves (rows), tallest first.
+
+    Each rectangle is padded by the gutter on every side, and positions are aligned
+    so sprites start on the latent grid.
+
+    Args:
+        sizes: List of (height, width) of the sprites
+        width: Canvas width
+        height: Canvas height
+        gutter: Padding around each sprite in pixels
+        align: Alignment of sprite positions in pixels
+
+    Returns:
+        Dictionary mapping the index of every sprite that fits to its (y, x) position
+    """
+    order = sorted(range(len(sizes)), key=lambda index: (-sizes[index][0], -sizes[index][1], index))
+    positions = {}
+    shelf_top = 0
+    shelf_height = 0
+    cursor = 0
+    for index in order:
+        sprite_h, sprite_w = sizes[index]
+        slot_w = _align(sprite_w + 2 * gutter, align)
+        slot_h = _align(sprite_h + 2 * gutter, align)
+        if slot_w > width:
+            continue
+        if cursor + slot_w > width:
+            # Start a new shelf below the current one
+            shelf_top += shelf_height
+            shelf_height = 0
+            cursor = 0
+        if shelf_top + slot_h > height:
+            continue
+        positions[index] = (shelf_top + gutter, cursor + gutter)
+        cursor += slot_w
+        shelf_height = max(shelf_height, slot_h)
+    return positions
+
+
+def build_atlas(sprites, positions, gutter=DEFAULT_GUTTER, max_size=DEFAULT_ATLAS_SIZE):
+    """
+    Paint sprites onto a canvas, trimmed to the area used.
+
+    Gutters repeat each sprite's edge pixels, so diffusion sees continuous content
+    around every sprite instead of bleeding its neighbours into it.
+
+    Args:
+        sprites: List of uint8 RGB arrays
+        positions: Dictionary mapping sprite indices to (y, x) from pack_shelves
+        gutter: Padding around each sprite in pixels
+        max_size: Canvas edge before trimming
+
+    Returns:
+        uint8 RGB array of the canvas (both sides multiples of 64)
+    """
+    used_h = max(y + sprites[index].shape[0] + gutter for index, (y, x) in positions.items())
+    used_w = max(x + sprites[index].shape[1] + gutter for index, (y, x) in positions.items())
+    canvas_h = min(_align(used_h, CANVAS_MULTIPLE), max_size)
+    canvas_w = min(_align(used_w, CANVAS_MULTIPLE), max_size)
+    canvas = np.full((canvas_h, canvas_w, 3), BACKGROUND, dtype=np.uint8)
+    for index, (y, x) in positions.items():
+        sprite = sprites[index]
+        padded = np.pad(sprite, ((gutter, gutter), (gutter, gutter), (0, 0)), mode="edge")
+        canvas[y - gutter:y + sprite.shape[0] + gutter, x - gutter:x + sprite.shape[1] + gutter] = padded
+    return canvas
+
+
+class AtlasDispatcher:
+    def __init__(self, client=None, atlas_size=DEFAULT_ATLAS_SIZE, max_sprite=DEFAULT_MAX_SPRITE,
+                 gutter=DEFAULT_GUTTER, max_wait=DEFAULT_MAX_WAIT):
+        """
+        Collect img2img jobs for small textures and send them packed into atlases.
+
+        Sprites sharing prompt, parameters and checkpoint are packed into one canvas
+        with edge-padded gutters, sent as a single img2img request, and the result is
+        sliced back into one PNG per sprite (with the sprite's own alpha). Larger
+        textures, and atlases holding a single sprite, go to the client unchanged.
+
+        Has the same img2img signature as SDClient, so it can stand in for one.
+
+        Args:
+            client: SDClient or BatchDispatcher to send atlases through (defaults to the shared client)
+            atlas_size: Canvas edge in pixels (a multiple of 64)
+            max_sprite: Textures with a longer side are not packed
+            gutter: Padding around each sprite in pixels
+            max_wait: Seconds a partly filled atlas waits for more sprites
+        """
+        self.client = client or get_client()
+        self.atlas_size = _align(atlas_size, CANVAS_MULTIPLE)
+        self.max_sprite = max_sprite
+        self.gutter = gutter
+        self.max_wait = max_wait
+        self.max_concurrency = getattr(self.client, "max_concurrency", None) or DEFAULT_CONCURRENCY
+        self._buckets = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self.stats = {"jobs": 0, "packed": 0, "atlases": 0, "passthrough": 0}
+
+        self._senders = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        self._thread = threading.Thread(target=self._run, name="sd-atlas-dispatcher", daemon=True)
+        self._thread.start()
+
+    def _fits(self, jobs):
+        return len(pack_shelves([job["pixels"].shape[:2] for job in jobs], self.atlas_size, self.atlas_size,
+                                self.gutter)) == len(jobs)
+
+    def submit(self, image, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4, steps=40,
+               **params):
+        """
+        Queue one img2img job.
+
+        Args:
+            image: PNG bytes of the init image
+            prompt: Prompt for Stable Diffusion
+            negative_prompt: Negative prompt for Stable Diffusion
+            denoising_strength: Strength of enhancement (0.0 to 1.0)
+            cfg_scale: CFG scale for prompt adherence
+            steps: Number of diffusion steps
+            **params: Extra img2img parameters passed through to the API
+
+        Returns:
+            Future resolving to the PNG bytes of the enhanced image
+        """
+        pixels = None
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            with metrics.span("decode_png"):
+                pixels = iio.imread(bytes(image))
+        # An explicit output size other than the sprite's own cannot be honoured in an atlas
+        size = (params.get("height"), params.get("width"))
+        if pixels is None or pixels.dtype != np.uint8 or max(pixels.shape[:2]) > self.max_sprite \
+                or (size != (None, None) and size != pixels.shape[:2]):
+            with self._condition:
+                self.stats["jobs"] += 1
+                self.stats["passthrough"] += 1
+            return self._senders.submit(self.client.img2img, image, prompt, negative_prompt, denoising_strength,
+                                        cfg_scale, steps, **params)
+
+        if pixels.ndim == 2:
+            pixels = pixels[..., None]
+        alpha = pixels[..., -1] if pixels.shape[2] in (2, 4) else None
+        rgb = pixels[..., :3] if pixels.shape[2] >= 3 else np.repeat(pixels[..., :1], 3, axis=2)
+        shared = {key: value for key, value in params.items() if key not in ("width", "height")}
+        key = (_checkpoint(shared), json.dumps(dict(shared, prompt=prompt, negative_prompt=negative_prompt,
+                                                    denoising_strength=denoising_strength, cfg_scale=cfg_scale,
+                                                    steps=steps), sort_keys=True, default=str))
+        future = Future()
+        job = {"image": image, "pixels": np.ascontiguousarray(rgb), "alpha": alpha, "future": future}
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("AtlasDispatcher is closed")
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = {"since": time.monotonic(), "args": (prompt, negative_prompt,
+                                               denoising_strength, cfg_scale, steps, shared), "jobs": [],
+                                               "full": False}
+            bucket["jobs"].append(job)
+            # Full once the queued sprites no longer fit on one canvas
+            bucket["full"] = not self._fits(bucket["jobs"])
+            self.stats["jobs"] += 1
+            self._condition.notify()
+        return future
+
+    def img2img(self, image, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4, steps=40,
+                **params):
+        """
+        Blocking img2img through the atlas packer (drop-in for SDClient.img2img).
+
+        Returns:
+            PNG bytes of the enhanced image
+        """
+        return self.submit(image, prompt, negative_prompt, denoising_strength, cfg_scale, steps,
+                           **params).result()
+
+    def _next_bucket(self):
+        """
+        Pick the bucket to send next, or how long to wait for one to become ready.
+
+        Returns:
+            Tuple of (key or None, seconds to wait)
+        """
+        now = time.monotonic()
+        wait = None
+        ready = []
+        for key, bucket in self._buckets.items():
+            remaining = bucket["since"] + self.max_wait - now
+            if self._closed or bucket["full"] or remaining <= 0:
+                ready.append(key)
+            else:
+                wait = remaining if wait is None else min(wait, remaining)
+        if not ready:
+            return None, wait
+        return min(ready, key=lambda key: self._buckets[key]["since"]), 0
+
+    def _run(self):
+        while True:
+            with self._condition:
+                key, wait = self._next_bucket()
+                while key is None:
+                    if self._closed and not self._buckets:
+                        return
+                    self._condition.wait(wait)
+                    key, wait = self._next_bucket()
+
+                # Take the sprites that fit on one canvas; the rest stay queued
+                bucket = self._buckets[key]
+                with metrics.span("atlas_pack"):
+                    positions = pack_shelves([job["pixels"].shape[:2] for job in bucket["jobs"]],
+                                             self.atlas_size, self.atlas_size, self.gutter)
+                jobs = [(job, positions[index]) for index, job in enumerate(bucket["jobs"]) if index in positions]
+                bucket["jobs"] = [job for index, job in enumerate(bucket["jobs"]) if index not in positions]
+                bucket["full"] = bool(bucket["jobs"]) and not self._fits(bucket["jobs"])
+                if not bucket["jobs"]:
+                    del self._buckets[key]
+                if jobs:
+                    self.stats["atlases"] += 1
+                    self.stats["packed"] += len(jobs)
+            if jobs:
+                self._senders.submit(self._send, bucket["args"], jobs)
+            else:
+                # A sprite too large for the canvas with its gutter: send it on its own
+                for job in bucket["jobs"]:
+                    self._senders.submit(self._send, bucket["args"], [(job, None)])
+                with self._condition:
+                    self._buckets.pop(key, None)
+
+    def _send(self, args, jobs):
+        """
+        Send one atlas and hand each sprite's slice back to its caller.
+        """
+        prompt, negative_prompt, denoising_strength, cfg_scale, steps, params = args
+        try:
+            if len(jobs) == 1:
+                # Nothing to share the request with
+                job = jobs[0][0]
+                job["future"].set_result(self.client.img2img(job["image"], prompt, negative_prompt,
+                                                             denoising_strength, cfg_scale, steps, **params))
+                return
+            sprites = [job["pixels"] for job, _ in jobs]
+            positions = {index: position for index, (_, position) in enumerate(jobs)}
+            with metrics.span("atlas_pack"):
+                canvas = build_atlas(sprites, positions, self.gutter, self.atlas_size)
+                buffer = io.BytesIO()
+                Image.fromarray(canvas).save(buffer, format="PNG", compress_level=1)
+            height, width = canvas.shape[:2]
+            result = self.client.img2img(buffer.getvalue(), prompt, negative_prompt, denoising_strength,
+                                         cfg_scale, steps, width=width, height=height, **params)
+            with metrics.span("atlas_slice"):
+                enhanced = Image.open(io.BytesIO(result)).convert("RGB")
+                if enhanced.size != (width, height):
+                    enhanced = enhanced.resize((width, height), Image.LANCZOS)
+                enhanced = np.asarray(enhanced)
+                outputs = []
+                for job, (y, x) in jobs:
+                    sprite_h, sprite_w = job["pixels"].shape[:2]
+                    sprite = enhanced[y:y + sprite_h, x:x + sprite_w]
+                    if job["alpha"] is not None:
+                        sprite = np.dstack([sprite, job["alpha"]])
+                    buffer = io.BytesIO()
+                    Image.fromarray(np.ascontiguousarray(sprite)).save(buffer, format="PNG", compress_level=1)
+                    outputs.append(buffer.getvalue())
+        except Exception as e:
+            for job, _ in jobs:
+                if not job["future"].done():
+                    job["future"].set_exception(e)
+            return
+        for (job, _), output in zip(jobs, outputs):
+            job["future"].set_result(output)
+
+    def close(self):
+        """
+        Send everything still queued and stop the dispatcher.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self._senders.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
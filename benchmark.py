@@ -0,0 +1,362 @@
+"""Offline benchmarks of the conversion, codec and enhancement stages, compared against a stored baseline."""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from asset_converter import AssetConverter
+import dds_codec
+from enhance_backend import enhance_texture
+from sd_client import DEFAULT_CONCURRENCY
+import vtf_codec
+
+DEFAULT_SIZES = (256, 512, 1024, 2048, 4096)
+DEFAULT_FORMATS = ("DXT1", "DXT3", "DXT5", "BC7")
+SAMPLE_DIRS = ("LR", "uploads")
+SAMPLE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+DEFAULT_FIXTURE_DIR = os.path.join(".cache", "bench")
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+# A stage counts as a regression when it is this much slower than the baseline
+DEFAULT_THRESHOLD = 0.25
+
+# Header stages are too fast to time one call at a time
+HEADER_CALLS = 200
+HEADER_STAGES = ("_extract_dds_metadata", "_extract_vtf_metadata", "create_dds_header")
+
+DDS_STAGES = ("_extract_dds_metadata", "create_dds_header", "dds_to_png", "png_to_dds", "enhance_texture")
+VTF_STAGES = ("_extract_vtf_metadata", "vtf_to_png", "png_to_vtf", "enhance_texture")
+
+
+class StubClient:
+    def __init__(self, latency=0.0):
+        """
+        Offline stand-in for the img2img endpoint: echoes the init image back.
+
+        Keeps enhance_texture runs independent of the WebUI, so they measure only our
+        own work (PNG round trips, tiling, blending and re-encoding).
+
+        Args:
+            latency: Simulated seconds per request
+        """
+        self.latency = latency
+        self.max_concurrency = DEFAULT_CONCURRENCY
+
+    def img2img(self, image, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4, steps=40,
+                **params):
+        if self.latency:
+            time.sleep(self.latency)
+        return bytes(image)
+
+
+def synthetic_texture(size, seed=0):
+    """
+    Deterministic RGBA test pattern: gradients, a high-frequency ripple, noise and a
+    checkered alpha, so the encoders see both smooth and busy blocks.
+
+    Args:
+        size: Edge length in pixels
+        seed: Noise seed
+
+    Returns:
+        uint8 array of shape (size, size, 4)
+    """
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(0, 1, size, dtype=np.float32)
+    x, y = ramp[None, :], ramp[:, None]
+    image = np.empty((size, size, 4), dtype=np.uint8)
+    image[..., 0] = x * 200
+    image[..., 1] = y * 200
+    image[..., 2] = 100 + 100 * np.sin(24 * np.pi * (x + y))
+    image[..., :3] += rng.integers(0, 56, (size, size, 3), dtype=np.uint8)
+    image[..., 3] = np.where((np.floor(x * 8) + np.floor(y * 8)) % 2, 255, 96)
+    return image
+
+
+def build_fixtures(fixture_dir=DEFAULT_FIXTURE_DIR, sizes=DEFAULT_SIZES, formats=DEFAULT_FORMATS, vtf=True,
+                   samples=True):
+    """
+    Generate (or reuse) the benchmark textures.
+
+    DDS and VTF fixtures cover every size and format (VTF only where the format has a
+    VTF image format ID). The PNG samples in LR/ and uploads/ are added as DXT5 DDS files.
+    Existing files are reused, so only the first run pays for encoding.
+
+    Args:
+        fixture_dir: Folder holding the fixtures
+        sizes: Edge lengths in pixels
+        formats: DDS formats ('DXT1', 'DXT3', 'DXT5', 'BC7')
+        vtf: Also build VTF fixtures
+        samples: Also convert the sample images
+
+    Returns:
+        List of fixture dictionaries (name, path, container, format, width, height)
+    """
+    os.makedirs(fixture_dir, exist_ok=True)
+    fixtures = []
+
+    def add(name, container, format_name, size, encode):
+        path = os.path.join(fixture_dir, name)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(encode())
+        fixtures.append({"name": name, "path": path, "container": container, "format": format_name,
+                         "width": size[0], "height": size[1]})
+
+    for size in sizes:
+        for format_name in formats:
+            add(f"{format_name}-{size}.dds", "dds", format_name, (size, size),
+                lambda: dds_codec.encode_dds(synthetic_texture(size), format_name))
+            if vtf and format_name in vtf_codec.VTF_FORMAT_IDS:
+                add(f"{format_name}-{size}.vtf", "vtf", format_name, (size, size),
+                    lambda: vtf_codec.encode_vtf(synthetic_texture(size), format_name))
+
+    if samples:
+        for folder in SAMPLE_DIRS:
+            if not os.path.isdir(folder):
+                continue
+            for filename in sorted(os.listdir(folder)):
+                if not filename.lower().endswith(SAMPLE_EXTENSIONS):
+                    continue
+                image = np.array(Image.open(os.path.join(folder, filename)).convert("RGBA"))
+                name = f"{folder}-{os.path.splitext(filename)[0].replace(' ', '_')}.dds"
+                add(name, "dds", "DXT5", (image.shape[1], image.shape[0]),
+                    lambda: dds_codec.encode_dds(image, "DXT5"))
+    return fixtures
+
+
+def measure(func, repeat=3):
+    """
+    Time a callable and record its peak memory.
+
+    The first call runs under tracemalloc (and doubles as a warm-up); the reported time
+    is the median of the following untraced calls. Peak memory is the Python/NumPy heap
+    of this process, so work handed to encoder worker processes is not included.
+
+    Returns:
+        Tuple of (median seconds, peak bytes)
+    """
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    times = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), peak
+
+
+def _check(result, stage):
+    # The converter reports failures by returning None; never time a failure as a fast run
+    if result is None or result == (None, None):
+        raise RuntimeError(f"{stage} failed")
+    return result
+
+
+def run_fixture(fixture, stages=None, repeat=3, work_dir=None, client=None, enhance=True):
+    """
+    Benchmark every stage on one fixture.
+
+    Stages run in pipeline order and feed each other: the PNG and metadata written by
+    dds_to_png / vtf_to_png are the input of png_to_dds / png_to_vtf and enhance_texture.
+
+    Args:
+        fixture: Fixture dictionary from build_fixtures
+        stages: Stage names to time (None times all)
+        repeat: Timed runs per stage
+        work_dir: Folder for intermediate files
+        client: img2img client for enhance_texture (defaults to a StubClient)
+        enhance: Time enhance_texture on this fixture
+
+    Returns:
+        List of result dictionaries (stage, fixture, megapixels, seconds, mp_per_s, peak_mb)
+    """
+    work_dir = work_dir or os.path.join(DEFAULT_FIXTURE_DIR, "work")
+    converter = AssetConverter(temp_dir=os.path.join(work_dir, os.path.splitext(fixture["name"])[0]))
+    client = client or StubClient()
+    path = fixture["path"]
+    megapixels = fixture["width"] * fixture["height"] / 1e6
+    container = fixture["container"]
+    output_path = str(converter._temp_path("repacked." + container))
+
+    if container == "dds":
+        metadata = converter._extract_dds_metadata(path)
+        fourcc = "DX10" if metadata.get("has_dx10_header") else metadata["fourcc"]
+        dxgi_format = metadata.get("dx10_format") if metadata.get("has_dx10_header") else None
+        tasks = {
+            "_extract_dds_metadata": lambda: converter._extract_dds_metadata(path),
+            "create_dds_header": lambda: dds_codec.create_dds_header(
+                metadata["width"], metadata["height"], fourcc, metadata["mipmaps"], dxgi_format),
+            "dds_to_png": lambda: _check(converter.dds_to_png(path), "dds_to_png"),
+            "png_to_dds": lambda: _check(converter.png_to_dds(png_path, meta_path, output_path), "png_to_dds"),
+        }
+    else:
+        tasks = {
+            "_extract_vtf_metadata": lambda: converter._extract_vtf_metadata(path),
+            "vtf_to_png": lambda: _check(converter.vtf_to_png(path), "vtf_to_png"),
+            "png_to_vtf": lambda: _check(converter.png_to_vtf(png_path, meta_path, output_path), "png_to_vtf"),
+        }
+    if enhance:
+        tasks["enhance_texture"] = lambda: _check(enhance_texture(
+            png_path, "benchmark", client=client, output_format=container, metadata_path=meta_path,
+            report_error=lambda message: None, output_dir=str(converter.temp_dir)), "enhance_texture")
+
+    # Every later stage needs the decoded PNG, even when its own timing is not requested
+    png_path, meta_path = _check(converter.convert_to_png(path), "convert_to_png")
+
+    results = []
+    for stage in DDS_STAGES if container == "dds" else VTF_STAGES:
+        if stage not in tasks or (stages and stage not in stages):
+            continue
+        pixels = megapixels
+        if stage in HEADER_STAGES:
+            # Per call, and not pixel work
+            task = tasks[stage]
+            seconds, peak = measure(lambda: [task() for _ in range(HEADER_CALLS)], repeat)
+            seconds, pixels = seconds / HEADER_CALLS, 0.0
+        else:
+            seconds, peak = measure(tasks[stage], repeat)
+        results.append({
+            "stage": stage,
+            "fixture": fixture["name"],
+            "megapixels": round(pixels, 3),
+            "seconds": seconds,
+            "mp_per_s": pixels / seconds if pixels and seconds else None,
+            "peak_mb": peak / (1024 * 1024),
+        })
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Annotate results with their ratio to a baseline run.
+
+    Args:
+        results: Result dictionaries from run_fixture
+        baseline: Baseline dictionary as written by save_baseline
+        threshold: Allowed slowdown (0.25 = 25%)
+
+    Returns:
+        List of regressed results (ratio above 1 + threshold)
+    """
+    reference = baseline.get("results", {})
+    regressions = []
+    for result in results:
+        previous = reference.get(f"{result['stage']}:{result['fixture']}")
+        if not previous or not previous.get("seconds"):
+            result["ratio"] = None
+            continue
+        result["ratio"] = result["seconds"] / previous["seconds"]
+        if result["ratio"] > 1 + threshold:
+            regressions.append(result)
+    return regressions
+
+
+def save_baseline(results, path=DEFAULT_BASELINE):
+    """
+    Store results as the baseline (merged into an existing baseline file).
+    """
+    baseline = {"results": {}}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            baseline = json.load(f)
+    baseline["python"] = platform.python_version()
+    baseline["machine"] = platform.platform()
+    baseline["cpus"] = os.cpu_count()
+    for result in results:
+        baseline["results"][f"{result['stage']}:{result['fixture']}"] = {
+            key: result[key] for key in ("seconds", "mp_per_s", "peak_mb")
+        }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def _format_row(result):
+    rate = f"{result['mp_per_s']:9.1f}" if result["mp_per_s"] else f"{'-':>9}"
+    seconds = result["seconds"]
+    duration = f"{seconds * 1e6:8.1f}us" if seconds < 1e-3 else f"{seconds:9.3f}s"
+    ratio = result.get("ratio")
+    versus = f"{ratio:6.2f}x" if ratio else f"{'-':>7}"
+    return (f"{result['stage']:<22} {result['fixture']:<32} {duration:>10} {rate} "
+            f"{result['peak_mb']:9.1f} {versus}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark conversion, codec and enhancement stages offline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Fixture edge lengths")
+    parser.add_argument("--formats", nargs="+", default=list(DEFAULT_FORMATS), choices=list(DEFAULT_FORMATS))
+    parser.add_argument("--stages", nargs="+", choices=sorted(set(DDS_STAGES + VTF_STAGES)),
+                        help="Only time these stages")
+    parser.add_argument("--no-vtf", action="store_true", help="Skip the VTF fixtures")
+    parser.add_argument("--no-samples", action="store_true", help="Skip the LR/ and uploads/ samples")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (median is reported)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated img2img seconds per request")
+    parser.add_argument("--fixture-dir", default=DEFAULT_FIXTURE_DIR)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown before a stage counts as a regression (0.25 = 25%%)")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    print("🧪 Preparing fixtures...")
+    fixtures = build_fixtures(args.fixture_dir, args.sizes, args.formats, vtf=not args.no_vtf,
+                              samples=not args.no_samples)
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    # Enhancement does not depend on the block format: time it once per size and per sample
+    enhanced_sizes = set()
+    client = StubClient(args.latency)
+    work_dir = os.path.join(args.fixture_dir, "work")
+    results = []
+    regressions = []
+    print(f"{'stage':<22} {'fixture':<32} {'time':>10} {'MP/s':>9} {'peak MB':>9} {'vs base':>7}")
+    for fixture in fixtures:
+        size_key = (fixture["container"], fixture["width"], fixture["height"])
+        enhance = size_key not in enhanced_sizes
+        enhanced_sizes.add(size_key)
+        try:
+            fixture_results = run_fixture(fixture, args.stages, args.repeat, work_dir, client, enhance)
+        except Exception as e:
+            print(f"❌ {fixture['name']}: {str(e)}")
+            continue
+        if baseline is not None:
+            regressions.extend(compare(fixture_results, baseline, args.threshold))
+        for result in fixture_results:
+            print(_format_row(result))
+        results.extend(fixture_results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"✅ Saved {len(results)} results to {args.baseline}")
+        return
+
+    if baseline is not None:
+        if regressions:
+            print(f"❌ {len(regressions)} stages regressed by more than {args.threshold:.0%}:")
+            for result in regressions:
+                print(f"   {result['stage']} on {result['fixture']}: {result['ratio']:.2f}x baseline")
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1982 @@
+"""Block-compressed (DXTn / BCn) texture codecs and DDS container helpers."""
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+
+from mipmaps import generate_mipmaps, mip_count_like
+
+# DDS_PIXELFORMAT flags
+DDPF_ALPHAPIXELS = 0x1
+DDPF_ALPHA = 0x2
+DDPF_FOURCC = 0x4
+DDPF_RGB = 0x40
+DDPF_LUMINANCE = 0x20000
+DDPF_NORMAL = 0x80000000  # NVIDIA tools: tangent-space normal map
+
+# DDS_HEADER flags and caps
+DDSD_CAPS = 0x1
+DDSD_HEIGHT = 0x2
+DDSD_WIDTH = 0x4
+DDSD_PITCH = 0x8
+DDSD_PIXELFORMAT = 0x1000
+DDSD_MIPMAPCOUNT = 0x20000
+DDSD_LINEARSIZE = 0x80000
+DDSCAPS_COMPLEX = 0x8
+DDSCAPS_TEXTURE = 0x1000
+DDSCAPS_MIPMAP = 0x400000
+
+# Blocks decoded per strip (keeps temporaries cache-resident) and decode threads
+_STRIP_BLOCKS = 16384
+_DECODE_THREADS = os.cpu_count() or 1
+
+# Bytes per 4x4 block for each block-compressed format
+BLOCK_SIZES = {
+    'DXT1': 8,
+    'DXT3': 16,
+    'DXT5': 16,
+    'BC4': 8,
+    'BC5': 16,
+    'BC6H': 16,
+    'BC7': 16,
+}
+
+
+def _read_blocks(data, width, height, block_size, offset=0):
+    """
+    View the payload of a block-compressed surface as a (num_blocks, block_size) array.
+
+    Args:
+        data: bytes-like object holding the surface
+        width: Surface width in pixels
+        height: Surface height in pixels
+        block_size: Bytes per 4x4 block
+        offset: Byte offset of the surface inside data
+
+    Returns:
+        Tuple of (blocks array, blocks_x, blocks_y)
+    """
+    blocks_x = max(1, (width + 3) // 4)
+    blocks_y = max(1, (height + 3) // 4)
+    count = blocks_x * blocks_y * block_size
+    buf = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset)
+    return buf.reshape(-1, block_size), blocks_x, blocks_y
+
+
+def _decode_surface(blocks, blocks_x, blocks_y, width, height, decode_rows, channels=4):
+    """
+    Decode a block-compressed surface in cache-sized strips of block rows.
+
+    Each strip is decoded with whole-array NumPy operations and written straight into
+    the output image; strips are spread over a thread pool since NumPy releases the GIL.
+
+    Args:
+        blocks: uint8 array of shape (num_blocks, block_size)
+        blocks_x: Number of blocks per row
+        blocks_y: Number of block rows
+        width: Surface width in pixels
+        height: Surface height in pixels
+        decode_rows: Callable mapping a (N, block_size) slice to (N, 16, channels) pixels
+        channels: Number of output channels
+
+    Returns:
+        uint8 array of shape (height, width, channels)
+    """
+    image = np.empty((blocks_y * 4, blocks_x * 4, channels), dtype=np.uint8)
+    rows_per_strip = max(1, _STRIP_BLOCKS // blocks_x)
+
+    def decode_strip(row):
+        end = min(row + rows_per_strip, blocks_y)
+        pixels = decode_rows(blocks[row * blocks_x:end * blocks_x])
+        pixels = pixels.reshape(end - row, blocks_x, 4, 4, channels).transpose(0, 2, 1, 3, 4)
+        image[row * 4:end * 4] = pixels.reshape((end - row) * 4, blocks_x * 4, channels)
+
+    strips = range(0, blocks_y, rows_per_strip)
+    if len(strips) > 1 and _DECODE_THREADS > 1:
+        with ThreadPoolExecutor(max_workers=_DECODE_THREADS) as pool:
+            list(pool.map(decode_strip, strips))
+    else:
+        for row in strips:
+            decode_strip(row)
+
+    if image.shape[0] != height or image.shape[1] != width:
+        image = np.ascontiguousarray(image[:height, :width])
+    return image
+
+
+def _build_color_tables(bits):
+    """
+    Precompute the per-channel BC1 palettes for every pair of quantized endpoints.
+
+    Args:
+        bits: Channel precision of the endpoints (5 or 6)
+
+    Returns:
+        Tuple of (4-color table, 3-color table), each uint8 of shape (2**bits * 2**bits, 4)
+        indexed by (e0 << bits) | e1
+    """
+    levels = np.arange(1 << bits, dtype=np.int32)
+    expanded = (levels << (8 - bits)) | (levels >> (2 * bits - 8))
+    e0 = np.repeat(expanded, 1 << bits)
+    e1 = np.tile(expanded, 1 << bits)
+    four = np.stack([e0, e1, (2 * e0 + e1) // 3, (e0 + 2 * e1) // 3], axis=1)
+    three = np.stack([e0, e1, (e0 + e1) // 2, np.zeros_like(e0)], axis=1)
+    return four.astype(np.uint8), three.astype(np.uint8)
+
+
+def _build_alpha_table():
+    """
+    Precompute the 8-entry BC3/BC4 palette for every (a0, a1) endpoint pair.
+
+    Returns:
+        uint8 array of shape (65536, 8) indexed by (a0 << 8) | a1
+    """
+    a0 = np.repeat(np.arange(256, dtype=np.int32), 256)[:, None]
+    a1 = np.tile(np.arange(256, dtype=np.int32), 256)[:, None]
+
+    # 8-value mode when a0 > a1, otherwise 6 values plus 0 and 255
+    steps = np.arange(1, 7, dtype=np.int32)[None, :]
+    eight = ((7 - steps) * a0 + steps * a1 + 3) // 7
+    six = ((5 - steps[:, :4]) * a0 + steps[:, :4] * a1 + 2) // 5
+    six = np.concatenate([six, np.zeros_like(a0), np.full_like(a0, 255)], axis=1)
+    return np.concatenate([a0, a1, np.where(a0 > a1, eight, six)], axis=1).astype(np.uint8)
+
+
+_COLOR_TABLES_5 = _build_color_tables(5)
+_COLOR_TABLES_6 = _build_color_tables(6)
+_ALPHA_TABLE = _build_alpha_table().reshape(-1)
+_INDEX_SHIFTS_2BIT = np.arange(0, 32, 2, dtype=np.uint32)
+_INDEX_SHIFTS_3BIT = np.arange(0, 24, 3, dtype=np.uint32)
+
+
+def _decode_color_blocks(blocks, punchthrough):
+    """
+    Decode the 8-byte BC1 color part of a set of blocks.
+
+    Args:
+        blocks: uint8 array of shape (N, 8)
+        punchthrough: Honor the 3-color + transparent mode when color0 <= color1
+            (DXT1 only; DXT3/DXT5 always use the 4-color mode)
+
+    Returns:
+        uint8 array of shape (N, 16, 4) with RGBA pixels in block order
+    """
+    count = len(blocks)
+    endpoints = np.ascontiguousarray(blocks[:, 0:4]).view('<u2')
+    c0 = endpoints[:, 0]
+    c1 = endpoints[:, 1]
+
+    # Look up each channel's 4-entry palette from its pair of quantized endpoints
+    keys = [
+        ((c0 >> 11) << 5) | (c1 >> 11),
+        (((c0 >> 5) & 0x3F) << 6) | ((c1 >> 5) & 0x3F),
+        ((c0 & 0x1F) << 5) | (c1 & 0x1F),
+    ]
+    tables = [_COLOR_TABLES_5, _COLOR_TABLES_6, _COLOR_TABLES_5]
+    palette = np.full((count, 4), 0xFF000000, dtype=np.uint32)
+    if punchthrough:
+        four_color = (c0 > c1)[:, None]
+        for channel, (key, (four, three)) in enumerate(zip(keys, tables)):
+            values = np.where(four_color, four[key], three[key])
+            palette |= values.astype(np.uint32) << np.uint32(8 * channel)
+        palette[:, 3] &= np.where(four_color[:, 0], 0xFFFFFFFF, 0x00FFFFFF).astype(np.uint32)
+    else:
+        for channel, (key, (four, _)) in enumerate(zip(keys, tables)):
+            palette |= four[key].astype(np.uint32) << np.uint32(8 * channel)
+
+    # 2-bit indices, pixel i lives at bits 2i..2i+1; gather all pixels in one flat take
+    bits = np.ascontiguousarray(blocks[:, 4:8]).view('<u4')
+    indices = (bits >> _INDEX_SHIFTS_2BIT) & 3
+    indices += (np.arange(count, dtype=np.uint32) * 4)[:, None]
+    pixels = np.take(palette.reshape(-1), indices)
+    return pixels.view(np.uint8).reshape(count, 16, 4)
+
+
+def _decode_alpha_blocks(blocks):
+    """
+    Decode 8-byte interpolated alpha blocks (DXT5 alpha / BC4 channel).
+
+    Args:
+        blocks: uint8 array of shape (N, 8)
+
+    Returns:
+        uint8 array of shape (N, 16)
+    """
+    count = len(blocks)
+    key = (blocks[:, 0].astype(np.uint32) << 11) | (blocks[:, 1].astype(np.uint32) << 3)
+
+    # 3-bit indices packed into the remaining 48 bits, handled as two 24-bit halves
+    raw = blocks[:, 2:8].astype(np.uint32).reshape(count, 2, 3)
+    halves = raw[:, :, 0] | (raw[:, :, 1] << 8) | (raw[:, :, 2] << 16)
+    indices = ((halves[:, :, None] >> _INDEX_SHIFTS_3BIT) & 7).reshape(count, 16)
+    indices += key[:, None]
+    return np.take(_ALPHA_TABLE, indices)
+
+
+def _decode_bc1_rows(blocks):
+    return _decode_color_blocks(blocks, punchthrough=True)
+
+
+def _decode_bc2_rows(blocks):
+    pixels = _decode_color_blocks(blocks[:, 8:16], punchthrough=False)
+    bits = np.ascontiguousarray(blocks[:, 0:8]).view('<u8')
+    shifts = np.arange(0, 64, 4, dtype=np.uint64)
+    pixels[:, :, 3] = ((bits >> shifts) & np.uint64(0xF)).astype(np.uint8) * 17
+    return pixels
+
+
+def _decode_bc3_rows(blocks):
+    pixels = _decode_color_blocks(blocks[:, 8:16], punchthrough=False)
+    pixels[:, :, 3] = _decode_alpha_blocks(blocks[:, 0:8])
+    return pixels
+
+
+def decode_bc1(data, width, height, offset=0):
+    """
+    Decode a DXT1 (BC1) surface.
+
+    Args:
+        data: bytes-like object holding the compressed surface
+        width: Surface width in pixels
+        height: Surface height in pixels
+        offset: Byte offset of the surface inside data
+
+    Returns:
+        uint8 RGBA array of shape (height, width, 4)
+    """
+    blocks, bx, by = _read_blocks(data, width, height, 8, offset)
+    return _decode_surface(blocks, bx, by, width, height, _decode_bc1_rows)
+
+
+def decode_bc2(data, width, height, offset=0):
+    """
+    Decode a DXT3 (BC2) surface with explicit 4-bit alpha.
+
+    Args:
+        data: bytes-like object holding the compressed surface
+        width: Surface width in pixels
+        height: Surface height in pixels
+        offset: Byte offset of the surface inside data
+
+    Returns:
+        uint8 RGBA array of shape (height, width, 4)
+    """
+    blocks, bx, by = _read_blocks(data, width, height, 16, offset)
+    return _decode_surface(blocks, bx, by, width, height, _decode_bc2_rows)
+
+
+def decode_bc3(data, width, height, offset=0):
+    """
+    Decode a DXT5 (BC3) surface with interpolated alpha.
+
+    Args:
+        data: bytes-like object holding the compressed surface
+        width: Surface width in pixels
+        height: Surface height in pixels
+        offset: Byte offset of the surface inside data
+
+    Returns:
+        uint8 RGBA array of shape (height, width, 4)
+    """
+    blocks, bx, by = _read_blocks(data, width, height, 16, offset)
+    return _decode_surface(blocks, bx, by, width, height, _decode_bc3_rows)
+
+
+def _mask_channel(values, mask):
+    """
+    Extract a channel described by a DDS bit mask and scale it to 8 bits.
+    """
+    if mask == 0:
+        return None
+    shift = (mask & -mask).bit_length() - 1
+    max_value = mask >> shift
+    channel = (values & mask) >> shift
+    if max_value == 255:
+        return channel.astype(np.uint8)
+    return ((channel * 255 + max_value // 2) // max_value).astype(np.uint8)
+
+
+def decode_uncompressed(data, width, height, metadata, offset=0):
+    """
+    Decode an uncompressed DDS surface described by its pixel format bit masks.
+
+    Args:
+        data: bytes-like object holding the surface
+        width: Surface width in pixels
+        height: Surface height in pixels
+        metadata: Metadata dictionary from parse_dds_header
+        offset: Byte offset of the surface inside data
+
+    Returns:
+        uint8 RGBA array of shape (height, width, 4)
+    """
+    bit_count = metadata.get("rgb_bit_count", 32)
+    bytes_per_pixel = bit_count // 8
+    if bytes_per_pixel not in (1, 2, 3, 4):
+        raise ValueError(f"Unsupported uncompressed bit count: {bit_count}")
+
+    raw = np.frombuffer(data, dtype=np.uint8, count=width * height * bytes_per_pixel, offset=offset)
+    raw = raw.reshape(-1, bytes_per_pixel).astype(np.uint32)
+    values = np.zeros(len(raw), dtype=np.uint32)
+    for i in range(bytes_per_pixel):
+        values |= raw[:, i] << np.uint32(8 * i)
+
+    # Masks wider than the pixel are written by some tools; clip them to the pixel size
+    pixel_mask = (1 << bit_count) - 1
+    pf_flags = metadata.get("pf_flags", DDPF_RGB)
+    r_mask = metadata.get("r_mask", 0) & pixel_mask
+    g_mask = metadata.get("g_mask", 0) & pixel_mask
+    b_mask = metadata.get("b_mask", 0) & pixel_mask
+    a_mask = metadata.get("a_mask", 0) & pixel_mask if pf_flags & (DDPF_ALPHAPIXELS | DDPF_ALPHA) else 0
+
+    image = np.empty((width * height, 4), dtype=np.uint8)
+    if pf_flags & DDPF_LUMINANCE:
+        lum = _mask_channel(values, r_mask or 0xFF)
+        image[:, 0] = lum
+        image[:, 1] = lum
+        image[:, 2] = lum
+    elif pf_flags & DDPF_ALPHA and not pf_flags & DDPF_RGB:
+        image[:, :3] = 0
+    else:
+        for channel, mask in enumerate((r_mask, g_mask, b_mask)):
+            decoded = _mask_channel(values, mask)
+            image[:, channel] = 0 if decoded is None else decoded
+    alpha = _mask_channel(values, a_mask)
+    image[:, 3] = 255 if alpha is None else alpha
+    return image.reshape(height, width, 4)
+
+
+def _to_rgba(image):
+    """
+    Normalize an image array to uint8 RGBA.
+    """
+    image = np.asarray(image)
+    if image.dtype != np.uint8:
+        image = np.clip(image, 0, 255).astype(np.uint8)
+    if image.ndim == 2:
+        image = image[:, :, None]
+    channels = image.shape[2]
+    if channels == 4:
+        return image
+    if channels == 3:
+        alpha = np.full(image.shape[:2] + (1,), 255, dtype=np.uint8)
+        return np.concatenate([image, alpha], axis=2)
+    if channels == 2:
+        return np.concatenate([np.repeat(image[:, :, :1], 3, axis=2), image[:, :, 1:2]], axis=2)
+    alpha = np.full(image.shape[:2] + (1,), 255, dtype=np.uint8)
+    return np.concatenate([np.repeat(image, 3, axis=2), alpha], axis=2)
+
+
+def encode_uncompressed(image, metadata):
+    """
+    Pack an image into an uncompressed surface described by pixel format bit masks.
+
+    Args:
+        image: uint8 array of shape (height, width[, channels])
+        metadata: Dictionary with rgb_bit_count, r/g/b/a_mask and pf_flags
+
+    Returns:
+        bytes with the packed surface
+    """
+    rgba = _to_rgba(image).reshape(-1, 4).astype(np.uint32)
+    bit_count = metadata.get("rgb_bit_count", 32)
+    pf_flags = metadata.get("pf_flags", DDPF_RGB)
+
+    if pf_flags & DDPF_LUMINANCE:
+        # Rec. 601 luma
+        lum = (rgba[:, 0] * 299 + rgba[:, 1] * 587 + rgba[:, 2] * 114 + 500) // 1000
+        channels = [(lum, metadata.get("r_mask", 0) or 0xFF)]
+    else:
+        channels = [(rgba[:, i], metadata.get(key, 0)) for i, key in enumerate(("r_mask", "g_mask", "b_mask"))]
+    if pf_flags & (DDPF_ALPHAPIXELS | DDPF_ALPHA):
+        channels.append((rgba[:, 3], metadata.get("a_mask", 0)))
+
+    values = np.zeros(len(rgba), dtype=np.uint32)
+    for channel, mask in channels:
+        if mask == 0:
+            continue
+        shift = (mask & -mask).bit_length() - 1
+        max_value = mask >> shift
+        values |= ((channel * max_value + 127) // 255) << np.uint32(shift)
+
+    bytes_per_pixel = bit_count // 8
+    return values.astype("<u4").view(np.uint8).reshape(-1, 4)[:, :bytes_per_pixel].tobytes()
+
+
+def _to_blocks(image):
+    """
+    Split an image into 4x4 blocks, replicating edge pixels to fill partial blocks.
+
+    Args:
+        image: uint8 array of shape (height, width, channels)
+
+    Returns:
+        Tuple of (pixels of shape (num_blocks, 16, channels), blocks_x, blocks_y)
+    """
+    height, width, channels = image.shape
+    blocks_x = max(1, (width + 3) // 4)
+    blocks_y = max(1, (height + 3) // 4)
+    pad_y = blocks_y * 4 - height
+    pad_x = blocks_x * 4 - width
+    if pad_x or pad_y:
+        image = np.pad(image, ((0, pad_y), (0, pad_x), (0, 0)), mode='edge')
+    blocks = image.reshape(blocks_y, 4, blocks_x, 4, channels).transpose(0, 2, 1, 3, 4)
+    return blocks.reshape(-1, 16, channels), blocks_x, blocks_y
+
+
+def _block_reduce(values, ufunc):
+    """
+    Reduce over the 16 pixels of each block (axis 1) by pairwise folding.
+
+    Much faster than ufunc.reduce(axis=1) for the short, strided pixel axis.
+    """
+    while values.shape[1] > 1:
+        half = values.shape[1] // 2
+        values = ufunc(values[:, :half], values[:, half:])
+    return values[:, 0]
+
+
+def _quantize_565(colors):
+    """
+    Quantize float RGB endpoints (N, 3) to packed RGB565 values.
+    """
+    colors = np.clip(colors, 0, 255)
+    r = np.rint(colors[:, 0] * (31 / 255)).astype(np.uint16)
+    g = np.rint(colors[:, 1] * (63 / 255)).astype(np.uint16)
+    b = np.rint(colors[:, 2] * (31 / 255)).astype(np.uint16)
+    return (r << 11) | (g << 5) | b
+
+
+def _expand_565(colors):
+    """
+    Expand packed RGB565 values (N,) to float32 RGB (N, 3) exactly as the decoder does.
+    """
+    colors = colors.astype(np.int32)
+    r = (colors >> 11) & 0x1F
+    g = (colors >> 5) & 0x3F
+    b = colors & 0x1F
+    rgb = np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)], axis=-1)
+    return rgb.astype(np.float32)
+
+
+def _principal_endpoints(colors, mask):
+    """
+    Fit endpoints along the principal axis of each block's colors.
+
+    Args:
+        colors: float32 array of shape (N, 16, 3)
+        mask: float32 array of shape (N, 16), 1 for pixels that take part in the fit
+
+    Returns:
+        Tuple of (max endpoint, min endpoint), each of shape (N, 3)
+    """
+    counts = np.maximum(mask.sum(axis=1, keepdims=True), 1)
+    mean = (colors * mask[:, :, None]).sum(axis=1) / counts
+    centered = (colors - mean[:, None, :]) * mask[:, :, None]
+    cov = np.einsum('nki,nkj->nij', centered, centered)
+
+    # Power iteration, seeded with the bounding box diagonal
+    axis = _block_reduce(colors, np.maximum) - _block_reduce(colors, np.minimum) + 1e-3
+    for _ in range(8):
+        axis = np.einsum('nij,nj->ni', cov, axis)
+        axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-12)
+
+    projection = np.einsum('nki,ni->nk', colors - mean[:, None, :], axis)
+    lo = _block_reduce(np.where(mask > 0, projection, np.inf), np.minimum)
+    hi = _block_reduce(np.where(mask > 0, projection, -np.inf), np.maximum)
+    lo = np.where(np.isfinite(lo), lo, 0)
+    hi = np.where(np.isfinite(hi), hi, 0)
+    return mean + axis * hi[:, None], mean + axis * lo[:, None]
+
+
+def _refine_endpoints(colors, mask, weights, start, end):
+    """
+    Least-squares endpoint refit for fixed palette indices.
+
+    Each pixel is modelled as w * start + (1 - w) * end, where w is the weight of the
+    palette entry it was assigned to.
+
+    Args:
+        colors: float32 array of shape (N, 16, C)
+        mask: float32 array of shape (N, 16), 1 for pixels that take part in the fit
+        weights: float32 array of shape (N, 16) with the weight of the first endpoint
+        start: Current first endpoints (N, C), kept where the system is singular
+        end: Current second endpoints (N, C), kept where the system is singular
+
+    Returns:
+        Tuple of refined (start, end) endpoints
+    """
+    w = weights * mask
+    v = (1 - weights) * mask
+    ww = (w * w).sum(axis=1)
+    wv = (w * v).sum(axis=1)
+    vv = (v * v).sum(axis=1)
+    wx = np.einsum('nk,nki->ni', w, colors)
+    vx = np.einsum('nk,nki->ni', v, colors)
+    det = ww * vv - wv * wv
+    ok = np.abs(det) > 1e-6
+    safe = np.where(ok, det, 1)[:, None]
+    new_start = (vv[:, None] * wx - wv[:, None] * vx) / safe
+    new_end = (ww[:, None] * vx - wv[:, None] * wx) / safe
+    return np.where(ok[:, None], new_start, start), np.where(ok[:, None], new_end, end)
+
+
+# Weight of color0 for each BC1 index in 4-color and 3-color mode
+_BC1_WEIGHTS_4 = np.array([1, 0, 2 / 3, 1 / 3], dtype=np.float32)
+_BC1_WEIGHTS_3 = np.array([1, 0, 1 / 2, 0], dtype=np.float32)
+
+
+def _select_color_indices(colors, c0, c1, three_color, transparent):
+    """
+    Pick the closest palette entry for every pixel given quantized endpoints.
+
+    Returns:
+        int array of shape (N, 16) with BC1 indices
+    """
+    rgb0 = _expand_565(c0)
+    rgb1 = _expand_565(c1)
+    mode = three_color[:, None]
+    palette = np.stack([
+        rgb0,
+        rgb1,
+        np.where(mode, (rgb0 + rgb1) / 2, (2 * rgb0 + rgb1) / 3),
+        np.where(mode, np.inf, (rgb0 + 2 * rgb1) / 3),
+    ], axis=1)
+    diff = colors[:, :, None, :] - palette[:, None, :, :]
+    distances = np.einsum('nkpc,nkpc->nkp', diff, diff)
+    distances = np.where(np.isnan(distances), np.inf, distances)
+    indices = distances.argmin(axis=2)
+    indices[transparent] = 3
+    return indices
+
+
+# Map a rounded position along the c1 -> c0 segment to the BC1 index of that entry
+_BC1_ORDER_4 = np.array([1, 3, 2, 0])
+_BC1_ORDER_3 = np.array([1, 2, 0])
+
+
+def _project_color_indices(colors, c0, c1, three_color, transparent):
+    """
+    Pick BC1 indices by projecting each pixel onto the endpoint segment.
+
+    Cheaper than the exhaustive palette search and exact for colors on the segment.
+
+    Returns:
+        int array of shape (N, 16) with BC1 indices
+    """
+    rgb0 = _expand_565(c0)
+    rgb1 = _expand_565(c1)
+    axis = rgb0 - rgb1
+    length = np.maximum((axis * axis).sum(axis=1), 1e-6)
+    t = np.einsum('nkc,nc->nk', colors - rgb1[:, None, :], axis) / length[:, None]
+    steps = np.where(three_color, 2, 3)[:, None]
+    position = np.clip(np.rint(t * steps), 0, steps).astype(np.intp)
+    indices = np.where(three_color[:, None], _BC1_ORDER_3[np.minimum(position, 2)], _BC1_ORDER_4[position])
+    indices[transparent] = 3
+    return indices
+
+
+def _encode_color_blocks(pixels, quality, punchthrough):
+    """
+    Encode the BC1 color part for a set of 4x4 blocks.
+
+    Args:
+        pixels: uint8 array of shape (N, 16, 4)
+        quality: 'fast' for bounding-box endpoints, 'high' for principal-axis
+            endpoints refined by least squares
+        punchthrough: Use DXT1 3-color mode with transparent index for blocks
+            that contain pixels with alpha below 128
+
+    Returns:
+        uint8 array of shape (N, 8)
+    """
+    count = len(pixels)
+    colors = pixels[:, :, :3].astype(np.float32)
+    if punchthrough:
+        transparent = pixels[:, :, 3] < 128
+    else:
+        transparent = np.zeros(pixels.shape[:2], dtype=bool)
+    three_color = transparent.any(axis=1)
+    mask = (~transparent).astype(np.float32)
+
+    if quality == 'high':
+        start, end = _principal_endpoints(colors, mask)
+    else:
+        # Bounding box of the opaque pixels, inset by 1/16 of its extent
+        rgb = pixels[:, :, :3]
+        hi = _block_reduce(rgb, np.maximum).astype(np.float32)
+        lo = _block_reduce(rgb, np.minimum).astype(np.float32)
+        if three_color.any():
+            opaque = ~transparent[three_color][:, :, None]
+            hi[three_color] = _block_reduce(np.where(opaque, rgb[three_color], 0), np.maximum)
+            lo[three_color] = _block_reduce(np.where(opaque, rgb[three_color], 255), np.minimum)
+        inset = (hi - lo) / 16
+        start, end = hi - inset, lo + inset
+
+    iterations = 2 if quality == 'high' else 0
+    for iteration in range(iterations + 1):
+        c0 = _quantize_565(start)
+        c1 = _quantize_565(end)
+
+        # 4-color mode needs c0 > c1, 3-color mode needs c0 <= c1
+        swap = np.where(three_color, c0 > c1, c0 < c1)
+        c0, c1 = np.where(swap, c1, c0), np.where(swap, c0, c1)
+        start, end = np.where(swap[:, None], end, start), np.where(swap[:, None], start, end)
+
+        if quality == 'high':
+            indices = _select_color_indices(colors, c0, c1, three_color, transparent)
+        else:
+            indices = _project_color_indices(colors, c0, c1, three_color, transparent)
+        if iteration == iterations:
+            break
+        weights = np.where(three_color[:, None], _BC1_WEIGHTS_3[indices], _BC1_WEIGHTS_4[indices])
+        start, end = _refine_endpoints(colors, mask, weights, start, end)
+
+    # Equal endpoints decode as 3-color mode; index 0 is always safe for opaque pixels
+    equal = (c0 == c1)[:, None] & ~transparent
+    indices = np.where(equal, 0, indices)
+
+    out = np.empty((count, 8), dtype=np.uint8)
+    out[:, 0:4] = np.stack([c0, c1], axis=1).astype('<u2').view(np.uint8)
+    packed = (indices.astype(np.uint32) << np.arange(0, 32, 2, dtype=np.uint32)).sum(axis=1, dtype=np.uint32)
+    out[:, 4:8] = packed.astype('<u4').view(np.uint8).reshape(count, 4)
+    return out
+
+
+def _pack_alpha_blocks(a0, a1, indices):
+    """
+    Pack alpha endpoints and 3-bit indices into 8-byte blocks.
+    """
+    count = len(indices)
+    out = np.empty((count, 8), dtype=np.uint8)
+    out[:, 0] = a0
+    out[:, 1] = a1
+    halves = (indices.reshape(count, 2, 8).astype(np.uint32) << _INDEX_SHIFTS_3BIT).sum(axis=2, dtype=np.uint32)
+    out[:, 2:8] = halves.astype('<u4').view(np.uint8).reshape(count, 2, 4)[:, :, :3].reshape(count, 6)
+    return out
+
+
+def _fit_alpha_indices(values, a0, a1):
+    """
+    Choose the closest palette entry for every value given alpha endpoints.
+
+    Returns:
+        Tuple of (indices of shape (N, 16), squared error per block)
+    """
+    key = (a0.astype(np.int32) << 8) | a1.astype(np.int32)
+    palette = _ALPHA_TABLE.reshape(65536, 8)[key].astype(np.int32)
+    diff = values[:, :, None] - palette[:, None, :]
+    distances = diff * diff
+    indices = distances.argmin(axis=2)
+    error = np.take_along_axis(distances, indices[:, :, None], axis=2).sum(axis=(1, 2))
+    return indices, error
+
+
+# Map a step between a1 (0) and a0 (7) to its index in the 8-value alpha palette
+_BC3_ALPHA_ORDER = np.array([1, 7, 6, 5, 4, 3, 2, 0])
+
+
+def _encode_alpha_blocks(values, quality):
+    """
+    Encode interpolated alpha blocks (DXT5 alpha / BC4 channel).
+
+    Args:
+        values: uint8 array of shape (N, 16)
+        quality: 'fast' uses the 8-value mode spanning min..max; 'high' also tries
+            the 6-value mode with explicit 0 and 255 and keeps the better fit
+
+    Returns:
+        uint8 array of shape (N, 8)
+    """
+    hi = _block_reduce(values, np.maximum).astype(np.int32)
+    lo = _block_reduce(values, np.minimum).astype(np.int32)
+    values = values.astype(np.int32)
+    a0, a1 = hi, lo
+
+    if quality != 'high':
+        # Round each value to one of the 8 evenly spaced steps between lo and hi
+        span = np.maximum(hi - lo, 1)[:, None]
+        position = ((values - lo[:, None]) * 14 + span) // (2 * span)
+        return _pack_alpha_blocks(a0, a1, _BC3_ALPHA_ORDER[position])
+
+    indices, error = _fit_alpha_indices(values, hi, lo)
+
+    # 6-value mode (a0 <= a1) spends two entries on exact 0 and 255
+    inner = (values > 0) & (values < 255)
+    inner_lo = np.where(inner, values, 255).min(axis=1)
+    inner_hi = np.where(inner, values, 0).max(axis=1)
+    inner_lo, inner_hi = np.minimum(inner_lo, inner_hi), np.maximum(inner_lo, inner_hi)
+    six_indices, six_error = _fit_alpha_indices(values, inner_lo, inner_hi)
+    better = six_error < error
+    a0 = np.where(better, inner_lo, a0)
+    a1 = np.where(better, inner_hi, a1)
+    indices = np.where(better[:, None], six_indices, indices)
+
+    return _pack_alpha_blocks(a0, a1, indices)
+
+
+def _encode_bc1_rows(pixels, quality):
+    return _encode_color_blocks(pixels, quality, punchthrough=True)
+
+
+def _encode_bc2_rows(pixels, quality):
+    count = len(pixels)
+    out = np.empty((count, 16), dtype=np.uint8)
+    alpha = (pixels[:, :, 3].astype(np.uint32) * 15 + 127) // 255
+    packed = (alpha.astype(np.uint64) << np.arange(0, 64, 4, dtype=np.uint64)).sum(axis=1, dtype=np.uint64)
+    out[:, 0:8] = packed.astype('<u8').view(np.uint8).reshape(count, 8)
+    out[:, 8:16] = _encode_color_blocks(pixels, quality, punchthrough=False)
+    return out
+
+
+def _encode_bc3_rows(pixels, quality):
+    count = len(pixels)
+    out = np.empty((count, 16), dtype=np.uint8)
+    out[:, 0:8] = _encode_alpha_blocks(pixels[:, :, 3], quality)
+    out[:, 8:16] = _encode_color_blocks(pixels, quality, punchthrough=False)
+    return out
+
+
+# Process pool shared by all encode calls, created on first use
+_ENCODE_POOL = None
+_ENCODE_POOL_WORKERS = 0
+
+# Surfaces with fewer blocks than this are encoded in-process
+_PARALLEL_MIN_BLOCKS = 256 * 256
+
+
+def _get_encode_pool(workers):
+    """
+    Return the shared process pool, recreating it if the worker count changed.
+    """
+    global _ENCODE_POOL, _ENCODE_POOL_WORKERS
+    if _ENCODE_POOL is None or _ENCODE_POOL_WORKERS != workers:
+        if _ENCODE_POOL is not None:
+            _ENCODE_POOL.shutdown(wait=False)
+        _ENCODE_POOL = ProcessPoolExecutor(max_workers=workers)
+        _ENCODE_POOL_WORKERS = workers
+    return _ENCODE_POOL
+
+
+def _encode_strip(encode_rows, pixels, quality):
+    """
+    Encode a strip of blocks in cache-sized chunks.
+    """
+    chunks = [encode_rows(pixels[i:i + _STRIP_BLOCKS], quality)
+              for i in range(0, len(pixels), _STRIP_BLOCKS)]
+    return np.concatenate(chunks).tobytes()
+
+
+def _encode_surface(image, encode_rows, quality, workers):
+    """
+    Block-compress a whole surface, splitting large ones across worker processes.
+
+    Args:
+        image: uint8 RGBA array of shape (height, width, 4)
+        encode_rows: Callable mapping (N, 16, 4) pixels and a quality to (N, block_size) blocks
+        quality: 'fast' or 'high'
+        workers: Number of worker processes (None uses all cores, 1 disables the pool)
+
+    Returns:
+        bytes with the compressed surface
+    """
+    if quality not in ('fast', 'high'):
+        raise ValueError(f"Unknown quality: {quality}")
+    pixels, _, _ = _to_blocks(_to_rgba(image))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(pixels) < _PARALLEL_MIN_BLOCKS:
+        return _encode_strip(encode_rows, pixels, quality)
+
+    # Blocks are stored row-major, so contiguous slices map straight to output order
+    strip = -(-len(pixels) // (workers * 4))
+    pool = _get_encode_pool(workers)
+    futures = [pool.submit(_encode_strip, encode_rows, pixels[i:i + strip], quality)
+               for i in range(0, len(pixels), strip)]
+    return b"".join(future.result() for future in futures)
+
+
+def encode_bc1(image, quality='fast', workers=None):
+    """
+    Compress an image to DXT1 (BC1); pixels with alpha below 128 become transparent.
+
+    Args:
+        image: uint8 array of shape (height, width[, channels])
+        quality: 'fast' or 'high'
+        workers: Number of worker processes (None uses all cores)
+
+    Returns:
+        bytes with the compressed surface
+    """
+    return _encode_surface(image, _encode_bc1_rows, quality, workers)
+
+
+def encode_bc2(image, quality='fast', workers=None):
+    """
+    Compress an image to DXT3 (BC2) with explicit 4-bit alpha.
+
+    Args:
+        image: uint8 array of shape (height, width[, channels])
+        quality: 'fast' or 'high'
+        workers: Number of worker processes (None uses all cores)
+
+    Returns:
+        bytes with the compressed surface
+    """
+    return _encode_surface(image, _encode_bc2_rows, quality, workers)
+
+
+def encode_bc3(image, quality='fast', workers=None):
+    """
+    Compress an image to DXT5 (BC3) with interpolated alpha.
+
+    Args:
+        image: uint8 array of shape (height, width[, channels])
+        quality: 'fast' or 'high'
+        workers: Number of worker processes (None uses all cores)
+
+    Returns:
+        bytes with the compressed surface
+    """
+    return _encode_surface(image, _encode_bc3_rows, quality, workers)
+
+
+# Per-mode layout: subsets, partition bits, rotation bits, index-selection bit,
+# color bits, alpha bits, per-endpoint p-bits, shared p-bits, index bits, alpha index bits
+_BC7_MODES = [
+    (3, 4, 0, 0, 4, 0, 1, 0, 3, 0),
+    (2, 6, 0, 0, 6, 0, 0, 1, 3, 0),
+    (3, 6, 0, 0, 5, 0, 0, 0, 2, 0),
+    (2, 6, 0, 0, 7, 0, 1, 0, 2, 0),
+    (1, 0, 2, 1, 5, 6, 0, 0, 2, 3),
+    (1, 0, 2, 0, 7, 8, 0, 0, 2, 2),
+    (1, 0, 0, 0, 7, 7, 1, 0, 4, 0),
+    (2, 6, 0, 0, 5, 5, 1, 0, 2, 0),
+]
+
+# Two-subset partitions, bit i is the subset of pixel i
+_BC7_PARTITIONS_2 = np.array([
+    0xcccc, 0x8888, 0xeeee, 0xecc8, 0xc880, 0xfeec, 0xfec8, 0xec80, 0xc800, 0xffec,
+    0xfe80, 0xe800, 0xffe8, 0xff00, 0xfff0, 0xf000, 0xf710, 0x008e, 0x7100, 0x08ce,
+    0x008c, 0x7310, 0x3100, 0x8cce, 0x088c, 0x3110, 0x6666, 0x366c, 0x17e8, 0x0ff0,
+    0x718e, 0x399c, 0xaaaa, 0xf0f0, 0x5a5a, 0x33cc, 0x3c3c, 0x55aa, 0x9696, 0xa55a,
+    0x73ce, 0x13c8, 0x324c, 0x3bdc, 0x6996, 0xc33c, 0x9966, 0x0660, 0x0272, 0x04e4,
+    0x4e40, 0x2720, 0xc936, 0x936c, 0x39c6, 0x639c, 0x9336, 0x9cc6, 0x817e, 0xe718,
+    0xccf0, 0x0fcc, 0x7744, 0xee22,
+], dtype=np.uint32)
+
+# Three-subset partitions, bits 2i..2i+1 are the subset of pixel i
+_BC7_PARTITIONS_3 = np.array([
+    0xaa685050, 0x6a5a5040, 0x5a5a4200, 0x5450a0a8, 0xa5a50000, 0xa0a05050, 0x5555a0a0,
+    0x5a5a5050, 0xaa550000, 0xaa555500, 0xaaaa5500, 0x90909090, 0x94949494, 0xa4a4a4a4,
+    0xa9a59450, 0x2a0a4250, 0xa5945040, 0x0a425054, 0xa5a5a500, 0x55a0a0a0, 0xa8a85454,
+    0x6a6a4040, 0xa4a45000, 0x1a1a0500, 0x0050a4a4, 0xaaa59090, 0x14696914, 0x69691400,
+    0xa08585a0, 0xaa821414, 0x50a4a450, 0x6a5a0200, 0xa9a58000, 0x5090a0a8, 0xa8a09050,
+    0x24242424, 0x00aa5500, 0x24924924, 0x24499224, 0x50a50a50, 0x500aa550, 0xaaaa4444,
+    0x66660000, 0xa5a0a5a0, 0x50a050a0, 0x69286928, 0x44aaaa44, 0x66666600, 0xaa444444,
+    0x54a854a8, 0x95809580, 0x96969600, 0xa85454a8, 0x80959580, 0xaa141414, 0x96960000,
+    0xaaaa1414, 0xa05050a0, 0xa0a5a5a0, 0x96000000, 0x40804080, 0xa9a8a9a8, 0xaaaaaa44,
+    0x2a4a5254,
+], dtype=np.uint32)
+
+# Anchor pixel of the second subset (two-subset modes)
+_BC7_ANCHORS_2 = np.array([
+    15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15,
+    15, 2, 8, 2, 2, 8, 8, 15, 2, 8, 2, 2, 8, 8, 2, 2,
+    15, 15, 6, 8, 2, 8, 15, 15, 2, 8, 2, 2, 2, 15, 15, 6,
+    6, 2, 6, 8, 15, 15, 2, 2, 15, 15, 15, 15, 15, 2, 2, 15,
+])
+
+# Anchor pixels of the second and third subsets (three-subset modes)
+_BC7_ANCHORS_3A = np.array([
+    3, 3, 15, 15, 8, 3, 15, 15, 8, 8, 6, 6, 6, 5, 3, 3,
+    3, 3, 8, 15, 3, 3, 6, 10, 5, 8, 8, 6, 8, 5, 15, 15,
+    8, 15, 3, 5, 6, 10, 8, 15, 15, 3, 15, 5, 15, 15, 15, 15,
+    3, 15, 5, 5, 5, 8, 5, 10, 5, 10, 8, 13, 15, 12, 3, 3,
+])
+_BC7_ANCHORS_3B = np.array([
+    15, 8, 8, 3, 15, 15, 3, 8, 15, 15, 15, 15, 15, 15, 15, 8,
+    15, 8, 15, 3, 15, 8, 15, 8, 3, 15, 6, 10, 15, 15, 10, 8,
+    15, 3, 15, 10, 10, 8, 9, 10, 6, 15, 8, 15, 3, 6, 6, 8,
+    15, 3, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 3, 15, 15, 8,
+])
+
+# Interpolation weights (out of 64) by index precision
+_BC7_WEIGHTS = {
+    2: np.array([0, 21, 43, 64], dtype=np.int32),
+    3: np.array([0, 9, 18, 27, 37, 46, 55, 64], dtype=np.int32),
+    4: np.array([0, 4, 9, 13, 17, 21, 26, 30, 34, 38, 43, 47, 51, 55, 60, 64], dtype=np.int32),
+}
+
+_BC7_PIXELS = np.arange(16)
+
+
+def _bc7_subsets(num_subsets, partition):
+    """
+    Subset of every pixel for each block.
+
+    Args:
+        num_subsets: 1, 2 or 3
+        partition: int array of shape (N,)
+
+    Returns:
+        int array of shape (N, 16)
+    """
+    if num_subsets == 1:
+        return np.zeros((len(partition), 16), dtype=np.intp)
+    if num_subsets == 2:
+        return ((_BC7_PARTITIONS_2[partition][:, None] >> _BC7_PIXELS.astype(np.uint32)) & 1).astype(np.intp)
+    return ((_BC7_PARTITIONS_3[partition][:, None] >> (2 * _BC7_PIXELS).astype(np.uint32)) & 3).astype(np.intp)
+
+
+def _bc7_anchor_mask(num_subsets, partition):
+    """
+    Boolean (N, 16) mask of anchor pixels, whose index drops its top bit.
+    """
+    mask = np.zeros((len(partition), 16), dtype=bool)
+    mask[:, 0] = True
+    rows = np.arange(len(partition))
+    if num_subsets == 2:
+        mask[rows, _BC7_ANCHORS_2[partition]] = True
+    elif num_subsets == 3:
+        mask[rows, _BC7_ANCHORS_3A[partition]] = True
+        mask[rows, _BC7_ANCHORS_3B[partition]] = True
+    return mask
+
+
+def _get_bits(lo, hi, position, count):
+    """
+    Read count bits starting at position from 128-bit blocks split in two uint64 halves.
+
+    Args:
+        lo: uint64 array with bits 0-63
+        hi: uint64 array with bits 64-127 (same shape as lo)
+        position: Bit offset, scalar or array broadcastable against lo
+        count: Number of bits to read (at most 8)
+
+    Returns:
+        int64 array
+    """
+    position = np.asarray(position, dtype=np.int64)
+    mask = np.uint64((1 << count) - 1)
+    low_shift = np.minimum(position, 63).astype(np.uint64)
+    from_lo = np.where(position < 64, lo >> low_shift, 0)
+    carry_shift = np.clip(64 - position, 1, 63).astype(np.uint64)
+    from_carry = np.where((position < 64) & (position + count > 64), hi << carry_shift, 0)
+    high_shift = np.clip(position - 64, 0, 63).astype(np.uint64)
+    from_hi = np.where(position >= 64, hi >> high_shift, 0)
+    return ((from_lo | from_carry | from_hi) & mask).astype(np.int64)
+
+
+def _decode_bc7_mode(lo, hi, mode):
+    """
+    Decode all blocks of a single BC7 mode.
+
+    Args:
+        lo: uint64 array of shape (N, 1) with bits 0-63
+        hi: uint64 array of shape (N, 1) with bits 64-127
+        mode: Mode number (0-7)
+
+    Returns:
+        uint8 array of shape (N, 16, 4)
+    """
+    subsets, pb, rb, isb, cb, ab, epb, spb, ib, ib2 = _BC7_MODES[mode]
+    count = len(lo)
+    bit = mode + 1
+
+    partition = _get_bits(lo, hi, bit, pb)[:, 0] if pb else np.zeros(count, dtype=np.int64)
+    bit += pb
+    rotation = _get_bits(lo, hi, bit, rb)[:, 0] if rb else np.zeros(count, dtype=np.int64)
+    bit += rb
+    index_sel = _get_bits(lo, hi, bit, isb)[:, 0] if isb else np.zeros(count, dtype=np.int64)
+    bit += isb
+
+    # Endpoints are stored channel-major: R0 R1 .. G0 G1 .. B0 B1 .. A0 A1 ..
+    num_endpoints = subsets * 2
+    endpoints = np.empty((count, num_endpoints, 4), dtype=np.int64)
+    for channel in range(3):
+        positions = bit + cb * np.arange(num_endpoints)
+        endpoints[:, :, channel] = _get_bits(lo, hi, positions[None, :], cb)
+        bit += cb * num_endpoints
+    if ab:
+        positions = bit + ab * np.arange(num_endpoints)
+        endpoints[:, :, 3] = _get_bits(lo, hi, positions[None, :], ab)
+        bit += ab * num_endpoints
+    else:
+        endpoints[:, :, 3] = 255
+
+    # Append p-bits and expand to 8 bits
+    color_bits, alpha_bits = cb, ab
+    if epb or spb:
+        if epb:
+            pbits = _get_bits(lo, hi, (bit + np.arange(num_endpoints))[None, :], 1)
+            bit += num_endpoints
+        else:
+            pbits = np.repeat(_get_bits(lo, hi, (bit + np.arange(subsets))[None, :], 1), 2, axis=1)
+            bit += subsets
+        endpoints[:, :, :3] = (endpoints[:, :, :3] << 1) | pbits[:, :, None]
+        color_bits += 1
+        if ab:
+            endpoints[:, :, 3] = (endpoints[:, :, 3] << 1) | pbits
+            alpha_bits += 1
+    endpoints[:, :, :3] <<= 8 - color_bits
+    endpoints[:, :, :3] |= endpoints[:, :, :3] >> color_bits
+    if ab:
+        endpoints[:, :, 3] <<= 8 - alpha_bits
+        endpoints[:, :, 3] |= endpoints[:, :, 3] >> alpha_bits
+
+    # Index widths shrink by one bit at anchor pixels, so positions depend on the partition
+    anchors = _bc7_anchor_mask(subsets, partition)
+    widths = ib - anchors.astype(np.int64)
+    positions = bit + np.cumsum(widths, axis=1) - widths
+    color_index = _get_bits(lo, hi, positions, ib)
+    color_index &= (1 << widths) - 1
+    bit += 16 * ib - subsets
+
+    color_weights = _BC7_WEIGHTS[ib][color_index]
+    if ib2:
+        widths2 = np.full(16, ib2, dtype=np.int64)
+        widths2[0] -= 1
+        positions2 = bit + np.cumsum(widths2) - widths2
+        alpha_index = _get_bits(lo, hi, positions2[None, :], ib2) & ((1 << widths2) - 1)
+        alpha_weights = _BC7_WEIGHTS[ib2][alpha_index]
+        swap = index_sel[:, None] == 1
+        color_weights, alpha_weights = (np.where(swap, alpha_weights, color_weights),
+                                        np.where(swap, color_weights, alpha_weights))
+    else:
+        alpha_weights = color_weights
+
+    subset = _bc7_subsets(subsets, partition)
+    e0 = np.take_along_axis(endpoints, (subset * 2)[:, :, None], axis=1)
+    e1 = np.take_along_axis(endpoints, (subset * 2 + 1)[:, :, None], axis=1)
+    weights = np.concatenate([np.repeat(color_weights[:, :, None], 3, axis=2), alpha_weights[:, :, None]], axis=2)
+    pixels = ((64 - weights) * e0 + weights * e1 + 32) >> 6
+
+    # Rotation swaps alpha with one of the color channels
+    for channel in range(3):
+        rotate = rotation == channel + 1
+        if rotate.any():
+            pixels[rotate, :, channel], pixels[rotate, :, 3] = pixels[rotate, :, 3], pixels[rotate, :, channel].copy()
+    return pixels.astype(np.uint8)
+
+
+def _decode_bc7_blocks(blocks):
+    """
+    Decode BC7 blocks.
+
+    Args:
+        blocks: uint8 array of shape (N, 16)
+
+    Returns:
+        uint8 array of shape (N, 16, 4); reserved mode-8 blocks decode to zero
+    """
+    blocks = np.ascontiguousarray(blocks)
+    halves = blocks.view('<u8')
+    first = blocks[:, 0]
+    # The mode is the position of the lowest set bit of the first byte
+    modes = np.full(len(blocks), 8, dtype=np.int64)
+    for mode in range(7, -1, -1):
+        modes[(first >> mode) & 1 == 1] = mode
+
+    pixels = np.zeros((len(blocks), 16, 4), dtype=np.uint8)
+    for mode in range(8):
+        selected = np.nonzero(modes == mode)[0]
+        if len(selected):
+            pixels[selected] = _decode_bc7_mode(halves[selected, 0:1], halves[selected, 1:2], mode)
+    return pixels
+
+
+def _put_bits(lo, hi, values, position, count):
+    """
+    Write count-bit values at a fixed position into 128-bit blocks (in place).
+    """
+    values = values.astype(np.uint64) & np.uint64((1 << count) - 1)
+    if position < 64:
+        lo |= values << np.uint64(position)
+        if position + count > 64:
+            hi |= values >> np.uint64(64 - position)
+    else:
+        hi |= values << np.uint64(position - 64)
+
+
+def _quantize_bc7_endpoint(values):
+    """
+    Quantize float RGBA endpoints to 7 bits plus a shared p-bit (mode 6).
+
+    Args:
+        values: float32 array of shape (N, 4)
+
+    Returns:
+        Tuple of (7-bit values (N, 4), p-bit (N,), reconstructed 8-bit values (N, 4))
+    """
+    values = np.clip(values, 0, 255)
+    best = None
+    for pbit in (0, 1):
+        quantized = np.clip(np.rint((values - pbit) / 2), 0, 127)
+        decoded = quantized * 2 + pbit
+        error = ((decoded - values) ** 2).sum(axis=1)
+        if best is None:
+            best = [quantized, np.full(len(values), pbit), decoded, error]
+        else:
+            better = error < best[3]
+            best[0] = np.where(better[:, None], quantized, best[0])
+            best[1] = np.where(better, pbit, best[1])
+            best[2] = np.where(better[:, None], decoded, best[2])
+            best[3] = np.where(better, error, best[3])
+    return best[0].astype(np.int64), best[1].astype(np.int64), best[2]
+
+
+def _fit_bc7_mode6(pixels, quality):
+    """
+    Choose mode 6 endpoints for each block.
+
+    Returns:
+        Tuple of (start, end) float32 endpoints of shape (N, 4)
+    """
+    colors = pixels.astype(np.float32)
+    if quality != 'high':
+        # Bounding box, inset by 1/32 of its extent
+        hi = _block_reduce(colors, np.maximum)
+        lo = _block_reduce(colors, np.minimum)
+        inset = (hi - lo) / 32
+        return lo + inset, hi - inset
+
+    # Principal axis of the RGBA cloud
+    mean = colors.mean(axis=1)
+    centered = colors - mean[:, None, :]
+    cov = np.einsum('nki,nkj->nij', centered, centered)
+    axis = _block_reduce(colors, np.maximum) - _block_reduce(colors, np.minimum) + 1e-3
+    for _ in range(8):
+        axis = np.einsum('nij,nj->ni', cov, axis)
+        axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-12)
+    projection = np.einsum('nki,ni->nk', centered, axis)
+    start = mean + axis * _block_reduce(projection, np.minimum)[:, None]
+    end = mean + axis * _block_reduce(projection, np.maximum)[:, None]
+    return start, end
+
+
+def _select_bc7_mode6_indices(colors, e0, e1, exhaustive):
+    """
+    Pick 4-bit indices for mode 6 given reconstructed 8-bit endpoints.
+    """
+    weights = _BC7_WEIGHTS[4].astype(np.float32) / 64
+    if exhaustive:
+        palette = e0[:, None, :] + weights[None, :, None] * (e1 - e0)[:, None, :]
+        diff = colors[:, :, None, :] - palette[:, None, :, :]
+        return np.einsum('nkpc,nkpc->nkp', diff, diff).argmin(axis=2)
+    axis = e1 - e0
+    length = np.maximum((axis * axis).sum(axis=1), 1e-6)
+    t = np.einsum('nkc,nc->nk', colors - e0[:, None, :], axis) / length[:, None]
+    midpoints = (weights[1:] + weights[:-1]) / 2
+    return np.searchsorted(midpoints, np.clip(t, 0, 1))
+
+
+def _encode_bc7_blocks(pixels, quality='fast'):
+    """
+    Encode RGBA blocks as BC7 mode 6 (single subset, 7.7.7.7 endpoints with p-bits,
+    4-bit indices).
+
+    Args:
+        pixels: uint8 array of shape (N, 16, 4)
+        quality: 'fast' uses inset bounding-box endpoints and projected indices;
+            'high' uses principal-axis endpoints, an exhaustive index search and a
+            least-squares endpoint refit
+
+    Returns:
+        uint8 array of shape (N, 16)
+    """
+    count = len(pixels)
+    colors = pixels.astype(np.float32)
+    start, end = _fit_bc7_mode6(pixels, quality)
+    exhaustive = quality == 'high'
+
+    passes = 2 if exhaustive else 1
+    for iteration in range(passes):
+        q0, p0, e0 = _quantize_bc7_endpoint(start)
+        q1, p1, e1 = _quantize_bc7_endpoint(end)
+        indices = _select_bc7_mode6_indices(colors, e0, e1, exhaustive)
+        if iteration == passes - 1:
+            break
+        # Least-squares refit of both endpoints for the chosen indices
+        w = (_BC7_WEIGHTS[4].astype(np.float32) / 64)[indices]
+        v = 1 - w
+        ww = (v * v).sum(axis=1)
+        wv = (v * w).sum(axis=1)
+        vv = (w * w).sum(axis=1)
+        vx = np.einsum('nk,nki->ni', v, colors)
+        wx = np.einsum('nk,nki->ni', w, colors)
+        det = ww * vv - wv * wv
+        ok = (np.abs(det) > 1e-6)[:, None]
+        safe = np.where(ok[:, 0], det, 1)[:, None]
+        start = np.where(ok, (vv[:, None] * vx - wv[:, None] * wx) / safe, start)
+        end = np.where(ok, (ww[:, None] * wx - wv[:, None] * vx) / safe, end)
+
+    # The anchor (pixel 0) index must have its top bit clear; swap endpoints if needed
+    flip = indices[:, 0] >= 8
+    q0, q1 = np.where(flip[:, None], q1, q0), np.where(flip[:, None], q0, q1)
+    p0, p1 = np.where(flip, p1, p0), np.where(flip, p0, p1)
+    indices = np.where(flip[:, None], 15 - indices, indices)
+
+    lo = np.zeros(count, dtype=np.uint64)
+    hi = np.zeros(count, dtype=np.uint64)
+    _put_bits(lo, hi, np.full(count, 1 << 6), 0, 7)
+    bit = 7
+    for channel in range(4):
+        _put_bits(lo, hi, q0[:, channel], bit, 7)
+        _put_bits(lo, hi, q1[:, channel], bit + 7, 7)
+        bit += 14
+    _put_bits(lo, hi, p0, bit, 1)
+    _put_bits(lo, hi, p1, bit + 1, 1)
+    bit += 2
+    _put_bits(lo, hi, indices[:, 0], bit, 3)
+    bit += 3
+    for pixel in range(1, 16):
+        _put_bits(lo, hi, indices[:, pixel], bit, 4)
+        bit += 4
+
+    out = np.empty((count, 2), dtype='<u8')
+    out[:, 0] = lo
+    out[:, 1] = hi
+    return out.view(np.uint8).reshape(count, 16)
+
+
+def _decode_bc4_rows(blocks):
+    values = _decode_alpha_blocks(blocks)
+    pixels = np.empty(values.shape + (4,), dtype=np.uint8)
+    pixels[:, :, 0] = values
+    pixels[:, :, 1] = values
+    pixels[:, :, 2] = values
+    pixels[:, :, 3] = 255
+    return pixels
+
+
+def _decode_bc5_rows(blocks):
+    red = _decode_alpha_blocks(blocks[:, 0:8])
+    green = _decode_alpha_blocks(blocks[:, 8:16])
+    # Two-channel normal maps: rebuild Z so the PNG previews as a regular normal map
+    x = red.astype(np.float32) / 127.5 - 1
+    y = green.astype(np.float32) / 127.5 - 1
+    z = np.sqrt(np.maximum(1 - x * x - y * y, 0))
+    pixels = np.empty(red.shape + (4,), dtype=np.uint8)
+    pixels[:, :, 0] = red
+    pixels[:, :, 1] = green
+    pixels[:, :, 2] = np.rint((z + 1) * 127.5).astype(np.uint8)
+    pixels[:, :, 3] = 255
+    return pixels
+
+
+def _decode_bc7_rows(blocks):
+    return _decode_bc7_blocks(blocks)
+
+
+def decode_bc4(data, width, height, offset=0):
+    """
+    Decode a single-channel BC4 (ATI1) surface; the channel is replicated to gray.
+
+    Args:
+        data: bytes-like object holding the compressed surface
+        width: Surface width in pixels
+        height: Surface height in pixels
+        offset: Byte offset of the surface inside data
+
+    Returns:
+        uint8 RGBA array of shape (height, width, 4)
+    """
+    blocks, bx, by = _read_blocks(data, width, height, 8, offset)
+    return _decode_surface(blocks, bx, by, width, height, _decode_bc4_rows)
+
+
+def decode_bc5(data, width, height, offset=0):
+    """
+    Decode a two-channel BC5 (ATI2) surface; blue holds the reconstructed normal Z.
+
+    Args:
+        data: bytes-like object holding the compressed surface
+        width: Surface width in pixels
+        height: Surface height in pixels
+        offset: Byte offset of the surface inside data
+
+    Returns:
+        uint8 RGBA array of shape (height, width, 4)
+    """
+    blocks, bx, by = _read_blocks(data, width, height, 16, offset)
+    return _decode_surface(blocks, bx, by, width, height, _decode_bc5_rows)
+
+
+def decode_bc7(data, width, height, offset=0):
+    """
+    Decode a BC7 surface (all eight block modes).
+
+    Args:
+        data: bytes-like object holding the compressed surface
+        width: Surface width in pixels
+        height: Surface height in pixels
+        offset: Byte offset of the surface inside data
+
+    Returns:
+        uint8 RGBA array of shape (height, width, 4)
+    """
+    blocks, bx, by = _read_blocks(data, width, height, 16, offset)
+    return _decode_surface(blocks, bx, by, width, height, _decode_bc7_rows)
+
+
+def _encode_bc4_rows(pixels, quality):
+    return _encode_alpha_blocks(pixels[:, :, 0], quality)
+
+
+def _encode_bc5_rows(pixels, quality):
+    count = len(pixels)
+    out = np.empty((count, 16), dtype=np.uint8)
+    out[:, 0:8] = _encode_alpha_blocks(pixels[:, :, 0], quality)
+    out[:, 8:16] = _encode_alpha_blocks(pixels[:, :, 1], quality)
+    return out
+
+
+def encode_bc4(image, quality='fast', workers=None):
+    """
+    Compress the red channel of an image to BC4 (ATI1).
+
+    Args:
+        image: uint8 array of shape (height, width[, channels])
+        quality: 'fast' or 'high'
+        workers: Number of worker processes (None uses all cores)
+
+    Returns:
+        bytes with the compressed surface
+    """
+    return _encode_surface(image, _encode_bc4_rows, quality, workers)
+
+
+def encode_bc5(image, quality='fast', workers=None):
+    """
+    Compress the red and green channels of an image to BC5 (ATI2).
+
+    Args:
+        image: uint8 array of shape (height, width[, channels])
+        quality: 'fast' or 'high'
+        workers: Number of worker processes (None uses all cores)
+
+    Returns:
+        bytes with the compressed surface
+    """
+    return _encode_surface(image, _encode_bc5_rows, quality, workers)
+
+
+def encode_bc7(image, quality='fast', workers=None):
+    """
+    Compress an image to BC7 using mode 6 blocks.
+
+    Args:
+        image: uint8 array of shape (height, width[, channels])
+        quality: 'fast' or 'high'
+        workers: Number of worker processes (None uses all cores)
+
+    Returns:
+        bytes with the compressed surface
+    """
+    return _encode_surface(image, _encode_bc7_blocks, quality, workers)
+
+
+# Decoders and encoders for each block-compressed format name
+FORMAT_DECODERS = {
+    'DXT1': decode_bc1,
+    'DXT3': decode_bc2,
+    'DXT5': decode_bc3,
+    'BC4': decode_bc4,
+    'BC5': decode_bc5,
+    'BC7': decode_bc7,
+}
+FORMAT_ENCODERS = {
+    'DXT1': encode_bc1,
+    'DXT3': encode_bc2,
+    'DXT5': encode_bc3,
+    'BC4': encode_bc4,
+    'BC5': encode_bc5,
+    'BC7': encode_bc7,
+}
+
+# Legacy FourCC codes and the format they store
+FOURCC_FORMATS = {
+    'DXT1': 'DXT1',
+    'DXT2': 'DXT3',
+    'DXT3': 'DXT3',
+    'DXT4': 'DXT5',
+    'DXT5': 'DXT5',
+    'ATI1': 'BC4',
+    'BC4U': 'BC4',
+    'ATI2': 'BC5',
+    'BC5U': 'BC5',
+}
+
+# FourCC written for each format when no DX10 header is needed
+FORMAT_FOURCCS = {
+    'DXT1': 'DXT1',
+    'DXT3': 'DXT3',
+    'DXT5': 'DXT5',
+    'BC4': 'ATI1',
+    'BC5': 'ATI2',
+}
+
+
+# DXGI_FORMAT values used in the DX10 header extension
+DXGI_FORMATS = {
+    0: 'UNKNOWN',
+    1: 'R32G32B32A32_TYPELESS', 2: 'R32G32B32A32_FLOAT', 3: 'R32G32B32A32_UINT', 4: 'R32G32B32A32_SINT',
+    5: 'R32G32B32_TYPELESS', 6: 'R32G32B32_FLOAT', 7: 'R32G32B32_UINT', 8: 'R32G32B32_SINT',
+    9: 'R16G16B16A16_TYPELESS', 10: 'R16G16B16A16_FLOAT', 11: 'R16G16B16A16_UNORM',
+    12: 'R16G16B16A16_UINT', 13: 'R16G16B16A16_SNORM', 14: 'R16G16B16A16_SINT',
+    15: 'R32G32_TYPELESS', 16: 'R32G32_FLOAT', 17: 'R32G32_UINT', 18: 'R32G32_SINT',
+    19: 'R32G8X24_TYPELESS', 20: 'D32_FLOAT_S8X24_UINT', 21: 'R32_FLOAT_X8X24_TYPELESS',
+    22: 'X32_TYPELESS_G8X24_UINT',
+    23: 'R10G10B10A2_TYPELESS', 24: 'R10G10B10A2_UNORM', 25: 'R10G10B10A2_UINT', 26: 'R11G11B10_FLOAT',
+    27: 'R8G8B8A8_TYPELESS', 28: 'R8G8B8A8_UNORM', 29: 'R8G8B8A8_UNORM_SRGB', 30: 'R8G8B8A8_UINT',
+    31: 'R8G8B8A8_SNORM', 32: 'R8G8B8A8_SINT',
+    33: 'R16G16_TYPELESS', 34: 'R16G16_FLOAT', 35: 'R16G16_UNORM', 36: 'R16G16_UINT',
+    37: 'R16G16_SNORM', 38: 'R16G16_SINT',
+    39: 'R32_TYPELESS', 40: 'D32_FLOAT', 41: 'R32_FLOAT', 42: 'R32_UINT', 43: 'R32_SINT',
+    44: 'R24G8_TYPELESS', 45: 'D24_UNORM_S8_UINT', 46: 'R24_UNORM_X8_TYPELESS', 47: 'X24_TYPELESS_G8_UINT',
+    48: 'R8G8_TYPELESS', 49: 'R8G8_UNORM', 50: 'R8G8_UINT', 51: 'R8G8_SNORM', 52: 'R8G8_SINT',
+    53: 'R16_TYPELESS', 54: 'R16_FLOAT', 55: 'D16_UNORM', 56: 'R16_UNORM', 57: 'R16_UINT',
+    58: 'R16_SNORM', 59: 'R16_SINT',
+    60: 'R8_TYPELESS', 61: 'R8_UNORM', 62: 'R8_UINT', 63: 'R8_SNORM', 64: 'R8_SINT', 65: 'A8_UNORM',
+    66: 'R1_UNORM', 67: 'R9G9B9E5_SHAREDEXP', 68: 'R8G8_B8G8_UNORM', 69: 'G8R8_G8B8_UNORM',
+    70: 'BC1_TYPELESS', 71: 'BC1_UNORM', 72: 'BC1_UNORM_SRGB',
+    73: 'BC2_TYPELESS', 74: 'BC2_UNORM', 75: 'BC2_UNORM_SRGB',
+    76: 'BC3_TYPELESS', 77: 'BC3_UNORM', 78: 'BC3_UNORM_SRGB',
+    79: 'BC4_TYPELESS', 80: 'BC4_UNORM', 81: 'BC4_SNORM',
+    82: 'BC5_TYPELESS', 83: 'BC5_UNORM', 84: 'BC5_SNORM',
+    85: 'B5G6R5_UNORM', 86: 'B5G5R5A1_UNORM', 87: 'B8G8R8A8_UNORM', 88: 'B8G8R8X8_UNORM',
+    89: 'R10G10B10_XR_BIAS_A2_UNORM', 90: 'B8G8R8A8_TYPELESS', 91: 'B8G8R8A8_UNORM_SRGB',
+    92: 'B8G8R8X8_TYPELESS', 93: 'B8G8R8X8_UNORM_SRGB',
+    94: 'BC6H_TYPELESS', 95: 'BC6H_UF16', 96: 'BC6H_SF16',
+    97: 'BC7_TYPELESS', 98: 'BC7_UNORM', 99: 'BC7_UNORM_SRGB',
+    100: 'AYUV', 101: 'Y410', 102: 'Y416', 103: 'NV12', 104: 'P010', 105: 'P016', 106: '420_OPAQUE',
+    107: 'YUY2', 108: 'Y210', 109: 'Y216', 110: 'NV11', 111: 'AI44', 112: 'IA44', 113: 'P8',
+    114: 'A8P8', 115: 'B4G4R4A4_UNORM',
+}
+
+# Block-compressed format name for each DXGI block format family
+DXGI_BLOCK_FORMATS = {
+    'BC1': 'DXT1',
+    'BC2': 'DXT3',
+    'BC3': 'DXT5',
+    'BC4': 'BC4',
+    'BC5': 'BC5',
+    'BC6H': 'BC6H',
+    'BC7': 'BC7',
+}
+
+# DXGI format written for each block-compressed format name
+FORMAT_DXGI = {
+    'DXT1': 71,
+    'DXT3': 74,
+    'DXT5': 77,
+    'BC4': 80,
+    'BC5': 83,
+    'BC7': 98,
+}
+
+# Bit layout (bit count, R, G, B, A masks, pixel format flags) of uncompressed DXGI formats
+DXGI_UNCOMPRESSED = {
+    28: (32, 0x000000FF, 0x0000FF00, 0x00FF0000, 0xFF000000, DDPF_RGB | DDPF_ALPHAPIXELS),
+    29: (32, 0x000000FF, 0x0000FF00, 0x00FF0000, 0xFF000000, DDPF_RGB | DDPF_ALPHAPIXELS),
+    87: (32, 0x00FF0000, 0x0000FF00, 0x000000FF, 0xFF000000, DDPF_RGB | DDPF_ALPHAPIXELS),
+    88: (32, 0x00FF0000, 0x0000FF00, 0x000000FF, 0, DDPF_RGB),
+    91: (32, 0x00FF0000, 0x0000FF00, 0x000000FF, 0xFF000000, DDPF_RGB | DDPF_ALPHAPIXELS),
+    93: (32, 0x00FF0000, 0x0000FF00, 0x000000FF, 0, DDPF_RGB),
+    85: (16, 0xF800, 0x07E0, 0x001F, 0, DDPF_RGB),
+    86: (16, 0x7C00, 0x03E0, 0x001F, 0x8000, DDPF_RGB | DDPF_ALPHAPIXELS),
+    115: (16, 0x0F00, 0x00F0, 0x000F, 0xF000, DDPF_RGB | DDPF_ALPHAPIXELS),
+    49: (16, 0x00FF, 0xFF00, 0, 0, DDPF_RGB),
+    61: (8, 0xFF, 0, 0, 0, DDPF_LUMINANCE),
+    65: (8, 0, 0, 0, 0xFF, DDPF_ALPHA),
+}
+
+# DX10 resource dimensions and misc flags
+DDS_DIMENSION_TEXTURE2D = 3
+DDS_RESOURCE_MISC_TEXTURECUBE = 0x4
+DDSCAPS2_CUBEMAP = 0x200
+DDSCAPS2_CUBEMAP_ALLFACES = 0xFC00
+
+
+def parse_dds_header(header):
+    """
+    Parse the 128-byte DDS header (plus DX10 extension if present).
+
+    Args:
+        header: bytes-like object starting with the 'DDS ' magic
+
+    Returns:
+        Dictionary containing metadata
+    """
+    header = bytes(header[:148])
+    if header[0:4] != b'DDS ':
+        raise ValueError("Invalid DDS magic number")
+
+    metadata = {}
+    metadata["magic"] = "DDS "
+
+    # Extract dimensions
+    metadata["height"] = int.from_bytes(header[12:16], 'little')
+    metadata["width"] = int.from_bytes(header[16:20], 'little')
+    metadata["pitch_or_linear_size"] = int.from_bytes(header[20:24], 'little')
+    metadata["depth"] = int.from_bytes(header[24:28], 'little')
+    metadata["mipmaps"] = max(1, int.from_bytes(header[28:32], 'little'))
+
+    # Extract pixel format information
+    pf_flags, = struct.unpack_from("<I", header, 80)
+    rgb_bit_count, r_mask, g_mask, b_mask, a_mask = struct.unpack_from("<5I", header, 88)
+    metadata["pf_flags"] = pf_flags
+
+    fourcc = header[84:88]
+    fourcc_str = fourcc.decode("ascii", errors="ignore").rstrip("\x00")
+    metadata["fourcc"] = fourcc_str
+
+    # Map FourCC to format name
+    if pf_flags & DDPF_FOURCC:
+        metadata["format"] = FOURCC_FORMATS.get(fourcc_str, 'DXT5')
+    else:
+        metadata["format"] = "RGBA"
+        metadata["rgb_bit_count"] = rgb_bit_count
+        metadata["r_mask"] = r_mask
+        metadata["g_mask"] = g_mask
+        metadata["b_mask"] = b_mask
+        metadata["a_mask"] = a_mask
+
+    # Cube maps store one surface chain per face
+    caps2, = struct.unpack_from("<I", header, 112)
+    metadata["caps2"] = caps2
+    faces = bin(caps2 & DDSCAPS2_CUBEMAP_ALLFACES).count("1") if caps2 & DDSCAPS2_CUBEMAP else 1
+    metadata["faces"] = faces
+    metadata["array_size"] = 1
+
+    # Check for DX10 extended header
+    if fourcc_str == "DX10":
+        if len(header) < 148:
+            raise ValueError("Truncated DX10 header")
+        dx10_header = header[128:148]
+        dxgi_format, dimension, misc_flag, array_size, misc_flags2 = struct.unpack("<5I", dx10_header)
+        metadata["has_dx10_header"] = True
+        metadata["dx10_format"] = dxgi_format
+        metadata["dxgi_format_name"] = DXGI_FORMATS.get(dxgi_format, "UNKNOWN")
+        metadata["resource_dimension"] = dimension
+        metadata["misc_flag"] = misc_flag
+        metadata["alpha_mode"] = misc_flags2 & 0x7
+        metadata["srgb"] = metadata["dxgi_format_name"].endswith("_SRGB")
+        metadata["array_size"] = max(1, array_size)
+        metadata["faces"] = 6 if misc_flag & DDS_RESOURCE_MISC_TEXTURECUBE else 1
+
+        family = metadata["dxgi_format_name"].split("_")[0]
+        if family in DXGI_BLOCK_FORMATS:
+            metadata["format"] = DXGI_BLOCK_FORMATS[family]
+        elif dxgi_format in DXGI_UNCOMPRESSED:
+            metadata["format"] = "RGBA"
+        else:
+            metadata["format"] = metadata["dxgi_format_name"]
+    else:
+        metadata["has_dx10_header"] = False
+
+    metadata["elements"] = metadata["array_size"] * metadata["faces"]
+    return metadata
+
+
+def _uncompressed_layout(metadata):
+    """
+    Bit layout of an uncompressed surface, from the DXGI format or the legacy pixel format.
+    """
+    if metadata.get("has_dx10_header"):
+        layout = DXGI_UNCOMPRESSED.get(metadata.get("dx10_format"))
+        if layout is None:
+            raise NotImplementedError(f"Unsupported DXGI format: {metadata.get('dxgi_format_name')}")
+        return dict(zip(("rgb_bit_count", "r_mask", "g_mask", "b_mask", "a_mask", "pf_flags"), layout))
+    return metadata
+
+
+def _level_size(width, height, metadata):
+    """
+    Size in bytes of one surface of the given dimensions in the file's format.
+    """
+    if metadata["format"] in BLOCK_SIZES:
+        return surface_size(width, height, metadata["format"])
+    bit_count = _uncompressed_layout(metadata).get("rgb_bit_count", 32)
+    return width * height * bit_count // 8
+
+
+def dds_element_offset(metadata, element=0):
+    """
+    Byte offset of the top mip level of an array element or cube face.
+
+    Elements are stored one after another, each followed by its full mip chain.
+
+    Args:
+        metadata: Metadata dictionary from parse_dds_header
+        element: Index of the array element / cube face
+
+    Returns:
+        Byte offset from the start of the file
+    """
+    offset = 148 if metadata.get("has_dx10_header") else 128
+    if element:
+        width, height = metadata["width"], metadata["height"]
+        chain = sum(_level_size(max(1, width >> level), max(1, height >> level), metadata)
+                    for level in range(metadata.get("mipmaps", 1)))
+        offset += element * chain
+    return offset
+
+
+def decode_dds(data, metadata=None, element=0):
+    """
+    Decode the top mip level of a DDS file held in memory.
+
+    Args:
+        data: bytes-like object with the complete DDS file
+        metadata: Metadata from parse_dds_header (parsed from data if omitted)
+        element: Array element / cube face to decode
+
+    Returns:
+        uint8 RGBA array of shape (height, width, 4)
+    """
+    if metadata is None:
+        metadata = parse_dds_header(data)
+    width = metadata["width"]
+    height = metadata["height"]
+    offset = dds_element_offset(metadata, element)
+
+    if metadata["format"] == "RGBA":
+        return decode_uncompressed(data, width, height, _uncompressed_layout(metadata), offset)
+
+    decoder = FORMAT_DECODERS.get(metadata["format"])
+    signed = metadata.get("dxgi_format_name", "").endswith("_SNORM")
+    if decoder is None or signed or (not metadata.get("has_dx10_header")
+                                     and metadata["fourcc"] not in FOURCC_FORMATS):
+        raise NotImplementedError(f"Unsupported DDS format: {metadata.get('dxgi_format_name', metadata['fourcc'])}")
+    return decoder(data, width, height, offset)
+
+
+def decode_dds_array(data, metadata=None):
+    """
+    Decode the top mip level of every array element / cube face.
+
+    Args:
+        data: bytes-like object with the complete DDS file
+        metadata: Metadata from parse_dds_header (parsed from data if omitted)
+
+    Returns:
+        uint8 RGBA array of shape (elements, height, width, 4)
+    """
+    if metadata is None:
+        metadata = parse_dds_header(data)
+    return np.stack([decode_dds(data, metadata, element) for element in range(metadata.get("elements", 1))])
+
+
+def surface_size(width, height, format_name):
+    """
+    Size in bytes of one block-compressed surface.
+
+    Args:
+        width: Surface width in pixels
+        height: Surface height in pixels
+        format_name: Block-compressed format name or FourCC (e.g. 'DXT1', 'BC7')
+
+    Returns:
+        Number of bytes
+    """
+    block_size = BLOCK_SIZES[FOURCC_FORMATS.get(format_name, format_name)]
+    return max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * block_size
+
+
+def create_dds_header(width, height, fourcc, mipmaps=1, dxgi_format=None, array_size=1, cubemap=False):
+    """
+    Build a DDS header for a block-compressed texture.
+
+    Args:
+        width: Texture width in pixels
+        height: Texture height in pixels
+        fourcc: Block-compressed FourCC (e.g. 'DXT1'), or 'DX10' to append the DX10 extension
+        mipmaps: Number of mip levels stored after the header
+        dxgi_format: DXGI format for the DX10 extension
+        array_size: Number of array elements (cube maps count whole cubes)
+        cubemap: Whether the elements are cube faces
+
+    Returns:
+        bytes with the 128-byte header, or 148 bytes with the DX10 extension
+    """
+    if fourcc == 'DX10':
+        family = DXGI_FORMATS.get(dxgi_format, "UNKNOWN").split("_")[0]
+        format_name = DXGI_BLOCK_FORMATS.get(family)
+    else:
+        format_name = FOURCC_FORMATS.get(fourcc)
+    if format_name not in BLOCK_SIZES:
+        raise NotImplementedError(f"Unsupported DDS format: {fourcc}")
+
+    dwFlags = DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT | DDSD_LINEARSIZE
+    dwCaps = DDSCAPS_TEXTURE
+    dwCaps2 = 0
+    if mipmaps > 1:
+        dwFlags |= DDSD_MIPMAPCOUNT
+        dwCaps |= DDSCAPS_COMPLEX | DDSCAPS_MIPMAP
+    if cubemap:
+        dwCaps |= DDSCAPS_COMPLEX
+        dwCaps2 = DDSCAPS2_CUBEMAP | DDSCAPS2_CUBEMAP_ALLFACES
+    dwPitchOrLinearSize = surface_size(width, height, format_name)
+
+    header = b"DDS "
+    header += struct.pack("<I", 124)  # dwSize
+    header += struct.pack("<I", dwFlags)
+    header += struct.pack("<I", height)
+    header += struct.pack("<I", width)
+    header += struct.pack("<I", dwPitchOrLinearSize)
+    header += struct.pack("<I", 0)  # dwDepth
+    header += struct.pack("<I", mipmaps if mipmaps > 1 else 0)
+    header += b"\x00" * 44  # Reserved1
+
+    # DDS_PIXELFORMAT (32 bytes)
+    header += struct.pack("<I", 32)  # pfSize
+    header += struct.pack("<I", DDPF_FOURCC)
+    header += fourcc.encode('ascii').ljust(4, b'\x00')
+    header += b"\x00" * 20  # RGBBitCount and channel masks are unused for FourCC formats
+
+    # Caps
+    header += struct.pack("<I", dwCaps)
+    header += struct.pack("<I", dwCaps2)
+    header += b"\x00" * 12  # Caps3, Caps4, Reserved2
+
+    # DDS_HEADER_DXT10 (20 bytes)
+    if fourcc == 'DX10':
+        misc_flag = DDS_RESOURCE_MISC_TEXTURECUBE if cubemap else 0
+        header += struct.pack("<5I", dxgi_format, DDS_DIMENSION_TEXTURE2D, misc_flag, array_size, 0)
+
+    return header
+
+
+def encode_dds(image, fourcc='DXT5', quality='fast', workers=None, dxgi_format=None, cubemap=False,
+               mipmaps=None, mip_filter='box'):
+    """
+    Encode an image (or a stack of array elements / cube faces) as a DDS file.
+
+    Every mip level is block-compressed in the target format.
+
+    Args:
+        image: uint8 array of shape (height, width[, channels]), or
+            (elements, height, width, channels) for texture arrays and cube maps
+        fourcc: Target FourCC ('DXT1', 'ATI2', ...), format name ('BC7', ...) or
+            'DX10' together with dxgi_format
+        quality: 'fast' or 'high'
+        workers: Number of worker processes (None uses all cores)
+        dxgi_format: DXGI format; forces a DX10 header
+        cubemap: Whether the elements are cube faces (groups of six)
+        mipmaps: Number of mip levels (None builds the full chain)
+        mip_filter: Mip filter ('box' or 'kaiser')
+
+    Returns:
+        bytes with the DDS file
+    """
+    if fourcc == 'DX10' or dxgi_format is not None:
+        if dxgi_format is None:
+            raise ValueError("dxgi_format is required for DX10 output")
+        family = DXGI_FORMATS.get(dxgi_format, "UNKNOWN").split("_")[0]
+        format_name = DXGI_BLOCK_FORMATS.get(family)
+        fourcc = 'DX10'
+    else:
+        format_name = FOURCC_FORMATS.get(fourcc, fourcc)
+        if format_name in FORMAT_FOURCCS and fourcc not in FOURCC_FORMATS:
+            fourcc = FORMAT_FOURCCS[format_name]
+        elif format_name in FORMAT_DXGI and fourcc not in FOURCC_FORMATS:
+            # Formats without a legacy FourCC (BC7) need the DX10 extension
+            dxgi_format = FORMAT_DXGI[format_name]
+            fourcc = 'DX10'
+    encoder = FORMAT_ENCODERS.get(format_name)
+    if encoder is None:
+        raise NotImplementedError(f"Unsupported DDS format: {fourcc}")
+
+    image = np.asarray(image)
+    if image.ndim == 2:
+        image = image[:, :, None]
+    elements = image if image.ndim == 4 else image[None]
+    height, width = elements.shape[1:3]
+    count = len(elements)
+    if fourcc == 'DX10':
+        array_size = count // 6 if cubemap else count
+    else:
+        array_size = 1
+        if count > 1 and not cubemap:
+            raise ValueError("Texture arrays require a DX10 header")
+
+    # BC4/BC5 hold data (masks, normal maps) and are filtered as stored; colors in linear light
+    levels = generate_mipmaps(elements, mipmaps, mip_filter, srgb=format_name not in ("BC4", "BC5"))
+
+    header = create_dds_header(width, height, fourcc, mipmaps=len(levels), dxgi_format=dxgi_format,
+                               array_size=array_size, cubemap=cubemap)
+
+    # Each element is followed by its own mip chain
+    return header + b"".join(
+        encoder(level[element], quality, workers)
+        for element in range(count)
+        for level in levels
+    )
+
+
+def encode_dds_like(image, metadata, quality='fast', workers=None, mip_filter='box'):
+    """
+    Encode an image as a DDS file in the same format as the source texture.
+
+    The DX10 DXGI format (including sRGB variants) or the legacy FourCC is reused; a
+    vertical strip of elements (as written by dds_to_png) is split back into a
+    texture array or cube map. The source's mip count is honored (a full chain is
+    rebuilt at the new size when the source had one).
+
+    Args:
+        image: uint8 array of shape (height, width[, channels])
+        metadata: Metadata dictionary from parse_dds_header (may be partial)
+        quality: 'fast' or 'high'
+        workers: Number of worker processes (None uses all cores)
+        mip_filter: Mip filter ('box' or 'kaiser')
+
+    Returns:
+        bytes with the DDS file
+    """
+    image = np.asarray(image)
+    elements = metadata.get("elements", 1)
+    if elements > 1 and image.shape[0] % elements == 0:
+        image = image.reshape((elements, image.shape[0] // elements) + image.shape[1:])
+    cubemap = metadata.get("faces", 1) == 6
+    height, width = image.shape[1:3] if image.ndim == 4 else image.shape[:2]
+    mipmaps = mip_count_like(metadata, width, height)
+
+    dxgi_format = metadata.get("dx10_format") if metadata.get("has_dx10_header") else None
+    family = DXGI_FORMATS.get(dxgi_format, "UNKNOWN").split("_")[0]
+    if DXGI_BLOCK_FORMATS.get(family) in FORMAT_ENCODERS and not DXGI_FORMATS[dxgi_format].endswith("_SNORM"):
+        return encode_dds(image, 'DX10', quality, workers, dxgi_format=dxgi_format, cubemap=cubemap,
+                          mipmaps=mipmaps, mip_filter=mip_filter)
+
+    fourcc = metadata.get("fourcc", "")
+    if fourcc not in FOURCC_FORMATS:
+        fourcc = metadata.get("format", "DXT5")
+        if fourcc not in FORMAT_ENCODERS:
+            fourcc = "DXT5"
+    if image.ndim == 4 and not cubemap:
+        dxgi_format = FORMAT_DXGI[FOURCC_FORMATS.get(fourcc, fourcc)]
+        return encode_dds(image, 'DX10', quality, workers, dxgi_format=dxgi_format,
+                          mipmaps=mipmaps, mip_filter=mip_filter)
+    return encode_dds(image, fourcc, quality, workers, cubemap=cubemap, mipmaps=mipmaps, mip_filter=mip_filter)
+
+
+# Binary sidecar holding a source texture's verbatim DDS header (and DX10 extension)
+HEADER_SIDECAR_EXT = ".ddsh"
+
+
+def dds_header_bytes(data):
+    """
+    Raw header of a DDS file: 128 bytes, or 148 with the DX10 extension.
+
+    Args:
+        data: bytes-like object starting with the 'DDS ' magic (at least the header)
+
+    Returns:
+        bytes with the header, exactly as stored
+    """
+    if bytes(data[:4]) != b'DDS ':
+        raise ValueError("Invalid DDS magic number")
+    size = 148 if bytes(data[84:88]) == b"DX10" else 128
+    if len(data) < size:
+        raise ValueError("Truncated DDS header")
+    return bytes(data[:size])
+
+
+def resize_dds_header(header, width, height, mipmaps):
+    """
+    Rewrite the size-dependent fields of a DDS header, keeping every other byte.
+
+    Height, width, pitch / linear size and the mip count (with its flags) are
+    patched; pixel format, caps, reserved fields and the DX10 extension are kept.
+
+    Args:
+        header: Original header bytes (128 or 148)
+        width: New texture width
+        height: New texture height
+        mipmaps: Number of mip levels stored after the header
+
+    Returns:
+        bytes with the patched header
+    """
+    metadata = parse_dds_header(header)
+    header = bytearray(header)
+    flags, _, _, pitch, _, old_mipmaps = struct.unpack_from("<6I", header, 8)
+    caps, = struct.unpack_from("<I", header, 108)
+
+    # Linear size for block formats, row pitch for uncompressed ones (only if the source set one)
+    if metadata["format"] in BLOCK_SIZES:
+        if pitch or flags & DDSD_LINEARSIZE:
+            pitch = surface_size(width, height, metadata["format"])
+    elif pitch or flags & DDSD_PITCH:
+        pitch = (width * _uncompressed_layout(metadata).get("rgb_bit_count", 32) + 7) // 8
+
+    if mipmaps > 1:
+        flags |= DDSD_MIPMAPCOUNT
+        caps |= DDSCAPS_COMPLEX | DDSCAPS_MIPMAP
+    elif not old_mipmaps:
+        mipmaps = 0
+
+    struct.pack_into("<4I", header, 8, flags, height, width, pitch)
+    struct.pack_into("<I", header, 28, mipmaps)
+    struct.pack_into("<I", header, 108, caps)
+    return bytes(header)
+
+
+def repack_dds(output, image, header, quality='fast', workers=None, mip_filter='box'):
+    """
+    Re-encode pixels under an original DDS header, streaming the surfaces to a file.
+
+    The header (and DX10 extension) is written verbatim when the image has the
+    source's size; otherwise only its size-dependent fields are rewritten (see
+    resize_dds_header). The payload is encoded in the header's format, one surface
+    at a time, so the whole file is never held in memory.
+
+    Args:
+        output: Binary file object opened for writing
+        image: uint8 array of shape (height, width[, channels]); array elements and
+            cube faces stacked vertically (as written by dds_to_png)
+        header: Original header bytes, e.g. from a HEADER_SIDECAR_EXT sidecar
+        quality: 'fast' or 'high'
+        workers: Number of worker processes (None uses all cores)
+        mip_filter: Mip filter ('box' or 'kaiser')
+
+    Returns:
+        Number of bytes written
+    """
+    header = dds_header_bytes(header)
+    metadata = parse_dds_header(header)
+    if metadata["format"] == "RGBA":
+        layout = _uncompressed_layout(metadata)
+
+        def encoder(level, quality, workers):
+            return encode_uncompressed(level, layout)
+    else:
+        encoder = FORMAT_ENCODERS.get(metadata["format"])
+        if encoder is None or metadata.get("dxgi_format_name", "").endswith("_SNORM"):
+            raise NotImplementedError(f"Unsupported DDS format: {metadata.get('dxgi_format_name', metadata['fourcc'])}")
+
+    image = np.asarray(image)
+    if image.ndim == 2:
+        image = image[:, :, None]
+    elements = metadata["elements"]
+    if image.shape[0] % elements:
+        raise ValueError(f"Image height {image.shape[0]} does not split into {elements} elements")
+    image = image.reshape((elements, image.shape[0] // elements) + image.shape[1:])
+    height, width = image.shape[1:3]
+
+    # Same size: the stored mip count and header are reused as they are
+    if (width, height) == (metadata["width"], metadata["height"]):
+        mipmaps = metadata["mipmaps"]
+    else:
+        mipmaps = mip_count_like(metadata, width, height)
+    levels = generate_mipmaps(image, mipmaps, mip_filter, srgb=metadata["format"] not in ("BC4", "BC5"))
+    if (width, height) != (metadata["width"], metadata["height"]):
+        header = resize_dds_header(header, width, height, len(levels))
+
+    # Each element is followed by its own mip chain
+    written = output.write(header)
+    for element in range(elements):
+        for level in levels:
+            written += output.write(encoder(level[element], quality, workers))
+    return written
@@ -0,0 +1,309 @@
+"""Exact and perceptual duplicate detection, so each distinct texture is enhanced only once."""
+import numpy as np
+from PIL import Image
+
+from enhance_cache import pixel_digest
+
+# pHash: DCT of a 32x32 luma thumbnail, keeping the lowest 8x8 frequencies
+PHASH_SIZE = 32
+HASH_SIZE = 8
+
+# Maximum differing bits (of 64) in both pHash and dHash for a perceptual duplicate
+DEFAULT_THRESHOLD = 8
+
+# Thumbnails flatter than this (luma standard deviation) hash alike whatever their
+# colour, so they only ever match exactly
+MIN_DETAIL = 2.0
+
+# Bits set in every byte value, for vectorized popcounts
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def _luma(image):
+    """
+    Float32 luma of a grayscale, RGB or RGBA array.
+    """
+    pixels = np.asarray(image, dtype=np.float32)
+    if pixels.ndim == 2:
+        return pixels
+    if pixels.shape[2] < 3:
+        return pixels[..., 0]
+    return pixels[..., 0] * 0.299 + pixels[..., 1] * 0.587 + pixels[..., 2] * 0.114
+
+
+def _thumbnails(images, width, height):
+    """
+    Stack of box-filtered luma thumbnails, shape (n, height, width).
+    """
+    return np.stack([
+        np.asarray(Image.fromarray(_luma(image), mode="F").resize((width, height), Image.BOX))
+        for image in images
+    ])
+
+
+def _dct_matrix(size):
+    """
+    Orthonormal DCT-II matrix.
+    """
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+def _pack(bits):
+    """
+    Pack (n, 64) booleans into n unsigned 64-bit hashes.
+    """
+    return np.packbits(bits.reshape(len(bits), -1), axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def phash(images):
+    """
+    Perceptual (DCT) hashes of a batch of images.
+
+    Args:
+        images: List of numpy arrays (grayscale, RGB or RGBA)
+
+    Returns:
+        uint64 array, one hash per image
+    """
+    dct = _dct_matrix(PHASH_SIZE)
+    # One batched matrix product for the 2D DCT of every thumbnail
+    coefficients = (dct @ _thumbnails(images, PHASH_SIZE, PHASH_SIZE) @ dct.T)[:, :HASH_SIZE, :HASH_SIZE]
+    flat = coefficients.reshape(len(images), -1)
+    # The DC term only carries brightness; leave it out of the median
+    median = np.median(flat[:, 1:], axis=1, keepdims=True)
+    return _pack(flat > median)
+
+
+def dhash(images):
+    """
+    Difference (gradient) hashes of a batch of images.
+
+    Args:
+        images: List of numpy arrays (grayscale, RGB or RGBA)
+
+    Returns:
+        uint64 array, one hash per image
+    """
+    thumbnails = _thumbnails(images, HASH_SIZE + 1, HASH_SIZE)
+    return _pack(thumbnails[:, :, 1:] > thumbnails[:, :, :-1])
+
+
+def hamming(value, hashes):
+    """
+    Differing bits between one hash and an array of hashes.
+    """
+    different = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(value))
+    return _POPCOUNT[different.view(np.uint8)].reshape(len(different), 8).sum(axis=1)
+
+
+def fingerprints(images):
+    """
+    Exact and perceptual fingerprints of a batch of decoded textures.
+
+    Args:
+        images: List of numpy arrays
+
+    Returns:
+        List of JSON-serializable dictionaries with digest (exact pixel hash), phash,
+        dhash (16-digit hex), width, height and detail (luma spread)
+    """
+    if not images:
+        return []
+    phashes = phash(images)
+    dhashes = dhash(images)
+    detail = _thumbnails(images, PHASH_SIZE, PHASH_SIZE).reshape(len(images), -1).std(axis=1)
+    return [
+        {
+            "digest": pixel_digest(np.ascontiguousarray(image)),
+            "phash": f"{int(phashes[index]):016x}",
+            "dhash": f"{int(dhashes[index]):016x}",
+            "width": int(image.shape[1]),
+            "height": int(image.shape[0]),
+            "detail": float(detail[index]),
+        }
+        for index, image in enumerate(images)
+    ]
+
+
+def find_clusters(prints, threshold=DEFAULT_THRESHOLD):
+    """
+    Group textures that are exact or perceptual duplicates of each other.
+
+    Byte-identical pixels always group. Other textures join a cluster when both their
+    pHash and dHash are within threshold bits of its representative and the aspect
+    ratio matches (LOD copies, recolors, re-saves). Representatives are picked largest
+    first, so a cluster is enhanced from its highest-resolution copy, and every member
+    is compared with the representative itself rather than chained through others.
+
+    Args:
+        prints: Dictionary mapping keys (e.g. texture paths) to fingerprints
+        threshold: Maximum differing bits; 0 or None groups exact duplicates only
+
+    Returns:
+        List of clusters, each a list of keys with the representative first
+    """
+    # Exact duplicates first: one entry per distinct pixel digest
+    groups = {}
+    for key in sorted(prints):
+        groups.setdefault(prints[key]["digest"], []).append(key)
+    leaders = sorted(groups.values(), key=lambda keys: (-prints[keys[0]]["width"] * prints[keys[0]]["height"], keys[0]))
+    if not threshold or len(leaders) < 2:
+        return leaders
+
+    heads = [prints[keys[0]] for keys in leaders]
+    phashes = np.array([int(head["phash"], 16) for head in heads], dtype=np.uint64)
+    dhashes = np.array([int(head["dhash"], 16) for head in heads], dtype=np.uint64)
+    widths = np.array([head["width"] for head in heads], dtype=np.int64)
+    heights = np.array([head["height"] for head in heads], dtype=np.int64)
+    detailed = np.array([head.get("detail", MIN_DETAIL) >= MIN_DETAIL for head in heads])
+
+    clusters = []
+    assigned = np.zeros(len(heads), dtype=bool)
+    for index in range(len(heads)):
+        if assigned[index]:
+            continue
+        assigned[index] = True
+        cluster = list(leaders[index])
+        if detailed[index]:
+            candidates = np.flatnonzero(~assigned & detailed
+                                        & (widths * heights[index] == heights * widths[index]))
+            if len(candidates):
+                close = (hamming(phashes[index], phashes[candidates]) <= threshold) \
+                    & (hamming(dhashes[index], dhashes[candidates]) <= threshold)
+                for match in candidates[close]:
+                    assigned[match] = True
+                    cluster.extend(leaders[match])
+        clusters.append(cluster)
+    return clusters
+
+
+class ClusterIndex:
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        """
+        Incremental clustering, for textures that arrive in batches while others are
+        still being decoded.
+
+        Each batch is matched against the representatives of earlier batches first;
+        the rest is clustered with find_clusters and its representatives are kept for
+        the batches that follow. A late copy of an earlier texture thus joins its
+        cluster even when it is larger than the representative.
+
+        Args:
+            threshold: Maximum differing bits; 0 or None groups exact duplicates only
+        """
+        self.threshold = threshold
+        self._by_digest = {}
+        self._keys = []
+        self._phashes = np.zeros(0, dtype=np.uint64)
+        self._dhashes = np.zeros(0, dtype=np.uint64)
+        self._widths = np.zeros(0, dtype=np.int64)
+        self._heights = np.zeros(0, dtype=np.int64)
+
+    def add(self, prints):
+        """
+        Cluster a batch of fingerprinted textures.
+
+        Args:
+            prints: Dictionary mapping keys to fingerprints
+
+        Returns:
+            Tuple of (clusters new to this batch, each a list of keys with the
+            representative first; dictionary mapping the keys that joined an earlier
+            cluster to its representative)
+        """
+        joined = {}
+        rest = {}
+        for key in sorted(prints):
+            fingerprint = prints[key]
+            representative = self._by_digest.get(fingerprint["digest"])
+            if representative is None and self.threshold:
+                representative = self._match(fingerprint)
+            if representative is None:
+                rest[key] = fingerprint
+            else:
+                joined[key] = representative
+                self._by_digest.setdefault(fingerprint["digest"], representative)
+
+        clusters = find_clusters(rest, self.threshold)
+        for cluster in clusters:
+            for key in cluster:
+                self._by_digest.setdefault(rest[key]["digest"], cluster[0])
+        # Only detailed representatives can be perceptual matches
+        heads = [cluster[0] for cluster in clusters if rest[cluster[0]].get("detail", MIN_DETAIL) >= MIN_DETAIL]
+        self._keys.extend(heads)
+        self._phashes = np.append(self._phashes, np.array([int(rest[key]["phash"], 16) for key in heads],
+                                                          dtype=np.uint64))
+        self._dhashes = np.append(self._dhashes, np.array([int(rest[key]["dhash"], 16) for key in heads],
+                                                          dtype=np.uint64))
+        self._widths = np.append(self._widths, np.array([rest[key]["width"] for key in heads], dtype=np.int64))
+        self._heights = np.append(self._heights, np.array([rest[key]["height"] for key in heads], dtype=np.int64))
+        return clusters, joined
+
+    def _match(self, fingerprint):
+        """
+        Earlier representative this texture is a perceptual duplicate of, or None.
+        """
+        if not self._keys or fingerprint.get("detail", MIN_DETAIL) < MIN_DETAIL:
+            return None
+        candidates = np.flatnonzero(self._widths * fingerprint["height"] == self._heights * fingerprint["width"])
+        if not len(candidates):
+            return None
+        close = (hamming(int(fingerprint["phash"], 16), self._phashes[candidates]) <= self.threshold) \
+            & (hamming(int(fingerprint["dhash"], 16), self._dhashes[candidates]) <= self.threshold)
+        matches = candidates[close]
+        return self._keys[matches[0]] if len(matches) else None
+
+
+def transfer_enhancement(original, enhanced, target):
+    """
+    Apply the enhancement of one texture to a near-duplicate of it.
+
+    The change Stable Diffusion made (enhanced - original) is resized to the target
+    and added to it, so a recolor keeps its own colours and a LOD copy its own size
+    (scaled like the representative if the enhancement changed the resolution).
+    Alpha is left untouched.
+
+    Args:
+        original: Representative texture as sent to Stable Diffusion
+        enhanced: Its enhanced result
+        target: Near-duplicate texture to enhance
+
+    Returns:
+        uint8 array shaped like target (scaled with the enhancement)
+    """
+    original = np.asarray(original)
+    enhanced = np.asarray(enhanced)
+    target = np.asarray(target)
+    out_height = round(target.shape[0] * enhanced.shape[0] / original.shape[0])
+    out_width = round(target.shape[1] * enhanced.shape[1] / original.shape[1])
+
+    def resize(channel, width, height):
+        if channel.shape == (height, width):
+            return channel
+        return np.asarray(Image.fromarray(channel, mode="F").resize((width, height), Image.BICUBIC))
+
+    def colour(image):
+        image = image.astype(np.float32)
+        return image[..., None] if image.ndim == 2 else image
+
+    # The change, measured at the enhanced resolution
+    original_colour = colour(original)
+    enhanced_colour = colour(enhanced)
+    channels = min(3, original_colour.shape[2], enhanced_colour.shape[2])
+    delta = np.stack([
+        enhanced_colour[..., c] - resize(original_colour[..., c], enhanced.shape[1], enhanced.shape[0])
+        for c in range(channels)
+    ], axis=-1)
+
+    result = colour(target)
+    result = np.stack([resize(result[..., c], out_width, out_height) for c in range(result.shape[2])], axis=-1)
+    target_channels = min(3, result.shape[2])
+    for c in range(target_channels):
+        # Grayscale targets take the mean change of the colour channels
+        change = delta[..., c] if channels == target_channels else delta.mean(axis=-1)
+        result[..., c] += resize(np.ascontiguousarray(change), out_width, out_height)
+    result = np.clip(result + 0.5, 0, 255).astype(np.uint8)
+    return result[..., 0] if target.ndim == 2 else result
@@ -0,0 +1,127 @@
+import os
+import json
+from asset_converter import AssetConverter
+import metrics
+import texture_roles
+from tiling import DEFAULT_TILE_SIZE
+
+
+def enhance_bytes(image, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4, steps=40,
+                  output_format=None, metadata=None, client=None, report_error=print,
+                  tile_size=DEFAULT_TILE_SIZE, seamless=False, converter=None, role=texture_roles.ROLE_ALBEDO):
+    """
+    Enhance a texture in memory and encode it in the desired format.
+
+    Args:
+        image: uint8 RGBA array or PNG bytes.
+        prompt (str): Prompt for Stable Diffusion enhancement.
+        negative_prompt (str): Negative prompt for Stable Diffusion.
+        denoising_strength (float): Strength of enhancement (0.0 to 1.0).
+        cfg_scale (int): CFG scale for prompt adherence.
+        steps (int): Number of diffusion steps.
+        output_format (str): Desired output format ('png', 'dds', 'vtf').
+        metadata (dict, optional): Source metadata for DDS/VTF conversion.
+        client (SDClient, optional): Stable Diffusion client (defaults to the shared cached one).
+        report_error (callable): Receives error messages (e.g. st.error).
+        tile_size (int): Textures larger than this are enhanced as overlapping tiles.
+        seamless (bool): Wrap tiles around the edges so tileable textures stay seamless.
+        converter (AssetConverter, optional): Converter to encode with.
+        role (str): Texture role; normal maps and masks are upscaled on the CPU, not by SD.
+
+    Returns:
+        tuple: (encoded bytes, format actually written), or None on failure.
+    """
+    converter = converter or AssetConverter()
+    # One metrics job per enhance: the per-stage breakdown shown in the dev panel
+    with metrics.job("enhance"):
+        try:
+            # Send the PNG to Stable Diffusion over the pooled session, unless the result is cached
+            enhanced_png = converter.enhance(
+                image,
+                denoising_strength,
+                cfg_scale,
+                steps,
+                prompt=prompt,
+                negative_prompt=negative_prompt,
+                client=client,
+                tile_size=tile_size,
+                seamless=seamless,
+                role=role,
+            )
+        except Exception as e:
+            report_error(f"Error in enhance_texture: {str(e)}")
+            return None
+
+        # Convert to DDS/VTF if requested and metadata is provided
+        if output_format in ('dds', 'vtf') and metadata is not None:
+            try:
+                if output_format == 'dds':
+                    # Get FourCC from metadata (default to DXT1 if not found)
+                    metadata = dict(metadata)
+                    metadata.setdefault("fourcc", "DXT1")
+                # Original format, flags and mip count (legacy FourCC, DX10 DXGI format or VTF format)
+                return converter.save(enhanced_png, output_format, metadata), output_format
+            except Exception as e:
+                report_error(f"Failed to convert to {output_format.upper()}: {str(e)}. Saving as PNG instead.")
+        return enhanced_png, 'png'
+
+
+def enhance_texture(file_path, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4, steps=40,
+                    output_format=None, metadata_path=None, client=None, report_error=print,
+                    tile_size=DEFAULT_TILE_SIZE, seamless=False, role=None, output_dir="temp"):
+    """
+    Enhance a texture using Stable Diffusion and convert to the desired format.
+
+    File-based wrapper around enhance_bytes; the result is written to output_dir.
+
+    Args:
+        file_path (str): Path to the input PNG file.
+        prompt (str): Prompt for Stable Diffusion enhancement.
+        negative_prompt (str): Negative prompt for Stable Diffusion.
+        denoising_strength (float): Strength of enhancement (0.0 to 1.0).
+        cfg_scale (int): CFG scale for prompt adherence.
+        steps (int): Number of diffusion steps.
+        output_format (str): Desired output format ('png', 'dds', 'vtf').
+        metadata_path (str, optional): Path to metadata for DDS/VTF conversion.
+        client (SDClient, optional): Stable Diffusion client (defaults to the shared cached one).
+        report_error (callable): Receives error messages (e.g. st.error).
+        tile_size (int): Textures larger than this are enhanced as overlapping tiles.
+        seamless (bool): Wrap tiles around the edges so tileable textures stay seamless.
+        role (str, optional): Texture role (detected from the file name and metadata if omitted).
+        output_dir (str): Folder the enhanced texture is written to.
+
+    Returns:
+        str: Path to the enhanced texture file.
+    """
+    with metrics.job("enhance"):
+        try:
+            with metrics.span("read_input"), open(file_path, "rb") as f:
+                image_bytes = f.read()
+
+            # Load metadata
+            metadata = None
+            if metadata_path:
+                with open(metadata_path, "r") as f:
+                    metadata = json.load(f)
+            if role is None:
+                role = texture_roles.classify(file_path, metadata)
+
+            result = enhance_bytes(
+                image_bytes, prompt, negative_prompt, denoising_strength, cfg_scale, steps,
+                output_format=output_format, metadata=metadata, client=client, report_error=report_error,
+                tile_size=tile_size, seamless=seamless, role=role,
+            )
+            if result is None:
+                return None
+            data, written_format = result
+
+            # Save the enhanced texture
+            os.makedirs(output_dir, exist_ok=True)
+            final_path = os.path.join(output_dir, f"enhanced.{written_format}")
+            with metrics.span("write_output"), open(final_path, "wb") as f:
+                f.write(data)
+            return final_path
+
+        except Exception as e:
+            report_error(f"Error in enhance_texture: {str(e)}")
+            return None
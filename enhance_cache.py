@@ -0,0 +1,266 @@
+"""Content-addressed on-disk cache of Stable Diffusion enhancement results."""
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+import imageio.v3 as iio
+
+from sd_client import get_client
+
+DEFAULT_CACHE_DIR = os.environ.get("ENHANCE_CACHE_DIR", os.path.join(".cache", "enhance"))
+DEFAULT_MAX_BYTES = int(float(os.environ.get("ENHANCE_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+
+_SHARED_CACHE = None
+_SHARED_CLIENT = None
+_SHARED_LOCK = threading.Lock()
+
+
+def pixel_digest(image):
+    """
+    Hash the decoded pixels of an image, so re-saved PNGs with other metadata or
+    compression settings share a cache entry.
+
+    Args:
+        image: PNG (or any imageio-readable) bytes, or a numpy array
+
+    Returns:
+        Hex digest string
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = iio.imread(bytes(image))
+    digest = hashlib.sha256()
+    digest.update(f"{image.shape}{image.dtype}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def cache_key(pixels, prompt, negative_prompt, denoising_strength, cfg_scale, steps, model=None, **params):
+    """
+    Cache key of one img2img request.
+
+    Args:
+        pixels: pixel_digest of the init image
+        prompt, negative_prompt, denoising_strength, cfg_scale, steps: img2img parameters
+        model: Backend model (checkpoint name or WebUI address)
+        **params: Extra img2img parameters (seed, sampler, size, scripts...)
+
+    Returns:
+        Hex digest string
+    """
+    request = dict(params, pixels=pixels, prompt=prompt, negative_prompt=negative_prompt,
+                   denoising_strength=denoising_strength, cfg_scale=cfg_scale, steps=steps, model=model)
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class EnhanceCache:
+    def __init__(self, cache_dir=None, max_bytes=None):
+        """
+        Persistent LRU cache of enhanced PNGs, stored as <cache_dir>/<ab>/<key>.png.
+
+        Recency is the file modification time, so it survives restarts and is shared
+        by every process using the same folder.
+
+        Args:
+            cache_dir: Cache folder (default: ENHANCE_CACHE_DIR or .cache/enhance)
+            max_bytes: Size cap; least recently used entries are evicted beyond it
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes or DEFAULT_MAX_BYTES
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()
+        self._bytes = 0
+        self._scan()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".png")
+
+    def _scan(self):
+        """
+        Rebuild the in-memory LRU index from the files on disk.
+        """
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if not filename.endswith(".png"):
+                    continue
+                stat = os.stat(os.path.join(root, filename))
+                entries.append((stat.st_mtime, filename[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._bytes += size
+
+    def get(self, key):
+        """
+        Look up a cached result.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            PNG bytes, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+                self._bytes -= self._index.pop(key, 0)
+            return None
+        with self._lock:
+            self.hits += 1
+            if key not in self._index:
+                self._bytes += len(data)
+            self._index[key] = len(data)
+            self._index.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        """
+        Store a result and evict least recently used entries beyond the size cap.
+
+        Args:
+            key: Cache key
+            data: PNG bytes
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a unique temporary name, then rename, so readers never see a partial file
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            while self._bytes > self.max_bytes and len(self._index) > 1:
+                old_key, size = self._index.popitem(last=False)
+                self._bytes -= size
+                self.evictions += 1
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    def stats(self):
+        """
+        Hit/miss statistics.
+
+        Returns:
+            Dictionary with hits, misses, hit_rate, evictions, entries and bytes
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._bytes,
+            }
+
+    def clear(self):
+        """
+        Delete every cached result.
+        """
+        with self._lock:
+            for key in list(self._index):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._index.clear()
+            self._bytes = 0
+
+
+def backend_model(client):
+    """
+    Model identity of the WebUI behind a client, looking through any dispatchers
+    (BatchDispatcher, AtlasDispatcher) that wrap it.
+
+    Returns:
+        SDClient.model / SDPool.model, or None
+    """
+    while client is not None:
+        model = getattr(client, "model", None)
+        if model:
+            return model
+        client = getattr(client, "client", None)
+    return None
+
+
+class CachedClient:
+    def __init__(self, client=None, cache=None, model=None):
+        """
+        img2img front end that answers repeated requests from an EnhanceCache.
+
+        Wraps an SDClient or BatchDispatcher and has the same img2img signature.
+
+        Args:
+            client: SDClient or BatchDispatcher (defaults to the shared client)
+            cache: EnhanceCache (defaults to the shared cache)
+            model: Backend model name for the cache key; requests without an
+                override_settings checkpoint are keyed by this, or by the client's model
+                identity (SDClient.model / SDPool.model)
+        """
+        self.client = client or get_client()
+        self.cache = cache or get_cache()
+        self.model = model or backend_model(self.client)
+
+    def img2img(self, image, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4, steps=40,
+                **params):
+        """
+        Cached img2img (drop-in for SDClient.img2img).
+
+        Returns:
+            PNG bytes of the enhanced image
+        """
+        model = (params.get("override_settings") or {}).get("sd_model_checkpoint") or self.model
+        key = cache_key(pixel_digest(image), prompt, negative_prompt, denoising_strength, cfg_scale, steps,
+                        model=model, **params)
+        data = self.cache.get(key)
+        if data is None:
+            data = self.client.img2img(image, prompt, negative_prompt, denoising_strength, cfg_scale, steps,
+                                       **params)
+            self.cache.put(key, data)
+        return data
+
+
+def get_cache():
+    """
+    Shared process-wide cache, created on first use.
+
+    Returns:
+        EnhanceCache
+    """
+    global _SHARED_CACHE
+    with _SHARED_LOCK:
+        if _SHARED_CACHE is None:
+            _SHARED_CACHE = EnhanceCache()
+        return _SHARED_CACHE
+
+
+def get_cached_client():
+    """
+    Shared SD client backed by the shared cache.
+
+    Returns:
+        CachedClient
+    """
+    global _SHARED_CLIENT
+    cache = get_cache()
+    with _SHARED_LOCK:
+        if _SHARED_CLIENT is None or _SHARED_CLIENT.client is not get_client():
+            _SHARED_CLIENT = CachedClient(get_client(), cache)
+        return _SHARED_CLIENT
@@ -0,0 +1,325 @@
+"""Stand-in for the Stable Diffusion WebUI API (img2img, progress, interrupt) for offline load tests."""
+import argparse
+import base64
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7860
+
+# Deterministic stand-ins for a generation
+TRANSFORMS = ("echo", "invert", "grade")
+
+# Finished task IDs remembered for /internal/progress
+MAX_FINISHED_TASKS = 1000
+
+
+def transform_image(pixels, transform):
+    """
+    Deterministically "enhance" an image.
+
+    Args:
+        pixels: uint8 RGB array
+        transform: 'echo' (unchanged), 'invert' or 'grade' (fixed contrast/warmth curve)
+
+    Returns:
+        uint8 RGB array of the same shape
+    """
+    if transform == "invert":
+        return 255 - pixels
+    if transform == "grade":
+        graded = (pixels.astype(np.float32) - 128) * 1.15 + 128
+        graded[..., 0] += 8
+        graded[..., 2] -= 8
+        return np.clip(graded + 0.5, 0, 255).astype(np.uint8)
+    return pixels
+
+
+def _to_base64_png(pixels):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG", compress_level=1)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+class FakeWebUI:
+    def __init__(self, latency=0.5, jitter=0.0, error_rate=0.0, transform="echo", batch_mode="sequential",
+                 max_batch_size=None, parallel=1, seed=0):
+        """
+        Simulated AUTOMATIC1111 WebUI backend.
+
+        Generations run in a queue like the real server (one at a time by default) and
+        advance step by step, so /progress and /interrupt behave as they do on a GPU.
+
+        Args:
+            latency: Seconds per generated image
+            jitter: Random latency variation as a fraction of latency (0.2 = +/-20%)
+            error_rate: Fraction of img2img requests answered with HTTP 500
+            transform: Image transform applied to init_images (see TRANSFORMS)
+            batch_mode: 'sequential' (a batch of n takes n * latency) or 'parallel'
+                (one latency per batch, like a GPU with spare memory)
+            max_batch_size: Larger batches are rejected with HTTP 422 (None: no limit)
+            parallel: Generations running at once
+            seed: Seed for jitter and injected errors
+        """
+        if transform not in TRANSFORMS:
+            raise ValueError(f"Unknown transform: {transform}")
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.transform = transform
+        self.batch_mode = batch_mode
+        self.max_batch_size = max_batch_size
+        self._random = random.Random(seed)
+        self._queue = threading.Semaphore(max(1, parallel))
+        self._lock = threading.Lock()
+        self._running = []
+        self._job_no = 0
+        self._tasks = {}
+        self.stats = {"requests": 0, "images": 0, "errors": 0, "interrupted": 0, "queued": 0}
+
+    def img2img(self, payload):
+        """
+        Handle one img2img request.
+
+        Returns:
+            Tuple of (HTTP status, JSON response)
+        """
+        init_images = payload.get("init_images") or []
+        with self._lock:
+            self.stats["requests"] += 1
+            fail = self._random.random() < self.error_rate
+            scale = 1 + self._random.uniform(-self.jitter, self.jitter)
+        if not init_images:
+            return 422, {"error": "ValidationError", "detail": "init_images is required"}
+        if self.max_batch_size and len(init_images) > self.max_batch_size:
+            return 422, {"error": "ValidationError",
+                         "detail": f"Batch of {len(init_images)} exceeds {self.max_batch_size}"}
+        if fail:
+            with self._lock:
+                self.stats["errors"] += 1
+            return 500, {"error": "RuntimeError", "detail": "Injected failure"}
+
+        images = [np.asarray(Image.open(io.BytesIO(base64.b64decode(image))).convert("RGB"))
+                  for image in init_images]
+        outputs = [transform_image(pixels, self.transform) for pixels in images]
+        steps = max(1, int(payload.get("steps", 20)))
+        duration = self.latency * scale * (len(images) if self.batch_mode == "sequential" else 1)
+
+        task_id = payload.get("force_task_id")
+        with self._lock:
+            self.stats["queued"] += 1
+            if task_id:
+                self._tasks[task_id] = {"state": "queued", "job": None}
+        with self._queue:
+            with self._lock:
+                self.stats["queued"] -= 1
+                self._job_no += 1
+                job = {"job_no": self._job_no, "step": 0, "steps": steps, "start": time.monotonic(),
+                       "duration": duration, "input": images[0], "output": outputs[0],
+                       "interrupt": threading.Event()}
+                self._running.append(job)
+                if task_id:
+                    self._tasks[task_id] = {"state": "active", "job": job}
+
+            # Advance step by step so progress and interrupts are observable
+            interrupted = False
+            for step in range(steps):
+                if job["interrupt"].wait(duration / steps):
+                    interrupted = True
+                    break
+                job["step"] = step + 1
+
+            with self._lock:
+                self._running.remove(job)
+                if task_id:
+                    self._tasks[task_id] = {"state": "completed", "job": None}
+                    while len(self._tasks) > MAX_FINISHED_TASKS:
+                        del self._tasks[next(iter(self._tasks))]
+                self.stats["images"] += len(images)
+                if interrupted:
+                    self.stats["interrupted"] += 1
+
+        # An interrupted job returns what it has, like the WebUI (here: the untouched input)
+        results = images if interrupted else outputs
+        info = {"prompt": payload.get("prompt", ""), "steps": steps, "job_no": job["job_no"],
+                "interrupted": interrupted}
+        return 200, {
+            "images": [_to_base64_png(pixels) for pixels in results],
+            "parameters": {key: value for key, value in payload.items() if key != "init_images"},
+            "info": json.dumps(info),
+        }
+
+    def progress(self, skip_current_image=False):
+        """
+        Progress of the running generation (the oldest one when several run in parallel),
+        shaped like /sdapi/v1/progress.
+        """
+        with self._lock:
+            job = self._running[0] if self._running else None
+            running = len(self._running)
+            queued = self.stats["queued"]
+        if job is None:
+            return {"progress": 0.0, "eta_relative": 0.0, "current_image": None, "textinfo": None,
+                    "state": {"skipped": False, "interrupted": False, "job": "", "job_count": queued,
+                              "job_no": self._job_no, "sampling_step": 0, "sampling_steps": 0}}
+
+        fraction, eta, current_image = self._job_progress(job, not skip_current_image)
+        return {
+            "progress": fraction,
+            "eta_relative": eta,
+            "current_image": current_image,
+            "textinfo": f"Step {job['step']}/{job['steps']}",
+            "state": {"skipped": False, "interrupted": job["interrupt"].is_set(), "job": f"job_{job['job_no']}",
+                      "job_count": queued + running, "job_no": job["job_no"],
+                      "sampling_step": job["step"], "sampling_steps": job["steps"]},
+        }
+
+    def task_progress(self, task_id, live_preview=True):
+        """
+        Progress of one request sent with force_task_id, shaped like /internal/progress.
+        """
+        with self._lock:
+            task = self._tasks.get(task_id)
+        info = {"active": False, "queued": False, "completed": False, "progress": None, "eta": None,
+                "live_preview": None, "id_live_preview": -1, "textinfo": "Waiting..."}
+        if task is None:
+            return info
+        if task["state"] != "active":
+            return dict(info, **{task["state"]: True})
+        job = task["job"]
+        fraction, eta, preview = self._job_progress(job, live_preview)
+        return dict(info, active=True, progress=fraction, eta=eta, textinfo=f"Step {job['step']}/{job['steps']}",
+                    live_preview=f"data:image/png;base64,{preview}" if preview else None, id_live_preview=job["step"])
+
+    def _job_progress(self, job, preview):
+        """
+        Tuple of (fraction done, seconds left, base64 preview PNG or None) of a running job.
+        """
+        fraction = job["step"] / job["steps"]
+        eta = max(0.0, job["duration"] - (time.monotonic() - job["start"]))
+        if not preview or not job["step"]:
+            return fraction, eta, None
+        # Preview: the input fading into the final result
+        blended = job["input"] * (1 - fraction) + job["output"].astype(np.float32) * fraction
+        return fraction, eta, _to_base64_png((blended + 0.5).astype(np.uint8))
+
+    def interrupt(self):
+        """
+        Stop the running generations (they return early with their current result).
+
+        Only jobs already running are stopped; queued jobs start afterwards as usual.
+        """
+        with self._lock:
+            for job in self._running:
+                job["interrupt"].set()
+        return {}
+
+    def make_server(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        HTTP server answering the WebUI API routes with this backend.
+
+        Returns:
+            ThreadingHTTPServer (call serve_forever, or use serve_in_thread)
+        """
+        webui = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/sdapi/v1/progress":
+                    skip = parse_qs(url.query).get("skip_current_image", ["false"])[0].lower() == "true"
+                    self._reply(200, webui.progress(skip))
+                elif url.path == "/internal/ping":
+                    self._reply(200, {})
+                else:
+                    self._reply(404, {"detail": "Not Found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                path = urlparse(self.path).path
+                if path == "/sdapi/v1/img2img":
+                    try:
+                        payload = json.loads(body or b"{}")
+                    except ValueError:
+                        self._reply(422, {"error": "ValidationError", "detail": "Invalid JSON"})
+                        return
+                    self._reply(*webui.img2img(payload))
+                elif path == "/internal/progress":
+                    try:
+                        payload = json.loads(body or b"{}")
+                    except ValueError:
+                        payload = {}
+                    self._reply(200, webui.task_progress(payload.get("id_task"), payload.get("live_preview", True)))
+                elif path == "/sdapi/v1/interrupt":
+                    self._reply(200, webui.interrupt())
+                else:
+                    self._reply(404, {"detail": "Not Found"})
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        return server
+
+    def serve_in_thread(self, host=DEFAULT_HOST, port=0):
+        """
+        Start a server on a background thread (port 0 picks a free port).
+
+        Returns:
+            Tuple of (server, base URL); stop it with server.shutdown()
+        """
+        server = self.make_server(host, port)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Stable Diffusion WebUI for offline load tests.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per generated image")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency variation (0.2 = +/-20%%)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 500")
+    parser.add_argument("--transform", choices=TRANSFORMS, default="echo")
+    parser.add_argument("--batch-mode", choices=["sequential", "parallel"], default="sequential",
+                        help="Whether a batch costs one latency per image or one per request")
+    parser.add_argument("--max-batch-size", type=int, help="Reject larger batches with HTTP 422")
+    parser.add_argument("--parallel", type=int, default=1, help="Generations running at once")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    webui = FakeWebUI(args.latency, args.jitter, args.error_rate, args.transform, args.batch_mode,
+                      args.max_batch_size, args.parallel, args.seed)
+    server = webui.make_server(args.host, args.port)
+    print(f"🧪 Fake WebUI listening on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"📊 {webui.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Load generator for the enhancement paths: N concurrent clients against a (fake) WebUI."""
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+from asset_converter import AssetConverter
+from enhance_backend import enhance_bytes
+import enhance_cache
+import fake_sd_server
+import sd_batch
+import sd_client
+
+WORKFLOWS = ("api", "enhance", "pipeline")
+DEFAULT_INPUTS = os.path.join("uploads", "*.png")
+PERCENTILES = (50, 95, 99)
+
+# How long a spawned fake WebUI gets to start listening
+SPAWN_TIMEOUT = 15
+
+
+def _workflow(name, client, converter, prompt, steps, output_format):
+    """
+    One request of the given workflow, as a callable taking (file bytes, extension).
+
+    'api' is a bare img2img round trip; 'enhance' is the Enhance page (decode the upload,
+    enhance, re-encode in the requested format); 'pipeline' is the batch job's SD stage
+    (tiled enhancement through the shared batch dispatcher).
+    """
+    def api(data, ext):
+        return client.img2img(converter.save(converter.load(data, ext)[0], "png"), prompt, steps=steps)
+
+    def enhance(data, ext):
+        image, metadata = converter.load(data, ext)
+        errors = []
+        target = output_format or ("dds" if ext == "dds" else "png")
+        result = enhance_bytes(image, prompt, steps=steps, output_format=target,
+                               metadata=metadata if target != "png" else None, client=client,
+                               report_error=errors.append, converter=converter)
+        if result is None or errors:
+            raise RuntimeError(errors[0] if errors else "enhance_bytes failed")
+        return result[0]
+
+    def pipeline(data, ext):
+        return converter.enhance(converter.load(data, ext)[0], steps=steps, prompt=prompt, client=client)
+
+    return {"api": api, "enhance": enhance, "pipeline": pipeline}[name]
+
+
+def summarize(latencies, errors, elapsed, megapixels):
+    """
+    Latency percentiles and throughput of a run.
+
+    Args:
+        latencies: Seconds per successful request
+        errors: Number of failed requests
+        elapsed: Wall time of the run in seconds
+        megapixels: Megapixels processed by successful requests
+
+    Returns:
+        Dictionary with requests, errors, p50/p95/p99/max (seconds), req_per_s and mp_per_s
+    """
+    summary = {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed": elapsed,
+        "req_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "mp_per_s": megapixels / elapsed if elapsed else 0.0,
+    }
+    values = np.asarray(latencies or [0.0])
+    for percentile in PERCENTILES:
+        summary[f"p{percentile}"] = float(np.percentile(values, percentile))
+    summary["max"] = float(values.max())
+    return summary
+
+
+def run_load(request, inputs, clients=4, requests_total=None, duration=None):
+    """
+    Drive a workflow from concurrent clients.
+
+    Each client thread sends requests back to back (a closed loop), cycling through the
+    inputs from its own offset, until requests_total requests were started or duration
+    seconds passed.
+
+    Args:
+        request: Callable taking (file bytes, extension)
+        inputs: List of (file bytes, extension, megapixels)
+        clients: Number of concurrent clients
+        requests_total: Total requests to send (default: 10 per client, unless duration is set)
+        duration: Seconds to keep sending
+
+    Returns:
+        Summary dictionary (see summarize) with the first error message, if any
+    """
+    if requests_total is None and duration is None:
+        requests_total = clients * 10
+    lock = threading.Lock()
+    latencies = []
+    failures = []
+    state = {"started": 0, "megapixels": 0.0}
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+
+    def client_loop(index):
+        position = index
+        while True:
+            with lock:
+                if requests_total is not None and state["started"] >= requests_total:
+                    return
+                state["started"] += 1
+            if deadline and time.perf_counter() >= deadline:
+                return
+            data, ext, megapixels = inputs[position % len(inputs)]
+            position += 1
+            sent = time.perf_counter()
+            try:
+                request(data, ext)
+            except Exception as e:
+                with lock:
+                    failures.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - sent)
+                state["megapixels"] += megapixels
+
+    threads = [threading.Thread(target=client_loop, args=(index,), daemon=True) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    summary = summarize(latencies, len(failures), time.perf_counter() - start, state["megapixels"])
+    summary["first_error"] = failures[0] if failures else None
+    return summary
+
+
+def load_inputs(patterns, converter):
+    """
+    Read the input textures once.
+
+    Returns:
+        List of (file bytes, extension, megapixels)
+    """
+    inputs = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "rb") as f:
+                data = f.read()
+            ext = os.path.splitext(path)[1][1:].lower()
+            image, _ = converter.load(data, ext)
+            inputs.append((data, ext, image.shape[0] * image.shape[1] / 1e6))
+    return inputs
+
+
+def spawn_fake_server(port, latency, jitter=0.0, error_rate=0.0, parallel=1):
+    """
+    Start fake_sd_server.py as a separate process and wait until it answers.
+
+    Returns:
+        Tuple of (subprocess.Popen, base URL)
+    """
+    command = [sys.executable, fake_sd_server.__file__, "--port", str(port), "--latency", str(latency),
+               "--jitter", str(jitter), "--error-rate", str(error_rate), "--parallel", str(parallel)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://{fake_sd_server.DEFAULT_HOST}:{port}"
+    deadline = time.monotonic() + SPAWN_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url + "/internal/ping", timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Fake WebUI did not start on {base_url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the enhancement paths with concurrent clients.")
+    parser.add_argument("inputs", nargs="*", default=[DEFAULT_INPUTS], help="Texture files or glob patterns")
+    parser.add_argument("--workflow", choices=WORKFLOWS, default="enhance",
+                        help="api: bare img2img; enhance: the Enhance page; pipeline: the batch SD stage")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, help="Total requests (default: 10 per client)")
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead")
+    parser.add_argument("--url", help="WebUI address, or comma-separated addresses to load-balance (default: SD_WEBUI_URL)")
+    parser.add_argument("--sd-concurrency", type=int, default=sd_client.DEFAULT_CONCURRENCY,
+                        help="Requests in flight per WebUI (shared like the app's pooled client)")
+    parser.add_argument("--sd-batch-size", type=int, default=sd_batch.DEFAULT_BATCH_SIZE,
+                        help="Batch size of the pipeline workflow's dispatcher")
+    parser.add_argument("--output-format", choices=["png", "dds", "vtf"],
+                        help="Enhance workflow output (default: DDS for DDS inputs, else PNG)")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--prompt", default="semi-realistic pixel art remaster, detailed, high-res")
+    parser.add_argument("--cache", action="store_true", help="Go through the enhancement cache (off by default)")
+    parser.add_argument("--spawn-server", action="store_true", help="Start fake_sd_server.py for the run")
+    parser.add_argument("--servers", type=int, default=1, help="Number of fake WebUIs to spawn (load-balanced)")
+    parser.add_argument("--port", type=int, default=7861, help="Port of the (first) spawned fake WebUI")
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.2],
+                        help="Spawned fake WebUIs: seconds per image (one value per server, cycled)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Spawned fake WebUI: latency variation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Spawned fake WebUI: failing fraction")
+    parser.add_argument("--parallel", type=int, default=1, help="Spawned fake WebUI: generations at once")
+    parser.add_argument("--drop-after", type=float,
+                        help="Kill the first spawned fake WebUI after this many seconds (failover test)")
+    args = parser.parse_args()
+
+    converter = AssetConverter()
+    inputs = load_inputs(args.inputs, converter)
+    if not inputs:
+        parser.error("No input textures found")
+
+    servers = []
+    url = args.url
+    if args.spawn_server:
+        urls = []
+        for index in range(max(1, args.servers)):
+            latency = args.latency[index % len(args.latency)]
+            server, server_url = spawn_fake_server(args.port + index, latency, args.jitter, args.error_rate,
+                                                   args.parallel)
+            servers.append(server)
+            urls.append(server_url)
+        url = ",".join(urls)
+        if args.drop_after:
+            threading.Timer(args.drop_after, servers[0].kill).start()
+    client = sd_client.create_client(url, max_concurrency=args.sd_concurrency, max_retries=0)
+    frontend = client
+    if args.workflow == "pipeline":
+        frontend = sd_batch.BatchDispatcher(client, args.sd_batch_size)
+    if args.cache:
+        frontend = enhance_cache.CachedClient(frontend, enhance_cache.get_cache())
+
+    print(f"🚀 {args.workflow}: {args.clients} clients, {len(inputs)} inputs -> {client.base_url}")
+    try:
+        request = _workflow(args.workflow, frontend, converter, args.prompt, args.steps, args.output_format)
+        summary = run_load(request, inputs, args.clients, args.requests, args.duration)
+    finally:
+        if isinstance(frontend, enhance_cache.CachedClient):
+            frontend = frontend.client
+        if frontend is not client:
+            frontend.close()
+        backends = client.status() if isinstance(client, sd_client.SDPool) else []
+        client.close()
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    print(f"📊 {summary['requests']} ok, {summary['errors']} failed in {summary['elapsed']:.1f}s "
+          f"({summary['req_per_s']:.2f} req/s, {summary['mp_per_s']:.2f} MP/s)")
+    print("⏱️ latency " + ", ".join(f"p{p} {summary[f'p{p}']:.3f}s" for p in PERCENTILES)
+          + f", max {summary['max']:.3f}s")
+    for backend in backends:
+        latency = f"{backend['latency']:.3f}s" if backend["latency"] else "-"
+        print(f"🖥️ {backend['url']}: {backend['requests']} requests, {backend['failures']} failed, "
+              f"avg latency {latency}, {'up' if backend['healthy'] else 'down'}")
+    if summary["first_error"]:
+        print(f"❌ First error: {summary['first_error']}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Lightweight per-stage span timing, exported as Prometheus-style counters and histograms."""
+import contextvars
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PREFIX = "texture"
+
+# Set METRICS_FILE to rewrite a Prometheus text file after every job (node_exporter textfile collector)
+METRICS_FILE = os.environ.get("METRICS_FILE")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+# Histogram upper bounds in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_CURRENT_JOB = contextvars.ContextVar("metrics_job", default=None)
+_LAST_JOB = None
+_SERVERS = {}
+_SERVERS_LOCK = threading.Lock()
+
+
+class Registry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Thread-safe store of labelled counters and histograms.
+
+        Args:
+            buckets: Histogram upper bounds (an implicit +Inf bucket is added)
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, labels=None, value=1):
+        """
+        Add to a counter.
+        """
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        """
+        Record one observation in a histogram.
+        """
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self):
+        """
+        Prometheus text exposition format (version 0.0.4).
+
+        Returns:
+            str
+        """
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{str(value)}"' for key, value in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(value, buckets=list(value["buckets"])))
+                                for key, value in self._histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{METRICS_PREFIX}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{label_text(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            metric = f"{METRICS_PREFIX}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(f"{metric}_bucket{label_text(labels, [('le', bound)])} {count}")
+            lines.append(f"{metric}_bucket{label_text(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{metric}_sum{label_text(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{metric}_count{label_text(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+REGISTRY = Registry()
+
+
+class Job:
+    def __init__(self, name):
+        """
+        Spans recorded while one job (e.g. one enhance) runs, for a per-stage breakdown.
+
+        Spans from worker threads count as long as the thread runs in a copy of the
+        job's context (contextvars.copy_context().run).
+
+        Args:
+            name: Job name (e.g. 'enhance')
+        """
+        self.name = name
+        self.spans = []
+        self.seconds = None
+        self.error = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, ok=True):
+        with self._lock:
+            self.spans.append((stage, seconds, ok))
+
+    def breakdown(self):
+        """
+        Time per stage, in the order stages first ran.
+
+        Concurrent spans (e.g. parallel tiles) add up, so shares are of the summed
+        stage time rather than of the wall time.
+
+        Returns:
+            List of dictionaries with stage, calls, errors, seconds and share
+        """
+        stages = {}
+        with self._lock:
+            spans = list(self.spans)
+        for stage, seconds, ok in spans:
+            entry = stages.setdefault(stage, {"stage": stage, "calls": 0, "errors": 0, "seconds": 0.0})
+            entry["calls"] += 1
+            entry["errors"] += 0 if ok else 1
+            entry["seconds"] += seconds
+        total = sum(entry["seconds"] for entry in stages.values())
+        for entry in stages.values():
+            entry["share"] = entry["seconds"] / total if total else 0.0
+        return list(stages.values())
+
+
+@contextmanager
+def span(stage):
+    """
+    Time one pipeline stage.
+
+    The duration goes into the stage_seconds histogram and the current job (if any);
+    an exception escaping the block also counts in stage_errors_total.
+
+    Args:
+        stage: Stage name (e.g. 'decode_dds', 'sd_http')
+    """
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except Exception:
+        ok = False
+        REGISTRY.inc("stage_errors_total", {"stage": stage})
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        REGISTRY.observe("stage_seconds", elapsed, {"stage": stage})
+        job = _CURRENT_JOB.get()
+        if job is not None:
+            job.add(stage, elapsed, ok)
+
+
+@contextmanager
+def job(name):
+    """
+    Group the spans of one unit of work.
+
+    Nested calls join the job already running in this context, so a caller can wrap
+    a larger workflow around functions that open their own job.
+
+    Args:
+        name: Job name
+
+    Yields:
+        Job
+    """
+    global _LAST_JOB
+    current = _CURRENT_JOB.get()
+    if current is not None:
+        yield current
+        return
+
+    current = Job(name)
+    token = _CURRENT_JOB.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = str(e)
+        REGISTRY.inc("job_errors_total", {"job": name})
+        raise
+    finally:
+        _CURRENT_JOB.reset(token)
+        current.seconds = time.perf_counter() - current._start
+        REGISTRY.inc("jobs_total", {"job": name})
+        REGISTRY.observe("job_seconds", current.seconds, {"job": name})
+        _LAST_JOB = current
+        if METRICS_FILE:
+            try:
+                write_textfile(METRICS_FILE)
+            except OSError as e:
+                print(f"Error writing metrics file: {str(e)}")
+
+
+def current_job():
+    """
+    Job running in this context, or None.
+    """
+    return _CURRENT_JOB.get()
+
+
+def last_job():
+    """
+    Most recently finished job in this process, or None.
+    """
+    return _LAST_JOB
+
+
+def render():
+    """
+    Prometheus text of the shared registry.
+    """
+    return REGISTRY.render()
+
+
+def write_textfile(path):
+    """
+    Write the metrics to a file atomically (for textfile collectors).
+    """
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(render())
+    os.replace(temp_path, path)
+
+
+def start_http_server(port=None, host="0.0.0.0"):
+    """
+    Serve /metrics on a background thread (once per port per process).
+
+    Args:
+        port: TCP port (default: METRICS_PORT)
+        host: Interface to bind
+
+    Returns:
+        ThreadingHTTPServer, or None when no port is configured
+    """
+    port = port or METRICS_PORT
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _SERVERS_LOCK:
+        if port not in _SERVERS:
+            server = ThreadingHTTPServer((host, port), Handler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            _SERVERS[port] = server
+        return _SERVERS[port]
@@ -0,0 +1,196 @@
+"""Vectorized, gamma-correct resampling: mip chains for the DDS and VTF writers, and resizes."""
+import numpy as np
+
+# Kaiser-windowed sinc: radius in destination pixels and window shape
+KAISER_RADIUS = 3
+KAISER_ALPHA = 4.0
+
+MIP_FILTERS = ("box", "kaiser")
+
+# sRGB <-> linear conversion (uint8 -> float through a table, float -> uint8 in closed form)
+_SRGB_TO_LINEAR = np.where(
+    np.arange(256) / 255.0 <= 0.04045,
+    np.arange(256) / 255.0 / 12.92,
+    ((np.arange(256) / 255.0 + 0.055) / 1.055) ** 2.4,
+).astype(np.float32)
+
+
+def _linear_to_srgb(values):
+    values = np.clip(values, 0.0, 1.0)
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * np.power(values, 1 / 2.4) - 0.055)
+
+
+def mipmap_count(width, height):
+    """
+    Number of levels in a full mip chain down to 1x1.
+    """
+    return max(width, height).bit_length()
+
+
+def _box_taps(src, dst):
+    """
+    Source indices and weights of an area (box) filter from src to dst pixels.
+
+    Each destination pixel averages the source pixels its footprint covers, weighted by
+    coverage, so odd sizes are handled without dropping or replicating rows.
+
+    Returns:
+        Tuple of (int indices, float32 weights), both of shape (dst, taps)
+    """
+    scale = src / dst
+    start = np.arange(dst) * scale
+    end = start + scale
+    taps = int(np.ceil(scale)) + 1
+    index = np.floor(start).astype(np.int64)[:, None] + np.arange(taps)
+    coverage = np.minimum(index + 1, end[:, None]) - np.maximum(index, start[:, None])
+    weights = np.clip(coverage, 0, None)
+    return np.minimum(index, src - 1), weights
+
+
+def _kaiser_taps(src, dst):
+    """
+    Source indices and weights of a Kaiser-windowed sinc filter from src to dst pixels.
+
+    Downscaling widens the kernel to the destination footprint (antialiasing);
+    upscaling interpolates with the kernel at source resolution.
+
+    Returns:
+        Tuple of (int indices, float32 weights), both of shape (dst, taps)
+    """
+    scale = src / dst
+    support = max(scale, 1.0)
+    center = (np.arange(dst) + 0.5) * scale - 0.5
+    reach = KAISER_RADIUS * support
+    taps = int(np.ceil(2 * reach)) + 1
+    index = np.floor(center - reach).astype(np.int64)[:, None] + np.arange(taps)
+    x = (index - center[:, None]) / support
+    window = np.i0(KAISER_ALPHA * np.sqrt(np.clip(1 - (x / KAISER_RADIUS) ** 2, 0, None))) / np.i0(KAISER_ALPHA)
+    weights = np.sinc(x) * np.where(np.abs(x) < KAISER_RADIUS, window, 0)
+    return index, weights
+
+
+def _resample_axis(values, axis, dst, mip_filter, wrap):
+    """
+    Resample a float array along one axis with a separable filter.
+    """
+    src = values.shape[axis]
+    if src == dst:
+        return values
+    index, weights = (_kaiser_taps if mip_filter == "kaiser" else _box_taps)(src, dst)
+    index = index % src if wrap else np.clip(index, 0, src - 1)
+    weights = (weights / weights.sum(axis=1, keepdims=True)).astype(np.float32)
+
+    # One gather + multiply-add per tap; every tap is vectorized over the whole stack
+    shape = [1] * values.ndim
+    shape[axis] = dst
+    result = np.zeros(values.shape[:axis] + (dst,) + values.shape[axis + 1:], dtype=np.float32)
+    for tap in range(index.shape[1]):
+        result += np.take(values, index[:, tap], axis=axis) * weights[:, tap].reshape(shape)
+    return result
+
+
+def generate_mipmaps(image, count=None, mip_filter="box", srgb=True, wrap=False, depth=1):
+    """
+    Build a mip chain for an image or a stack of images.
+
+    Color channels are filtered in linear light when srgb is set (alpha and non-color
+    data are filtered as stored). Every level is filtered from the previous one in
+    float, so rounding errors do not accumulate down the chain.
+
+    Args:
+        image: uint8 array of shape (height, width, channels) or
+            (elements, height, width, channels)
+        count: Number of levels including the full-size one (None builds the full chain)
+        mip_filter: 'box' or 'kaiser'
+        srgb: Filter RGB in linear light (color textures); False for normal maps / masks
+        wrap: Wrap around the edges (tiling textures) instead of clamping
+        depth: Depth slices of a volume texture; consecutive runs of this many
+            elements are one volume, and each level also halves the slice count
+
+    Returns:
+        List of uint8 arrays with the input's layout, full-size level first
+    """
+    if mip_filter not in MIP_FILTERS:
+        raise ValueError(f"Unknown mip filter: {mip_filter}")
+    image = np.asarray(image)
+    stacked = image if image.ndim == 4 else image[None]
+    height, width, channels = stacked.shape[1:]
+    full_chain = mipmap_count(width, height)
+    count = full_chain if count is None else max(1, min(int(count), full_chain))
+
+    color = min(channels, 3) if srgb and channels >= 3 else 0
+    current = stacked.astype(np.float32) / 255.0
+    if color:
+        current[..., :color] = _SRGB_TO_LINEAR[stacked[..., :color]]
+    # Volumes: (volumes, depth, height, width, channels), slices clamped at the ends
+    current = current.reshape((-1, depth) + current.shape[1:])
+
+    levels = [image]
+    for level in range(1, count):
+        current = _resample_axis(current, 1, max(1, depth >> level), mip_filter, False)
+        current = _resample_axis(current, 2, max(1, height >> level), mip_filter, wrap)
+        current = _resample_axis(current, 3, max(1, width >> level), mip_filter, wrap)
+        encoded = current.reshape((-1,) + current.shape[2:])
+        encoded = np.clip(encoded, 0.0, 1.0)
+        if color:
+            encoded = encoded.copy()
+            encoded[..., :color] = _linear_to_srgb(encoded[..., :color])
+        encoded = (encoded * 255.0 + 0.5).astype(np.uint8)
+        levels.append(encoded if image.ndim == 4 else encoded[0])
+    return levels
+
+
+def resize(image, width, height, srgb=True, wrap=False):
+    """
+    Resize an image with the Kaiser-windowed sinc filter, in linear light for color.
+
+    Args:
+        image: uint8 array of shape (height, width[, channels])
+        width: Target width
+        height: Target height
+        srgb: Filter RGB in linear light (color textures); False for normal maps / masks
+        wrap: Wrap around the edges (tiling textures) instead of clamping
+
+    Returns:
+        uint8 array of shape (height, width[, channels])
+    """
+    image = np.asarray(image)
+    if image.shape[:2] == (height, width):
+        return image
+    pixels = image if image.ndim == 3 else image[..., None]
+    channels = pixels.shape[2]
+    color = min(channels, 3) if srgb and channels >= 3 else 0
+    current = pixels.astype(np.float32) / 255.0
+    if color:
+        current[..., :color] = _SRGB_TO_LINEAR[pixels[..., :color]]
+    current = _resample_axis(current, 0, height, "kaiser", wrap)
+    current = _resample_axis(current, 1, width, "kaiser", wrap)
+    current = np.clip(current, 0.0, 1.0)
+    if color:
+        current[..., :color] = _linear_to_srgb(current[..., :color])
+    resized = (current * 255.0 + 0.5).astype(np.uint8)
+    return resized if image.ndim == 3 else resized[..., 0]
+
+
+def mip_count_like(metadata, width, height):
+    """
+    Mip count for a re-encoded texture, honoring the source's.
+
+    A source with a full chain gets a full chain at the new size; a source with a
+    truncated chain (or none) keeps its level count.
+
+    Args:
+        metadata: Source metadata with mipmaps, width and height (may be partial)
+        width: New texture width
+        height: New texture height
+
+    Returns:
+        Number of levels, or None for a full chain
+    """
+    source_mipmaps = metadata.get("mipmaps")
+    if source_mipmaps is None:
+        return None
+    source_chain = mipmap_count(metadata.get("width", width), metadata.get("height", height))
+    if source_mipmaps >= source_chain:
+        return None
+    return min(source_mipmaps, mipmap_count(width, height))
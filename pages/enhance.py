@@ -1,17 +1,14 @@
 import streamlit as st
-import re
-import subprocess
-from PIL import Image
 from pathlib import Path
+import hashlib
 import os
-import tempfile
-import requests
-import base64
-import json
-import imageio.v3 as iio
-import numpy as np
-import struct
+import threading
 from asset_converter import AssetConverter  # Assumed to be your DDS-to-PNG converter
+from enhance_backend import enhance_bytes
+from enhance_cache import get_cache, get_cached_client
+import metrics
+from sd_client import ProgressTracker
+import texture_roles
 
 # Ensure necessary directories exist
 def ensure_directories():
@@ -22,133 +19,35 @@ def ensure_directories():
 
 ensure_directories()
 
-# Function to create DDS header (from your provided code)
-def create_dds_header(width, height, fourcc):
-    dwSize = 124
-    dwFlags = 0x0002100F  # CAPS | HEIGHT | WIDTH | PIXELFORMAT | LINEARSIZE
-    dwPitchOrLinearSize = width * 4  # Assuming RGBA8
-    dwCaps = 0x1000  # CAPS_TEXTURE
-    dwCaps2 = 0
-
-    pfSize = 32
-    pfFlags = 0x41  # DDPF_RGB | DDPF_ALPHAPIXELS
-    pfFourCC = fourcc.encode('ascii')
-    pfRGBBitCount = 32
-    pfRBitMask = 0x00FF0000
-    pfGBitMask = 0x0000FF00
-    pfBBitMask = 0x000000FF
-    pfABitMask = 0xFF000000
-
-    header = b"DDS "
-    header += struct.pack("<I", dwSize)
-    header += struct.pack("<I", dwFlags)
-    header += struct.pack("<I", height)
-    header += struct.pack("<I", width)
-    header += struct.pack("<I", dwPitchOrLinearSize)
-    header += struct.pack("<I", 0)  # dwDepth
-    header += struct.pack("<I", 0)  # dwMipMapCount
-    header += b"\x00" * 44  # Reserved1
-
-    # DDS_PIXELFORMAT (32 bytes)
-    header += struct.pack("<I", pfSize)
-    header += struct.pack("<I", pfFlags)
-    header += pfFourCC.ljust(4, b'\x00')  # Pad FourCC to 4 bytes
-    header += struct.pack("<I", pfRGBBitCount)
-    header += struct.pack("<I", pfRBitMask)
-    header += struct.pack("<I", pfGBitMask)
-    header += struct.pack("<I", pfBBitMask)
-    header += struct.pack("<I", pfABitMask)
-
-    # Caps
-    header += struct.pack("<I", dwCaps)
-    header += struct.pack("<I", dwCaps2)
-    header += b"\x00" * 12  # Caps3, Caps4, Reserved2
-
-    return header
-
-# Function to enhance texture and convert to desired format
-def enhance_texture(file_path, prompt, denoising_strength=0.25, cfg_scale=4, steps=40, output_format=None, metadata_path=None):
-    """
-    Enhance a texture using Stable Diffusion and convert to the desired format.
-    
-    Args:
-        file_path (str): Path to the input PNG file.
-        prompt (str): Prompt for Stable Diffusion enhancement.
-        denoising_strength (float): Strength of enhancement (0.0 to 1.0).
-        cfg_scale (int): CFG scale for prompt adherence.
-        steps (int): Number of diffusion steps.
-        output_format (str): Desired output format ('png', 'dds', 'vtf').
-        metadata_path (str, optional): Path to metadata for DDS conversion.
-    
-    Returns:
-        str: Path to the enhanced texture file.
-    """
-    try:
-        # Encode the input PNG for Stable Diffusion API
-        with open(file_path, "rb") as f:
-            encoded_image = base64.b64encode(f.read()).decode("utf-8")
-        
-        # Send request to Stable Diffusion API
-        response = requests.post(
-            "http://127.0.0.1:7860/sdapi/v1/img2img",
-            json={
-                "init_images": [encoded_image],
-                "prompt": prompt,
-                "denoising_strength": denoising_strength,
-                "cfg_scale": cfg_scale,
-                "steps": steps
-            },
-            timeout=300
-        )
-        response.raise_for_status()
-
-        # Decode and save the enhanced image as PNG
-        enhanced_image = base64.b64decode(response.json()["images"][0])
-        enhanced_png_path = os.path.join("temp", "enhanced.png")
-        with open(enhanced_png_path, "wb") as f:
-            f.write(enhanced_image)
-
-        # Convert to DDS if output_format is 'dds' and metadata is provided
-        if output_format == 'dds' and metadata_path:
-            try:
-                # Load metadata
-                with open(metadata_path, "r") as f:
-                    metadata = json.load(f)
-                
-                # Get FourCC from metadata (default to DXT1 if not found)
-                fourcc = metadata.get("fourcc", "DXT1")[:4]
-                
-                # Read the enhanced PNG
-                image = iio.imread(enhanced_png_path)
-                height, width = image.shape[:2]
-                
-                # Add alpha channel if image is RGB (3 channels)
-                if image.shape[2] == 3:
-                    image = np.dstack((image, np.full((height, width), 255, dtype=np.uint8)))
-                
-                # Convert to RGBA bytes
-                rgba_bytes = image.astype(np.uint8).tobytes()
-                
-                # Create DDS header and combine with pixel data
-                dds_header = create_dds_header(width, height, fourcc)
-                dds_data = dds_header + rgba_bytes
-                
-                # Save the DDS file
-                final_path = os.path.join("temp", "enhanced.dds")
-                with open(final_path, "wb") as f:
-                    f.write(dds_data)
-            except Exception as e:
-                st.error(f"Failed to convert to DDS: {str(e)}. Saving as PNG instead.")
-                final_path = enhanced_png_path
-        else:
-            # For PNG or other formats, return the PNG path (extend for other formats if needed)
-            final_path = enhanced_png_path
 
-        return final_path
+# Shared across reruns and sessions
+@st.cache_resource
+def get_converter():
+    """Converter shared by every session."""
+    return AssetConverter()
+
+
+@st.cache_resource
+def get_sd_client():
+    """Pooled, result-caching Stable Diffusion client shared by every session."""
+    return get_cached_client()
+
+
+@st.cache_resource
+def start_metrics_endpoint():
+    """Serve Prometheus metrics on METRICS_PORT (once per process) if it is set."""
+    return metrics.start_http_server()
+
+
+start_metrics_endpoint()
+
+
+# Keyed by the upload's content hash; the raw bytes are not hashed again by Streamlit
+@st.cache_data(max_entries=16, ttl=3600, show_spinner="Decoding texture...")
+def decode_upload(digest, file_ext, _data):
+    """Decode an upload once per distinct content, so slider changes skip the decode."""
+    return get_converter().load(_data, file_ext)
 
-    except Exception as e:
-        st.error(f"Error in enhance_texture: {str(e)}")
-        return None
 
 st.title("Texture Enhancement Studio")
 
@@ -189,139 +88,150 @@ steps = st.slider(
     help="Higher steps can improve image quality but take longer"
 )
 
-patterns = {
-    "version": r"Version:\s*v(\d+\.\d+)",
-    "width": r"Width:\s*(\d+)",
-    "height": r"Height:\s*(\d+)",
-    "depth": r"Depth:\s*(\d+)",
-    "frames": r"Frames:\s*(\d+)",
-    "start_frame": r"Start Frame:\s*(\d+)",
-    "faces": r"Faces:\s*(\d+)",
-    "mipmaps": r"Mipmaps:\s*(\d+)",
-    "flags": r"Flags:\s*(0x[0-9A-Fa-f]+)",
-    "format": r"Format:\s*([^\n\r]+)",
-    "reflectivity": r"Reflectivity:\s*([\d\.]+),\s*([\d\.]+),\s*([\d\.]+)"
-}
+seamless = st.checkbox(
+    "Seamless (tileable) texture",
+    value=False,
+    help="Wrap enhancement tiles around the edges so the texture still tiles without seams"
+)
 
 if uploaded_file:
     filename = uploaded_file.name
     file_ext = filename.split(".")[-1].lower()
     st.success(f"Uploaded: {filename}")
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        file_path = os.path.join(tmpdir, filename)
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.read())
-
-        if file_ext == "dds":
-            # Convert DDS to PNG and extract metadata
-            converter = AssetConverter()
-            png_path, _ = converter.convert_to_png(file_path)
-
-            if png_path is None:
-                st.error("❌ Failed to convert DDS to PNG.")
-            else:
-                try:
-                    metadata = {}
-                    with open(file_path, "rb") as f:
-                        header = f.read(128)
-                        if header[:4] != b'DDS ':
-                            raise ValueError("Invalid DDS file")
-                        fourcc = header[84:88].decode("ascii", errors="ignore")
-                        metadata["fourcc"] = fourcc
-
-                    meta_filename = os.path.splitext(filename)[0] + ".json"
-                    meta_path = os.path.join(tmpdir, meta_filename)
-                    with open(meta_path, "w") as f:
-                        json.dump(metadata, f)
-
-                    st.success("✅ Metadata extracted and saved.")
-                except Exception as e:
-                    st.error(f"❌ Failed to extract metadata: {e}")
-                    meta_path = None
-                
-        elif file_ext == "vtf":
-            vtf_file = file_path
-            vtfcmd_path = r"vtflib132-bin/bin/x64/VTFCmd.exe"
-            
-            result = subprocess.run(
-                [vtfcmd_path, "-file", vtf_file , "-output", tmpdir ,"-exportformat","png"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            output = result.stdout
-            metadata = {}
-            for key, pattern in patterns.items():
-                match = re.search(pattern, output)
-                if match:
-                    if key == "reflectivity":
-                        metadata[key] = {
-                            "r": float(match.group(1)),
-                            "g": float(match.group(2)),
-                            "b": float(match.group(3))
-                        }
-                    elif key in ["width", "height", "depth", "frames", "start_frame", "faces", "mipmaps"]:
-                        metadata[key] = int(match.group(1))
-                    elif key == "version":
-                        metadata[key] = float(match.group(1))
-                    else:
-                        metadata[key] = match.group(1).strip()
-
-            # Save metadata JSON
-            meta_filename = os.path.splitext(filename)[0] + ".json"
-            meta_path = os.path.join(tmpdir, meta_filename)
-            with open(meta_path, "w") as f:
-                json.dump(metadata, f, indent=4)
-
-            # ✅ Set the converted PNG path
-            converted_png_name = os.path.splitext(filename)[0] + ".png"
-            png_path = os.path.join(tmpdir, converted_png_name)
-
-            
-        elif file_ext == "png":
-            png_path = file_path
-            meta_path = None  # No metadata available for PNGs
-
-        # Show original texture
-        image = Image.open(png_path)
-        st.image(image, caption="🧩 Original Texture", use_column_width=True)
-
-        # Output format selection
-        output_format = st.selectbox(
-            "Select Output Format",
-            ["PNG", "DDS"],
-            help="Choose the format for the enhanced texture."
-        ).lower()
-
-        if st.button("Enhance Texture"):
-            with st.spinner("✨ Enhancing texture..."):
-
-                enhanced_path = enhance_texture(
-                    png_path,
+    # Decode the upload in memory (cached across reruns); nothing is written to disk
+    converter = get_converter()
+    data = uploaded_file.getvalue()
+    try:
+        image, metadata = decode_upload(hashlib.blake2b(data, digest_size=16).hexdigest(), file_ext, data)
+    except Exception as e:
+        st.error(f"❌ Failed to convert {file_ext.upper()} to PNG: {e}")
+        st.stop()
+    if file_ext in ("dds", "vtf"):
+        st.success("✅ Metadata extracted.")
+
+    # Show original texture
+    st.image(image, caption="🧩 Original Texture", use_column_width=True)
+
+    # Normal maps and masks hold data, not colour: they skip Stable Diffusion
+    detected_role = texture_roles.classify(filename, metadata, image)
+    role = st.selectbox(
+        "Texture role",
+        texture_roles.ROLES,
+        index=texture_roles.ROLES.index(detected_role),
+        help="Only albedo (colour) textures go to Stable Diffusion. Normal maps are renormalized and "
+             "masks filtered on the CPU, so their data is not repainted."
+    )
+    if role != texture_roles.ROLE_ALBEDO:
+        st.info(f"🧭 Treated as a {role} map: processed on the CPU, the prompt and SD settings are not used.")
+
+    # Output format selection
+    output_format = st.selectbox(
+        "Select Output Format",
+        ["PNG", "DDS"],
+        help="Choose the format for the enhanced texture."
+    ).lower()
+
+    if st.button("Enhance Texture"):
+        # A newer click supersedes a job this session may still have running
+        previous = st.session_state.pop("sd_tracker", None)
+        if previous is not None:
+            previous.cancel()
+        tracker = ProgressTracker(live_preview=True)
+        st.session_state["sd_tracker"] = tracker
+
+        # Enhance on a worker thread so this script can stream progress while it runs;
+        # cached resources are resolved here, where Streamlit's script context exists
+        outcome = {"errors": []}
+        sd = get_sd_client()
+
+        def run_enhance():
+            with tracker, metrics.job("enhance") as job:
+                outcome["job"] = job
+                outcome["result"] = enhance_bytes(
+                    image,
                     prompt,
                     denoising_strength=denoising_strength,
                     cfg_scale=cfg_scale,
                     steps=steps,
                     output_format=output_format,
-                    metadata_path=meta_path if output_format == 'dds' else None
+                    metadata=metadata if output_format == 'dds' else None,
+                    report_error=outcome["errors"].append,
+                    seamless=seamless,
+                    client=sd,
+                    converter=converter,
+                    role=role
                 )
 
-                if enhanced_path:
-                    st.success("🎉 Enhancement complete!")
-
-                    if output_format == 'png':
-                        st.image(Image.open(enhanced_path), caption="✨ Enhanced Texture", use_column_width=True)
-                    else:
-                        st.info("Enhanced texture saved as DDS.")
-
-                    with open(enhanced_path, "rb") as f:
-                        st.download_button(
-                            label=f"⬇️ Download Enhanced Texture as {output_format.upper()}",
-                            data=f,
-                            file_name=f"enhanced_{os.path.splitext(filename)[0]}.{output_format}",
-                            mime="image/png" if output_format == 'png' else "application/octet-stream"
-                        )
-                else:
-                    st.error("❌ Enhancement failed.")
\ No newline at end of file
+        worker = threading.Thread(target=run_enhance, daemon=True)
+        worker.start()
+        progress_bar = st.progress(0.0, text="✨ Enhancing texture...")
+        live_preview = st.empty()
+        try:
+            while worker.is_alive():
+                info = tracker.latest
+                fraction, text = 0.0, "✨ Enhancing texture..."
+                if info is not None:
+                    eta = f", ETA {info['eta']:.0f}s" if info["eta"] is not None else ""
+                    fraction = min(max(info["progress"], 0.0), 1.0)
+                    text = f"✨ Enhancing texture... request {info['completed_requests'] + 1}{eta}"
+                    if info["preview"] is not None:
+                        live_preview.image(info["preview"], caption="Live preview", use_column_width=True)
+                # Streamlit stops a superseded or abandoned run at its next st call
+                progress_bar.progress(fraction, text=text)
+                worker.join(0.5)
+        finally:
+            # The script stops early when the user changes a widget or leaves: stop the GPU work too
+            if worker.is_alive():
+                tracker.cancel()
+        progress_bar.empty()
+        live_preview.empty()
+
+        result = outcome.get("result")
+        st.session_state["last_job"] = outcome.get("job")
+        for error in outcome["errors"]:
+            st.error(error)
+
+        if result:
+            enhanced_data, written_format = result
+            st.success("🎉 Enhancement complete!")
+            cache_stats = get_cache().stats()
+            st.caption(f"Enhancement cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+
+            if written_format == 'png':
+                st.image(enhanced_data, caption="✨ Enhanced Texture", use_column_width=True)
+            else:
+                st.info("Enhanced texture encoded as DDS.")
+
+            st.download_button(
+                label=f"⬇️ Download Enhanced Texture as {written_format.upper()}",
+                data=enhanced_data,
+                file_name=f"enhanced_{os.path.splitext(filename)[0]}.{written_format}",
+                mime="image/png" if written_format == 'png' else "application/octet-stream"
+            )
+        else:
+            st.error("❌ Enhancement failed.")
+
+
+# Developer panel: where the last enhance of this session spent its time
+with st.sidebar.expander("🛠️ Stage timings (last job)"):
+    last_job = st.session_state.get("last_job")
+    if last_job is None:
+        st.caption("Run an enhancement to see the per-stage breakdown.")
+    else:
+        st.caption(f"{last_job.name}: {last_job.seconds:.2f}s wall time (parallel tiles overlap)")
+        st.dataframe(
+            [
+                {
+                    "Stage": entry["stage"],
+                    "Calls": entry["calls"],
+                    "Time (ms)": round(entry["seconds"] * 1000, 1),
+                    "Share": f"{entry['share']:.0%}",
+                    "Errors": entry["errors"],
+                }
+                for entry in last_job.breakdown()
+            ],
+            hide_index=True,
+            use_container_width=True,
+        )
+    st.download_button("⬇️ Prometheus metrics", metrics.render(), file_name="metrics.prom", mime="text/plain")
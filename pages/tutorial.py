@@ -128,7 +128,7 @@ st.markdown("""
         <ul>
             <li><strong>Stable Diffusion WebUI not responding:</strong>
                 <ul>
-                    <li>Ensure it's running on http://127.0.0.1:7860</li>
+                    <li>Ensure it's running on http://127.0.0.1:7860 (or the addresses in SD_WEBUI_URL)</li>
                     <li>Check if the API is accessible</li>
                 </ul>
             </li>
@@ -0,0 +1,557 @@
+"""Headless batch remaster: decode -> enhance -> re-encode a folder or VPK of textures."""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import imageio
+import imageio.v3 as iio
+
+from asset_converter import AssetConverter
+import atlas
+import dds_codec
+import dedup
+import resolution
+import enhance_cache
+import sd_batch
+import sd_client
+import texture_roles
+import tiling
+import vpk_extract
+
+TEXTURE_EXTENSIONS = (".dds", ".vtf")
+MANIFEST_NAME = "manifest.jsonl"
+
+# Stages recorded in the manifest, in pipeline order
+STAGE_DECODED = "decoded"
+STAGE_ENHANCED = "enhanced"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+
+# SD threads per concurrent request in atlas mode, so each atlas has sprites to fill it
+ATLAS_THREADS = 64
+
+# Working resolution budget of atlas sprites: as large as a sprite that still gets packed
+ATLAS_WORKING_AREA = atlas.DEFAULT_MAX_SPRITE ** 2
+
+# Most decoded textures clustered at once; later windows are matched against the
+# representatives of earlier ones, so enhancement starts while decoding continues
+DEDUP_WINDOW = 1024
+
+# VPK archives opened by each worker process, keyed by path
+_ARCHIVES = {}
+
+
+def find_textures(source, extensions=TEXTURE_EXTENSIONS):
+    """
+    List the textures of a folder or VPK.
+
+    Args:
+        source: Folder path or <name>_dir.vpk path
+        extensions: Texture extensions to include
+
+    Returns:
+        List of relative texture paths (forward slashes)
+    """
+    if source.lower().endswith(".vpk"):
+        with vpk_extract.VPKArchive(source) as archive:
+            return archive.paths(extensions)
+
+    textures = []
+    for root, _, files in os.walk(source):
+        for filename in files:
+            if filename.lower().endswith(extensions):
+                rel = os.path.relpath(os.path.join(root, filename), source)
+                textures.append(rel.replace(os.sep, "/"))
+    return sorted(textures)
+
+
+def load_manifest(manifest_path):
+    """
+    Read the latest recorded state of every texture.
+
+    The manifest is append-only JSON lines; a line cut short by an interrupted run
+    is ignored.
+
+    Args:
+        manifest_path: Path to manifest.jsonl
+
+    Returns:
+        Dictionary mapping relative paths to their latest record
+    """
+    state = {}
+    if not os.path.exists(manifest_path):
+        return state
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            state[record["texture"]] = record
+    return state
+
+
+def _work_dir(work_root, rel):
+    """
+    Per-texture folder for intermediate files, mirroring the source layout.
+    """
+    return os.path.join(work_root, os.path.dirname(rel))
+
+
+def _work_base(work_root, rel):
+    """
+    Path prefix of a texture's work files: its full relative path, extension included,
+    so x.dds and x.vtf in one folder get separate x.dds.png / x.vtf.png files.
+    """
+    return os.path.join(work_root, rel)
+
+
+def _decode_job(source, rel, work_root, fingerprint=False, classify=False):
+    """
+    Decode one texture to PNG + metadata JSON (runs in a worker process).
+
+    Args:
+        fingerprint: Also compute the dedup fingerprint of the decoded pixels
+        classify: Also detect the texture role (albedo, normal map or mask)
+
+    Returns:
+        Tuple of (png path, metadata path, fingerprint or None, role or None), or
+        (None, None, None, None) on failure
+    """
+    base = _work_base(work_root, rel)
+    try:
+        if source.lower().endswith(".vpk"):
+            archive = _ARCHIVES.get(source)
+            if archive is None:
+                archive = _ARCHIVES[source] = vpk_extract.VPKArchive(source)
+            data = archive.read(rel)
+            image, metadata = vpk_extract.decode_texture(rel, data)
+        else:
+            with open(os.path.join(source, rel), "rb") as f:
+                data = f.read()
+            converter = AssetConverter(temp_dir=_work_dir(work_root, rel))
+            image, metadata = converter.load(data, os.path.splitext(rel)[1][1:])
+
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        imageio.imwrite(base + ".png", image, format='png')
+        with open(base + ".json", "w") as f:
+            json.dump(metadata, f, indent=2)
+        if rel.lower().endswith(".dds"):
+            # Raw header for lossless repacking
+            with open(base + dds_codec.HEADER_SIDECAR_EXT, "wb") as f:
+                f.write(dds_codec.dds_header_bytes(data))
+        prints = dedup.fingerprints([image])[0] if fingerprint else None
+        role = texture_roles.classify(rel, metadata, image) if classify else None
+        return base + ".png", base + ".json", prints, role
+    except Exception as e:
+        print(f"Error decoding {rel}: {str(e)}")
+        return None, None, None, None
+
+
+def _enhance_job(png_path, work_dir, options, client=None):
+    """
+    Send one texture through Stable Diffusion (runs in the bounded SD thread pool).
+
+    Args:
+        client: SDClient or BatchDispatcher (defaults to the shared client)
+
+    Returns:
+        Path to the enhanced PNG, or None on failure
+    """
+    converter = AssetConverter(temp_dir=work_dir)
+    enhanced_path = converter.enhance_image(
+        png_path,
+        options["denoising_strength"],
+        options["cfg_scale"],
+        options["steps"],
+        prompt=options["prompt"],
+        negative_prompt=options["negative_prompt"],
+        client=client,
+        tile_size=options.get("tile_size", tiling.DEFAULT_TILE_SIZE),
+        seamless=options.get("seamless", False),
+        working_area=options.get("working_area", resolution.DEFAULT_AREA),
+    )
+    return str(enhanced_path) if enhanced_path else None
+
+
+def _upscale_job(png_path, role, work_dir, wrap=False):
+    """
+    Upscale a normal map or mask on the CPU instead of enhancing it (runs in a worker process).
+
+    Returns:
+        Path to the upscaled PNG, or None on failure
+    """
+    try:
+        upscaled = texture_roles.upscale(iio.imread(png_path), role, wrap=wrap)
+        upscaled_path = os.path.join(work_dir, os.path.splitext(os.path.basename(png_path))[0] + "_enhanced.png")
+        imageio.imwrite(upscaled_path, upscaled, format='png')
+        return upscaled_path
+    except Exception as e:
+        print(f"Error upscaling {png_path}: {str(e)}")
+        return None
+
+
+def _fanout_job(original_png, enhanced_png, png_path, work_dir):
+    """
+    Enhance a near-duplicate from its cluster representative's result (runs in a worker process).
+
+    Returns:
+        Path to the enhanced PNG, or None on failure
+    """
+    try:
+        enhanced = dedup.transfer_enhancement(iio.imread(original_png), iio.imread(enhanced_png),
+                                              iio.imread(png_path))
+        enhanced_path = os.path.join(work_dir, os.path.splitext(os.path.basename(png_path))[0] + "_enhanced.png")
+        imageio.imwrite(enhanced_path, enhanced, format='png')
+        return enhanced_path
+    except Exception as e:
+        print(f"Error applying duplicate enhancement to {png_path}: {str(e)}")
+        return None
+
+
+def _encode_job(png_path, meta_path, output_path, quality):
+    """
+    Re-encode one texture in its original format (runs in a worker process).
+
+    Returns:
+        Output path, or None on failure
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    converter = AssetConverter(dds_quality=quality, temp_dir=os.path.dirname(png_path))
+    original_format = os.path.splitext(output_path)[1][1:]
+    result = converter.convert_from_png(png_path, original_format, meta_path, output_path)
+    return str(result) if result else None
+
+
+class RemasterJob:
+    def __init__(self, source, output_dir, workers=None, sd_concurrency=2, enhance=True,
+                 quality="fast", options=None, retry_failed=False, sd_batch_size=1, cache=True,
+                 dedup_threshold=dedup.DEFAULT_THRESHOLD, atlas_size=None, route_roles=True):
+        """
+        Pipelined batch job with a resumable manifest.
+
+        Decode and encode run in a process pool; Stable Diffusion calls run in a thread
+        pool capped at sd_concurrency requests in flight.
+
+        With deduplication on, decoded textures are clustered a window at a time, and
+        against the representatives of earlier windows, while decoding continues. One
+        representative per cluster goes to Stable Diffusion, and its result is fanned
+        out to the other members: copied for identical pixels, transferred onto
+        recolors and LOD copies.
+
+        With role routing on, each texture is classified when decoded. Normal maps and
+        masks skip Stable Diffusion (and deduplication) and are upscaled on the CPU.
+
+        Args:
+            source: Folder path or <name>_dir.vpk path
+            output_dir: Folder for the remastered textures, work files and manifest
+            workers: Number of decode/encode processes (None uses all cores)
+            sd_concurrency: Maximum concurrent Stable Diffusion requests per WebUI
+            enhance: Whether to run the Stable Diffusion stage
+            quality: Block compression quality ('fast' or 'high')
+            options: Stable Diffusion parameters (prompt, negative_prompt,
+                denoising_strength, cfg_scale, steps, tile_size, seamless, working_area)
+            retry_failed: Retry textures recorded as failed by a previous run
+            sd_batch_size: Images per img2img request; textures with matching parameters
+                and size are grouped into batched requests when above 1
+            cache: Answer repeated requests from the on-disk enhancement cache
+            dedup_threshold: Maximum differing hash bits (of 64) for perceptual
+                duplicates; 0 clusters exact duplicates only, None disables deduplication
+            atlas_size: Pack small textures into atlases of this size (pixels), one
+                img2img request per atlas; None sends every texture on its own
+            route_roles: Keep normal maps and masks out of Stable Diffusion
+        """
+        self.source = source
+        self.output_dir = output_dir
+        self.work_root = os.path.join(output_dir, "work")
+        self.workers = workers or os.cpu_count() or 1
+        self.sd_concurrency = max(1, sd_concurrency)
+        self.enhance = enhance
+        self.quality = quality
+        self.options = dict(options or {})
+        self.retry_failed = retry_failed
+        self.sd_batch_size = max(1, sd_batch_size)
+        self.cache = cache
+        self.dedup_threshold = dedup_threshold
+        self.dedup = enhance and dedup_threshold is not None
+        self.route_roles = enhance and route_roles
+        self.atlas_size = atlas_size if enhance else None
+        if self.atlas_size:
+            self.options.setdefault("working_area", ATLAS_WORKING_AREA)
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        os.makedirs(self.work_root, exist_ok=True)
+
+        # One keep-alive connection per concurrent Stable Diffusion request
+        if enhance:
+            sd_client.configure(max_concurrency=self.sd_concurrency)
+
+    def _record(self, rel, stage, **fields):
+        """
+        Append a state change to the manifest (flushed so a crash loses at most one line).
+        """
+        record = {"texture": rel, "stage": stage, "time": time.time(), **fields}
+        self._manifest.write(json.dumps(record) + "\n")
+        self._manifest.flush()
+        self.state[rel] = record
+
+    def _output_path(self, rel):
+        return os.path.join(self.output_dir, rel)
+
+    def run(self):
+        """
+        Run (or resume) the job.
+
+        Returns:
+            Dictionary with counts of done, failed and skipped textures
+        """
+        self.state = load_manifest(self.manifest_path)
+        textures = find_textures(self.source)
+        counts = {"done": 0, "failed": 0, "skipped": 0, "duplicates": 0, "cpu": 0}
+
+        # Resume each texture from its last completed stage
+        queue = []
+        for rel in textures:
+            record = self.state.get(rel)
+            stage = record["stage"] if record else None
+            if stage == STAGE_DONE or (stage == STAGE_FAILED and not self.retry_failed):
+                counts["skipped"] += 1
+                continue
+            if stage == STAGE_ENHANCED and not os.path.exists(record["enhanced"]):
+                stage = STAGE_DECODED
+            if stage == STAGE_DECODED and not os.path.exists(record["png"]):
+                stage = None
+            queue.append((rel, stage if stage in (STAGE_DECODED, STAGE_ENHANCED) else None))
+        queue.reverse()
+
+        # Enough SD threads to fill every batch of every concurrent request, on every backend
+        sd_threads = (sd_client.get_client().max_concurrency if self.enhance else self.sd_concurrency) \
+            * self.sd_batch_size
+        dispatcher = sd_batch.BatchDispatcher(max_batch_size=self.sd_batch_size) \
+            if self.enhance and self.sd_batch_size > 1 else None
+        sd = dispatcher or sd_client.get_client()
+        packer = None
+        if self.atlas_size:
+            sd_threads *= ATLAS_THREADS
+            sd = packer = atlas.AtlasDispatcher(sd, atlas_size=self.atlas_size)
+        if self.enhance and self.cache:
+            sd = enhance_cache.CachedClient(sd)
+
+        # Bound the number of decoded-but-unfinished textures held on disk / in flight
+        max_in_flight = self.workers * 2 + sd_threads * 2
+        pending = {}
+
+        # Deduplication: decoded textures wait in parked until a window is clustered; the
+        # members of each cluster wait in followers until their representative is enhanced
+        window = max(1, min(DEDUP_WINDOW, max_in_flight // 2))
+        index = dedup.ClusterIndex(self.dedup_threshold)
+        parked = []
+        clustered = set()
+        followers = {}
+        duplicate_of = {}
+        digests = {}
+        enhanced = {}
+        dedup_stats = {"textures": 0, "clusters": 0}
+
+        with open(self.manifest_path, "a", encoding="utf-8") as self._manifest, \
+                ProcessPoolExecutor(max_workers=self.workers) as cpu_pool, \
+                ThreadPoolExecutor(max_workers=sd_threads) as sd_pool:
+
+            def submit(rel, stage):
+                record = self.state.get(rel, {})
+                if stage is None:
+                    future = cpu_pool.submit(_decode_job, self.source, rel, self.work_root, self.dedup,
+                                             self.route_roles)
+                    pending[future] = (rel, STAGE_DECODED)
+                elif stage == STAGE_DECODED and self.route_roles \
+                        and record.get("role", texture_roles.ROLE_ALBEDO) != texture_roles.ROLE_ALBEDO:
+                    future = cpu_pool.submit(_upscale_job, record["png"], record["role"],
+                                             _work_dir(self.work_root, rel), self.options.get("seamless", False))
+                    pending[future] = (rel, STAGE_ENHANCED)
+                    counts["cpu"] += 1
+                elif stage == STAGE_DECODED and self.enhance and self.dedup and rel not in clustered:
+                    parked.append(rel)
+                elif stage == STAGE_DECODED and self.enhance:
+                    future = sd_pool.submit(_enhance_job, record["png"], _work_dir(self.work_root, rel),
+                                            self.options, sd)
+                    pending[future] = (rel, STAGE_ENHANCED)
+                else:
+                    png_path = record["enhanced"] if stage == STAGE_ENHANCED else record["png"]
+                    future = cpu_pool.submit(_encode_job, png_path, record["meta"], self._output_path(rel), self.quality)
+                    pending[future] = (rel, STAGE_DONE)
+
+            def release_clusters():
+                prints = {rel: self.state[rel]["fingerprint"] for rel in parked if self.state[rel].get("fingerprint")}
+                digests.update((rel, fingerprint["digest"]) for rel, fingerprint in prints.items())
+                clusters, joined = index.add(prints)
+                clusters += [[rel] for rel in parked if rel not in prints]
+                dedup_stats["textures"] += len(parked)
+                dedup_stats["clusters"] += len(clusters)
+                parked.clear()
+                for cluster in clusters:
+                    clustered.update(cluster)
+                    if len(cluster) > 1:
+                        followers[cluster[0]] = cluster[1:]
+                        counts["duplicates"] += len(cluster) - 1
+                    submit(cluster[0], STAGE_DECODED)
+                # Duplicates of a representative from an earlier window
+                for member, rel in joined.items():
+                    clustered.add(member)
+                    if rel in enhanced:
+                        counts["duplicates"] += 1
+                        fan_out_member(rel, member)
+                    elif self.state[rel]["stage"] == STAGE_FAILED:
+                        submit(member, STAGE_DECODED)
+                    else:
+                        counts["duplicates"] += 1
+                        followers.setdefault(rel, []).append(member)
+
+            def fan_out_member(rel, member):
+                png_path, enhanced_path = enhanced[rel]
+                duplicate_of[member] = rel
+                member_record = self.state[member]
+                if digests[member] == digests[rel]:
+                    # Identical pixels: reuse the enhanced PNG as is
+                    self._record(member, STAGE_ENHANCED, png=member_record["png"], meta=member_record["meta"],
+                                 enhanced=enhanced_path, duplicate_of=rel)
+                    submit(member, STAGE_ENHANCED)
+                else:
+                    future = cpu_pool.submit(_fanout_job, png_path, enhanced_path, member_record["png"],
+                                             _work_dir(self.work_root, member))
+                    pending[future] = (member, STAGE_ENHANCED)
+
+            def fan_out(rel, png_path, enhanced_path):
+                if rel in clustered and rel not in duplicate_of:
+                    enhanced[rel] = (png_path, enhanced_path)
+                for member in followers.pop(rel, []):
+                    fan_out_member(rel, member)
+
+            while queue or pending or parked:
+                # Parked textures and waiting cluster members count as in flight too
+                waiting = sum(map(len, followers.values()))
+                while queue and len(pending) + len(parked) + waiting < max_in_flight:
+                    submit(*queue.pop())
+
+                # Cluster a full window, or the rest once every texture is decoded
+                if parked and (len(parked) >= window
+                               or not queue and all(stage != STAGE_DECODED for _, stage in pending.values())):
+                    release_clusters()
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    rel, stage = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result, error = None, str(e)
+                    else:
+                        error = None
+
+                    if stage == STAGE_DECODED and result and result[0]:
+                        fingerprint = {"fingerprint": result[2]} if result[2] else {}
+                        role = {"role": result[3]} if result[3] else {}
+                        self._record(rel, STAGE_DECODED, png=result[0], meta=result[1], **fingerprint, **role)
+                        submit(rel, STAGE_DECODED)
+                    elif stage == STAGE_ENHANCED and result:
+                        source = {"duplicate_of": duplicate_of[rel]} if rel in duplicate_of else {}
+                        png_path = self.state[rel]["png"]
+                        self._record(rel, STAGE_ENHANCED, png=png_path,
+                                     meta=self.state[rel]["meta"], enhanced=result, **source)
+                        submit(rel, STAGE_ENHANCED)
+                        fan_out(rel, png_path, result)
+                    elif stage == STAGE_DONE and result:
+                        self._record(rel, STAGE_DONE, output=result)
+                        counts["done"] += 1
+                        print(f"[✓] {rel}")
+                    else:
+                        self._record(rel, STAGE_FAILED, failed_stage=stage, error=error)
+                        counts["failed"] += 1
+                        print(f"[!] {rel}: {stage} failed" + (f" ({error})" if error else ""))
+                        # Members of a failed representative are enhanced on their own
+                        for member in followers.pop(rel, []):
+                            counts["duplicates"] -= 1
+                            submit(member, STAGE_DECODED)
+        if dedup_stats["textures"]:
+            print(f"Deduplication: {dedup_stats['clusters']} of {dedup_stats['textures']} textures "
+                  f"need Stable Diffusion")
+        if packer:
+            packer.close()
+            stats = packer.stats
+            print(f"Atlases: {stats['packed']} textures in {stats['atlases']} requests, "
+                  f"{stats['passthrough']} sent on their own")
+        if dispatcher:
+            dispatcher.close()
+        if self.enhance and self.cache:
+            stats = sd.cache.stats()
+            print(f"Enhancement cache: {stats['hits']} hits, {stats['misses']} misses")
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch remaster DDS/VTF textures from a folder or VPK.")
+    parser.add_argument("source", help="Folder of textures or <name>_dir.vpk")
+    parser.add_argument("output_dir", help="Folder for remastered textures, work files and the manifest")
+    parser.add_argument("--workers", type=int, default=None, help="Decode/encode processes (default: all cores)")
+    parser.add_argument("--sd-concurrency", type=int, default=2, help="Concurrent Stable Diffusion requests per WebUI")
+    parser.add_argument("--sd-batch-size", type=int, default=1,
+                        help="Images per img2img request (textures sharing parameters and size are batched)")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the WebUI, bypassing the enhancement cache")
+    parser.add_argument("--no-enhance", action="store_true", help="Only decode and re-encode")
+    parser.add_argument("--atlas", action="store_true",
+                        help="Pack small textures into shared canvases, one img2img request per atlas")
+    parser.add_argument("--atlas-size", type=int, default=atlas.DEFAULT_ATLAS_SIZE, help="Atlas canvas edge in pixels")
+    parser.add_argument("--no-dedup", action="store_true", help="Enhance every texture, even exact duplicates")
+    parser.add_argument("--dedup-threshold", type=int, default=dedup.DEFAULT_THRESHOLD,
+                        help="Maximum differing hash bits (of 64) for near-duplicates; 0 merges exact duplicates only")
+    parser.add_argument("--no-role-routing", action="store_true",
+                        help="Send normal maps and masks through Stable Diffusion too, instead of upscaling them on the CPU")
+    parser.add_argument("--quality", choices=["fast", "high"], default="fast", help="Block compression quality")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry textures that failed in a previous run")
+    parser.add_argument("--prompt", default="semi-realistic pixel art remaster, detailed, high-res")
+    parser.add_argument("--negative-prompt", default="")
+    parser.add_argument("--denoising-strength", type=float, default=0.25)
+    parser.add_argument("--cfg-scale", type=float, default=4)
+    parser.add_argument("--steps", type=int, default=40)
+    parser.add_argument("--tile-size", type=int, default=tiling.DEFAULT_TILE_SIZE,
+                        help="Textures larger than this are enhanced as overlapping tiles")
+    parser.add_argument("--seamless", action="store_true", help="Keep tileable textures seamless across edges")
+    parser.add_argument("--working-size", type=int,
+                        help="Untiled textures are resized to about this many pixels squared, in multiples of 64, "
+                             "for SD and back afterwards (default: 512, or 256 with --atlas; 0 keeps their size)")
+    args = parser.parse_args()
+
+    job = RemasterJob(
+        args.source,
+        args.output_dir,
+        workers=args.workers,
+        sd_concurrency=args.sd_concurrency,
+        enhance=not args.no_enhance,
+        quality=args.quality,
+        options={
+            "prompt": args.prompt,
+            "negative_prompt": args.negative_prompt,
+            "denoising_strength": args.denoising_strength,
+            "cfg_scale": args.cfg_scale,
+            "steps": args.steps,
+            "tile_size": args.tile_size,
+            "seamless": args.seamless,
+            **({"working_area": args.working_size ** 2} if args.working_size is not None else {}),
+        },
+        retry_failed=args.retry_failed,
+        sd_batch_size=args.sd_batch_size,
+        cache=not args.no_cache,
+        dedup_threshold=None if args.no_dedup else args.dedup_threshold,
+        atlas_size=args.atlas_size if args.atlas else None,
+        route_roles=not args.no_role_routing,
+    )
+    counts = job.run()
+    print(f"✅ {counts['done']} remastered, {counts['failed']} failed, {counts['skipped']} already done.")
+    if counts["duplicates"]:
+        print(f"🔁 {counts['duplicates']} duplicates reused another texture's enhancement.")
+    if counts["cpu"]:
+        print(f"🧭 {counts['cpu']} normal maps and masks were upscaled on the CPU instead of by Stable Diffusion.")
+
+
+if __name__ == "__main__":
+    main()
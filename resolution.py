@@ -0,0 +1,94 @@
+"""SD-native working resolutions: textures snapped to multiples of 64 within an area budget."""
+import math
+
+import numpy as np
+
+from mipmaps import resize
+
+# Stable Diffusion 1.x works best around 512x512; sides are multiples of the 64-pixel grid
+DEFAULT_AREA = 512 * 512
+MULTIPLE = 64
+DEFAULT_MAX_SIDE = 1024
+
+# Tiny sprites are not blown up past this factor (a 16x16 icon is worked on at 128x128)
+DEFAULT_MAX_UPSCALE = 8
+
+
+def plan_resolution(width, height, area=DEFAULT_AREA, multiple=MULTIPLE, max_side=DEFAULT_MAX_SIDE,
+                    max_upscale=DEFAULT_MAX_UPSCALE):
+    """
+    Working resolution for sending a texture to Stable Diffusion.
+
+    The texture is scaled up or down so its area meets the budget, then each side is
+    snapped to the grid. Of the nearby grid sizes, the one that keeps the aspect
+    ratio best without exceeding the budget wins (the larger one breaks ties), so
+    wide strips stay wide instead of being squeezed into a square.
+
+    Args:
+        width: Texture width
+        height: Texture height
+        area: Target area in pixels
+        multiple: Grid both sides snap to
+        max_side: Longest side allowed
+        max_upscale: Largest scale factor applied to small textures
+
+    Returns:
+        Tuple of (width, height)
+    """
+    scale = min(math.sqrt(area / (width * height)), max_side / max(width, height), max_upscale)
+    largest = max(multiple, max_side // multiple * multiple)
+
+    def snaps(value):
+        low = max(multiple, min(largest, math.floor(value / multiple) * multiple))
+        high = max(multiple, min(largest, math.ceil(value / multiple) * multiple))
+        return {low, high}
+
+    candidates = [(w, h) for w in snaps(width * scale) for h in snaps(height * scale)]
+    within = [size for size in candidates if size[0] * size[1] <= area] or \
+        [min(candidates, key=lambda size: size[0] * size[1])]
+    aspect = width / height
+    return min(within, key=lambda size: (abs(math.log(size[0] / size[1] / aspect)), -size[0] * size[1]))
+
+
+def to_working(image, area=DEFAULT_AREA, multiple=MULTIPLE, max_side=DEFAULT_MAX_SIDE,
+               max_upscale=DEFAULT_MAX_UPSCALE):
+    """
+    Resize a texture to its planned working resolution.
+
+    Args:
+        image: uint8 array (H, W[, C])
+        area, multiple, max_side, max_upscale: See plan_resolution
+
+    Returns:
+        uint8 array at the working resolution (the input itself if already there)
+    """
+    width, height = plan_resolution(image.shape[1], image.shape[0], area, multiple, max_side, max_upscale)
+    return resize(image, width, height)
+
+
+def restore(enhanced, original):
+    """
+    Bring an enhanced working-resolution image back to the original's exact size.
+
+    Alpha is taken from the original, since Stable Diffusion returns RGB only.
+
+    Args:
+        enhanced: uint8 RGB(A) array returned by Stable Diffusion
+        original: uint8 array the texture had before to_working
+
+    Returns:
+        uint8 array with the original's height, width and channel count
+    """
+    height, width = original.shape[:2]
+    enhanced = resize(np.asarray(enhanced)[..., :3], width, height)
+    channels = 1 if original.ndim == 2 else original.shape[2]
+    if channels < 3:
+        # Grey in, grey out
+        grey = np.round(enhanced.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32))
+        enhanced = grey.astype(np.uint8)
+        if original.ndim == 2:
+            return enhanced
+        enhanced = enhanced[..., None]
+    if channels in (2, 4):
+        return np.dstack([enhanced, original[..., -1]])
+    return enhanced
@@ -0,0 +1,214 @@
+"""Batched img2img dispatch: jobs sharing parameters go to the WebUI in one request."""
+import json
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from sd_client import get_client
+
+DEFAULT_BATCH_SIZE = 4
+
+# How long a partly filled bucket waits for more jobs before it is sent (seconds)
+DEFAULT_MAX_WAIT = 0.05
+
+
+def _image_size(image):
+    """
+    Width and height from a PNG's IHDR chunk, without decoding the image.
+
+    Returns:
+        Tuple of (width, height), or None if the data is not a PNG
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)) and bytes(image[:8]) == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", bytes(image[16:24]))
+    return None
+
+
+def _checkpoint(params):
+    """
+    Checkpoint requested through override_settings (None means the loaded one).
+    """
+    return (params.get("override_settings") or {}).get("sd_model_checkpoint")
+
+
+def bucket_key(image, prompt, negative_prompt, denoising_strength, cfg_scale, steps, params):
+    """
+    Key of the batch a job can join: everything that has to match inside one request.
+
+    Args:
+        image: PNG bytes of the init image
+        prompt, negative_prompt, denoising_strength, cfg_scale, steps: img2img parameters
+        params: Extra img2img parameters (size, sampler, override_settings, alwayson_scripts...)
+
+    Returns:
+        Tuple of (checkpoint, image size, canonical parameter string)
+    """
+    shared = dict(params, prompt=prompt, negative_prompt=negative_prompt,
+                  denoising_strength=denoising_strength, cfg_scale=cfg_scale, steps=steps)
+    return _checkpoint(params), _image_size(image), json.dumps(shared, sort_keys=True, default=str)
+
+
+class BatchDispatcher:
+    def __init__(self, client=None, max_batch_size=DEFAULT_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT):
+        """
+        Collect img2img jobs and send them as batched requests.
+
+        Pending jobs are bucketed by prompt, parameters, image size and checkpoint /
+        extension settings. Buckets on the currently loaded checkpoint are sent first
+        so the WebUI switches models as rarely as possible.
+
+        Has the same img2img signature as SDClient, so it can stand in for one.
+
+        Args:
+            client: SDClient to send batches through (defaults to the shared one)
+            max_batch_size: Maximum images per request
+            max_wait: Seconds a partly filled bucket waits for more jobs
+        """
+        self.client = client or get_client()
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._buckets = {}
+        self._condition = threading.Condition()
+        self._checkpoint = None
+        self._closed = False
+        self.stats = {"jobs": 0, "requests": 0, "checkpoint_switches": 0}
+
+        # The client's semaphore caps the requests actually in flight
+        self._senders = ThreadPoolExecutor(max_workers=self.client.max_concurrency)
+        self._thread = threading.Thread(target=self._run, name="sd-batch-dispatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4, steps=40,
+               **params):
+        """
+        Queue one img2img job.
+
+        Args:
+            image: PNG bytes of the init image
+            prompt: Prompt for Stable Diffusion
+            negative_prompt: Negative prompt for Stable Diffusion
+            denoising_strength: Strength of enhancement (0.0 to 1.0)
+            cfg_scale: CFG scale for prompt adherence
+            steps: Number of diffusion steps
+            **params: Extra img2img parameters passed through to the API
+
+        Returns:
+            Future resolving to the PNG bytes of the enhanced image
+        """
+        future = Future()
+        key = bucket_key(image, prompt, negative_prompt, denoising_strength, cfg_scale, steps, params)
+        args = (prompt, negative_prompt, denoising_strength, cfg_scale, steps, params)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("BatchDispatcher is closed")
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = {"since": time.monotonic(), "args": args, "jobs": []}
+            bucket["jobs"].append((image, future))
+            self.stats["jobs"] += 1
+            self._condition.notify()
+        return future
+
+    def img2img(self, image, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4, steps=40,
+                **params):
+        """
+        Blocking img2img through the batcher (drop-in for SDClient.img2img).
+
+        Returns:
+            PNG bytes of the enhanced image
+        """
+        return self.submit(image, prompt, negative_prompt, denoising_strength, cfg_scale, steps,
+                           **params).result()
+
+    def _on_checkpoint(self, key):
+        """
+        Whether a bucket runs without loading another checkpoint.
+        """
+        return key[0] is None or key[0] == self._checkpoint
+
+    def _next_bucket(self):
+        """
+        Pick the bucket to send next, or how long to wait for one to become ready.
+
+        A bucket is ready when it is full, has waited max_wait, or the dispatcher is
+        closing. Among ready buckets, those on the current checkpoint come first, then
+        the oldest. Before switching checkpoints, any bucket still queued on the
+        current one is sent, even if it is not full.
+
+        Returns:
+            Tuple of (key or None, seconds to wait)
+        """
+        now = time.monotonic()
+        ready = []
+        wait = None
+        for key, bucket in self._buckets.items():
+            remaining = bucket["since"] + self.max_wait - now
+            if self._closed or len(bucket["jobs"]) >= self.max_batch_size or remaining <= 0:
+                ready.append(key)
+            else:
+                wait = remaining if wait is None else min(wait, remaining)
+        if not ready:
+            return None, wait
+
+        key = min(ready, key=lambda key: (not self._on_checkpoint(key), self._buckets[key]["since"]))
+        if not self._on_checkpoint(key):
+            current = [key for key in self._buckets if self._on_checkpoint(key)]
+            if current:
+                key = min(current, key=lambda key: self._buckets[key]["since"])
+        return key, 0
+
+    def _run(self):
+        while True:
+            with self._condition:
+                key, wait = self._next_bucket()
+                while key is None:
+                    if self._closed and not self._buckets:
+                        return
+                    self._condition.wait(wait)
+                    key, wait = self._next_bucket()
+
+                # Take up to one batch; the rest of the bucket stays queued
+                bucket = self._buckets[key]
+                jobs = bucket["jobs"][:self.max_batch_size]
+                del bucket["jobs"][:self.max_batch_size]
+                if not bucket["jobs"]:
+                    del self._buckets[key]
+
+                if not self._on_checkpoint(key):
+                    if self._checkpoint is not None:
+                        self.stats["checkpoint_switches"] += 1
+                    self._checkpoint = key[0]
+                self.stats["requests"] += 1
+            self._senders.submit(self._send, bucket["args"], jobs)
+
+    def _send(self, args, jobs):
+        """
+        Send one batch and hand each result back to its caller.
+        """
+        prompt, negative_prompt, denoising_strength, cfg_scale, steps, params = args
+        try:
+            images = self.client.img2img_batch([image for image, _ in jobs], prompt, negative_prompt,
+                                               denoising_strength, cfg_scale, steps, **params)
+        except Exception as e:
+            for _, future in jobs:
+                future.set_exception(e)
+            return
+        for (_, future), image in zip(jobs, images):
+            future.set_result(image)
+
+    def close(self):
+        """
+        Send everything still queued and stop the dispatcher.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self._senders.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
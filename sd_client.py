@@ -0,0 +1,863 @@
+"""Pooled keep-alive client for the Stable Diffusion WebUI API."""
+import asyncio
+import base64
+import binascii
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+
+# Defaults, overridable through the environment (SD_WEBUI_URL may list several
+# comma-separated WebUI instances, which are then load-balanced)
+DEFAULT_BASE_URL = os.environ.get("SD_WEBUI_URL", "http://127.0.0.1:7860")
+DEFAULT_TIMEOUT = float(os.environ.get("SD_WEBUI_TIMEOUT", "300"))
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get("SD_WEBUI_CONNECT_TIMEOUT", "5"))
+DEFAULT_CONCURRENCY = int(os.environ.get("SD_WEBUI_CONCURRENCY", "2"))
+DEFAULT_HEALTH_INTERVAL = float(os.environ.get("SD_WEBUI_HEALTH_INTERVAL", "5"))
+
+# Model identity in enhancement cache keys: SD_WEBUI_MODEL (e.g. the checkpoint name) if
+# set, else the WebUI address, or a fixed name for a pool so adding a box keeps the cache
+DEFAULT_MODEL = os.environ.get("SD_WEBUI_MODEL")
+POOL_MODEL = "webui-pool"
+
+IMG2IMG_PATH = "/sdapi/v1/img2img"
+TASK_PROGRESS_PATH = "/internal/progress"
+PROGRESS_PATH = "/sdapi/v1/progress"
+INTERRUPT_PATH = "/sdapi/v1/interrupt"
+HEALTH_PATH = "/internal/ping"
+
+# Raw bytes base64-encoded per request body chunk (a multiple of 3, so chunks concatenate
+# without padding) and bytes read per response chunk
+REQUEST_CHUNK_SIZE = 3 * 16384
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+# Seconds between progress polls, and the timeout of those control requests
+DEFAULT_POLL_INTERVAL = 1.0
+CONTROL_TIMEOUT = 5
+
+# Weight of the newest request in a backend's moving average of request latency
+LATENCY_SMOOTHING = 0.3
+
+_DEFAULT_CLIENT = None
+_DEFAULT_CLIENT_LOCK = threading.Lock()
+
+# ProgressTracker of the current context; img2img requests sent inside it are tracked
+_TRACKER = contextvars.ContextVar("sd_progress_tracker", default=None)
+
+
+class JobCancelled(RuntimeError):
+    """Raised by img2img when its ProgressTracker was cancelled."""
+
+
+class BackendUnavailable(RuntimeError):
+    """Raised by SDPool when every backend has failed a request."""
+
+
+def backend_urls(base_url=None):
+    """
+    Split a WebUI address setting into backend URLs.
+
+    Args:
+        base_url: One address, a comma-separated list, or a list (default: SD_WEBUI_URL)
+
+    Returns:
+        List of URLs without trailing slashes
+    """
+    urls = base_url or DEFAULT_BASE_URL
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    return [url.strip().rstrip("/") for url in urls if url.strip()]
+
+
+class ImageRequestBody:
+    def __init__(self, payload, images, field="init_images"):
+        """
+        JSON request body whose images are base64-encoded chunk by chunk while it is sent.
+
+        Only the PNG bytes are held in memory; no base64 or JSON copy of them is built.
+        The body has a length, so requests sends a Content-Length header rather than
+        chunked transfer encoding, and it can be iterated again if a request is retried.
+
+        Args:
+            payload: JSON-serializable parameters (without the images)
+            images: List of PNG bytes, or base64 strings
+            field: Name of the image list in the JSON body
+        """
+        head = json.dumps(payload)[:-1]
+        separator = ", " if payload else ""
+        self._parts = [(False, f'{head}{separator}"{field}": ['.encode("utf-8"))]
+        for index, image in enumerate(images):
+            if isinstance(image, str):
+                self._parts.append((False, f'{", " if index else ""}"{image}"'.encode("utf-8")))
+                continue
+            self._parts.append((False, b', "' if index else b'"'))
+            self._parts.append((True, memoryview(image).cast("B")))
+            self._parts.append((False, b'"'))
+        self._parts.append((False, b"]}"))
+
+    def __len__(self):
+        return sum((len(part) + 2) // 3 * 4 if encode else len(part) for encode, part in self._parts)
+
+    def __iter__(self):
+        for encode, part in self._parts:
+            if not encode:
+                yield part
+                continue
+            for start in range(0, len(part), REQUEST_CHUNK_SIZE):
+                yield binascii.b2a_base64(part[start:start + REQUEST_CHUNK_SIZE], newline=False)
+
+
+class ImageResponseDecoder:
+    def __init__(self, field="images", expected_size=None):
+        """
+        Incremental parser of a JSON response that decodes its base64 images on the fly.
+
+        Feed it the response body chunk by chunk. The strings of the top-level image
+        list are decoded straight into a buffer preallocated from the response size,
+        so the base64 text is never held; each image is handed out as bytes once its
+        string ends. The rest of the document (parameters, info) is small and parsed
+        with json at the end.
+
+        Args:
+            field: Name of the top-level image list
+            expected_size: Response size in bytes (Content-Length), used to size the
+                image buffers; without it they grow as needed
+        """
+        self.field = field.encode("utf-8")
+        self.remaining = expected_size
+        self.images = []
+        self._rest = bytearray()
+        self._mode = "scan"
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key_start = 0
+        self._key = None
+        self._image = None
+        self._size = 0
+        self._pending = b""
+
+    def feed(self, data):
+        """
+        Parse the next chunk of the response body.
+        """
+        if self.remaining is not None:
+            self.remaining -= len(data)
+        position = 0
+        while position < len(data):
+            if self._mode == "image":
+                position = self._feed_image(data, position)
+                continue
+            byte = data[position]
+            position += 1
+            if self._mode == "array":
+                # Between image strings: whitespace and commas until the closing bracket
+                if byte == 0x22:
+                    self._start_image()
+                elif byte == 0x5D:
+                    self._mode = "scan"
+                continue
+            if self._mode == "value":
+                if byte in b" \t\r\n":
+                    continue
+                if byte == 0x5B:
+                    # The images are kept out of the JSON text; an empty list holds their place
+                    self._rest += b"[]"
+                    self._mode = "array"
+                    continue
+                self._mode = "scan"
+            self._scan(byte)
+
+    def _scan(self, byte):
+        self._rest.append(byte)
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif byte == 0x5C:
+                self._escape = True
+            elif byte == 0x22:
+                self._in_string = False
+                if self._expect_key:
+                    self._key = bytes(self._rest[self._key_start:-1])
+                    self._expect_key = False
+        elif byte == 0x22:
+            self._in_string = True
+            self._key_start = len(self._rest)
+        elif byte == 0x7B or byte == 0x5B:
+            self._depth += 1
+            self._expect_key = byte == 0x7B and self._depth == 1
+        elif byte == 0x7D or byte == 0x5D:
+            self._depth -= 1
+        elif self._depth == 1 and byte == 0x2C:
+            self._expect_key = True
+        elif self._depth == 1 and byte == 0x3A and self._key == self.field:
+            self._mode = "value"
+
+    def _start_image(self):
+        capacity = self.remaining * 3 // 4 if self.remaining else 0
+        self._image = bytearray(capacity)
+        self._size = 0
+        self._pending = b""
+        self._mode = "image"
+
+    def _feed_image(self, data, position):
+        end = data.find(b'"', position)
+        self._decode(data[position:end if end >= 0 else len(data)])
+        if end < 0:
+            return len(data)
+        if self._pending:
+            self._write(binascii.a2b_base64(self._pending + b"=" * (-len(self._pending) % 4)))
+        # Hand out immutable bytes of the decoded size; the working buffer is dropped
+        with memoryview(self._image) as view:
+            self.images.append(bytes(view[:self._size]))
+        self._image = None
+        self._mode = "array"
+        return end + 1
+
+    def _decode(self, segment):
+        text = self._pending + segment
+        if b"\\" in text:
+            # JSON may escape '/' as '\/'
+            text = text.replace(b"\\/", b"/")
+        usable = len(text) - len(text) % 4
+        if text.endswith(b"\\"):
+            # An escape split across chunks waits for the next one
+            usable = (len(text) - 1) // 4 * 4
+        self._pending = text[usable:]
+        if usable:
+            self._write(binascii.a2b_base64(text[:usable]))
+
+    def _write(self, decoded):
+        end = self._size + len(decoded)
+        if end > len(self._image):
+            self._image.extend(bytes(end - len(self._image)))
+        self._image[self._size:end] = decoded
+        self._size = end
+
+    def result(self):
+        """
+        Finish parsing.
+
+        Returns:
+            The JSON document, with the image list holding bytes of decoded images
+
+        Raises:
+            ValueError: If the response was truncated or is not valid JSON
+        """
+        if self._mode != "scan" or self._depth or self._in_string:
+            raise ValueError("Truncated img2img response")
+        document = json.loads(bytes(self._rest))
+        if self.images or self.field.decode("utf-8") in document:
+            document[self.field.decode("utf-8")] = self.images
+        return document
+
+
+class SDClient:
+    def __init__(self, base_url=None, timeout=None, connect_timeout=None, max_concurrency=None,
+                 max_retries=2):
+        """
+        Stable Diffusion WebUI client over one pooled keep-alive session.
+
+        Args:
+            base_url: WebUI address (default: SD_WEBUI_URL or http://127.0.0.1:7860)
+            timeout: Read timeout in seconds for a generation request
+            connect_timeout: Connection timeout in seconds
+            max_concurrency: Maximum requests in flight; also the connection pool size
+            max_retries: Retries for failed connections (generation requests are not resent)
+        """
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip("/")
+        self.model = DEFAULT_MODEL or self.base_url
+        self.timeout = (connect_timeout or DEFAULT_CONNECT_TIMEOUT, timeout or DEFAULT_TIMEOUT)
+        self.max_concurrency = max(1, max_concurrency or DEFAULT_CONCURRENCY)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+        # Keep-alive connections are reused across calls and threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.max_concurrency,
+            max_retries=Retry(total=max_retries, connect=max_retries, read=0, backoff_factor=0.5,
+                              allowed_methods=None),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, path, payload):
+        """
+        POST a JSON payload to the WebUI and return the decoded JSON response.
+
+        Args:
+            path: API path (e.g. '/sdapi/v1/img2img')
+            payload: JSON-serializable request body
+
+        Returns:
+            Parsed JSON response
+        """
+        with metrics.span("sd_wait_slot"):
+            self._slots.acquire()
+        try:
+            with metrics.span("sd_http"):
+                response = self.session.post(self.base_url + path, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+        finally:
+            self._slots.release()
+        with metrics.span("sd_json_parse"):
+            return response.json()
+
+    def post_images(self, path, payload, images):
+        """
+        POST a request carrying images, streaming it out and the response back.
+
+        The images are base64-encoded while the body is sent, and the response images
+        are decoded as they arrive, so memory stays close to one copy of each image
+        instead of the several that building and parsing whole JSON strings takes.
+
+        Args:
+            path: API path (e.g. '/sdapi/v1/img2img')
+            payload: JSON-serializable parameters, without init_images
+            images: List of PNG bytes, or base64 strings, sent as init_images
+
+        Returns:
+            Parsed JSON response whose 'images' are bytes of decoded images
+        """
+        body = ImageRequestBody(payload, images)
+        with metrics.span("sd_wait_slot"):
+            self._slots.acquire()
+        try:
+            with metrics.span("sd_http"):
+                response = self.session.post(self.base_url + path, data=body, stream=True, timeout=self.timeout,
+                                             headers={"Content-Type": "application/json"})
+            try:
+                if response.status_code >= 400:
+                    # Error bodies are small: read them so raise_for_status can report them
+                    response.content
+                    response.raise_for_status()
+                with metrics.span("sd_response_decode"):
+                    length = response.headers.get("Content-Length")
+                    decoder = ImageResponseDecoder(expected_size=int(length) if length else None)
+                    for chunk in response.iter_content(RESPONSE_CHUNK_SIZE):
+                        decoder.feed(chunk)
+                    return decoder.result()
+            finally:
+                response.close()
+        finally:
+            self._slots.release()
+
+    def progress(self, task_id=None, live_preview=True):
+        """
+        Progress of a generation.
+
+        With a task ID, asks the WebUI about that request (sent with force_task_id);
+        servers without the task endpoint fall back to the global progress of whatever
+        is running. Control requests bypass the concurrency slots.
+
+        Args:
+            task_id: force_task_id of the request, or None for the running job
+            live_preview: Include the latest preview image
+
+        Returns:
+            Dictionary with active, queued, completed, progress (0-1), eta (seconds)
+            and preview (PNG bytes or None)
+        """
+        if task_id is not None:
+            response = self.session.post(self.base_url + TASK_PROGRESS_PATH, timeout=CONTROL_TIMEOUT,
+                                         json={"id_task": task_id, "id_live_preview": -1,
+                                               "live_preview": live_preview})
+            if response.status_code != 404:
+                response.raise_for_status()
+                info = response.json()
+                preview = info.get("live_preview")
+                return {
+                    "active": bool(info.get("active")),
+                    "queued": bool(info.get("queued")),
+                    "completed": bool(info.get("completed")),
+                    "progress": info.get("progress") or 0.0,
+                    "eta": info.get("eta"),
+                    "preview": base64.b64decode(preview.split(",", 1)[-1]) if preview else None,
+                }
+
+        response = self.session.get(self.base_url + PROGRESS_PATH, timeout=CONTROL_TIMEOUT,
+                                    params={"skip_current_image": str(not live_preview).lower()})
+        response.raise_for_status()
+        info = response.json()
+        state = info.get("state") or {}
+        preview = info.get("current_image")
+        return {
+            "active": bool(state.get("job_count")),
+            "queued": False,
+            "completed": False,
+            "progress": info.get("progress") or 0.0,
+            "eta": info.get("eta_relative"),
+            "preview": base64.b64decode(preview) if preview else None,
+        }
+
+    def interrupt(self):
+        """
+        Interrupt the generation running on the WebUI (it returns its partial result).
+        """
+        response = self.session.post(self.base_url + INTERRUPT_PATH, timeout=CONTROL_TIMEOUT)
+        response.raise_for_status()
+
+    def ping(self):
+        """
+        Cheap liveness probe that does not queue behind generations.
+
+        Returns:
+            Round-trip time in seconds
+
+        Raises:
+            requests.RequestException: If the WebUI does not answer
+        """
+        start = time.perf_counter()
+        response = self.session.get(self.base_url + HEALTH_PATH, timeout=CONTROL_TIMEOUT)
+        if response.status_code == 404:
+            # Builds without /internal/ping: progress without a preview is just as cheap
+            response = self.session.get(self.base_url + PROGRESS_PATH, timeout=CONTROL_TIMEOUT,
+                                        params={"skip_current_image": "true"})
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    def _tracked_post(self, payload, images):
+        """
+        POST an img2img payload, reporting it to the ProgressTracker of this context.
+        """
+        tracker = _TRACKER.get()
+        if tracker is None:
+            return self.post_images(IMG2IMG_PATH, payload, images)
+        tracker.check()
+        task_id = f"task({uuid.uuid4().hex})"
+        tracker.started(task_id, self)
+        try:
+            result = self.post_images(IMG2IMG_PATH, dict(payload, force_task_id=task_id), images)
+        finally:
+            tracker.finished(task_id)
+        # An interrupted generation comes back early with a partial image: discard it
+        tracker.check()
+        return result
+
+    def img2img(self, image, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4,
+                steps=40, **params):
+        """
+        Run img2img on one image.
+
+        Args:
+            image: PNG bytes, or a base64 string
+            prompt: Prompt for Stable Diffusion
+            negative_prompt: Negative prompt for Stable Diffusion
+            denoising_strength: Strength of enhancement (0.0 to 1.0)
+            cfg_scale: CFG scale for prompt adherence
+            steps: Number of diffusion steps
+            **params: Extra img2img parameters passed through to the API
+
+        Returns:
+            PNG bytes of the first generated image
+        """
+        payload = {
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "denoising_strength": denoising_strength,
+            "cfg_scale": cfg_scale,
+            "steps": steps,
+            **params,
+        }
+        return self._tracked_post(payload, [image])["images"][0]
+
+    def img2img_batch(self, images, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4,
+                      steps=40, **params):
+        """
+        Run img2img on several images in one request.
+
+        All images share the prompt and parameters; the WebUI generates one output
+        per init image.
+
+        Args:
+            images: List of PNG bytes or base64 strings
+            prompt: Prompt for Stable Diffusion
+            negative_prompt: Negative prompt for Stable Diffusion
+            denoising_strength: Strength of enhancement (0.0 to 1.0)
+            cfg_scale: CFG scale for prompt adherence
+            steps: Number of diffusion steps
+            **params: Extra img2img parameters passed through to the API
+
+        Returns:
+            List of PNG bytes, in the order of the input images
+        """
+        payload = {
+            "batch_size": len(images),
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "denoising_strength": denoising_strength,
+            "cfg_scale": cfg_scale,
+            "steps": steps,
+            **params,
+        }
+        # Extension outputs (e.g. ControlNet detect maps) follow the generated images
+        outputs = self._tracked_post(payload, images)["images"]
+        if len(outputs) < len(images):
+            raise ValueError(f"Expected {len(images)} images from img2img, got {len(outputs)}")
+        return outputs[:len(images)]
+
+    async def post_async(self, path, payload):
+        """
+        Async variant of post; runs on the pooled session in a worker thread.
+        """
+        return await asyncio.to_thread(self.post, path, payload)
+
+    async def img2img_async(self, image, prompt, negative_prompt="", denoising_strength=0.25,
+                            cfg_scale=4, steps=40, **params):
+        """
+        Async variant of img2img; concurrency is capped by max_concurrency.
+        """
+        return await asyncio.to_thread(self.img2img, image, prompt, negative_prompt,
+                                       denoising_strength, cfg_scale, steps, **params)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SDPool:
+    def __init__(self, base_urls=None, health_interval=None, model=None, **client_kwargs):
+        """
+        Several WebUI instances behind the SDClient interface.
+
+        Each request goes to the healthy backend expected to finish it first: the
+        number of request rounds queued on it (in-flight requests over its
+        concurrency) times its moving-average request latency. Backends without a
+        measurement yet count as the fastest, so a newly added box gets work at once.
+        A background thread pings every backend; one that refuses connections or
+        times out is taken out of rotation until a ping succeeds again, and the
+        request fails over to the next backend. Server errors (5xx) are retried on
+        another backend without marking the first one down.
+
+        Args:
+            base_urls: List or comma-separated string of WebUI addresses (default: SD_WEBUI_URL)
+            health_interval: Seconds between health probes
+            model: Model identity for enhancement cache keys (default: SD_WEBUI_MODEL or
+                POOL_MODEL); unlike the address list, it survives adding or removing a box
+            **client_kwargs: SDClient arguments applied to every backend (timeouts,
+                max_concurrency per backend, max_retries)
+        """
+        self.backends = [
+            {"client": SDClient(url, **client_kwargs), "healthy": True, "in_flight": 0, "latency": None,
+             "ping": None, "requests": 0, "failures": 0}
+            for url in backend_urls(base_urls)
+        ]
+        if not self.backends:
+            raise ValueError("SDPool needs at least one WebUI address")
+        self.base_url = ",".join(backend["client"].base_url for backend in self.backends)
+        self.model = model or DEFAULT_MODEL or POOL_MODEL
+        self.max_concurrency = sum(backend["client"].max_concurrency for backend in self.backends)
+        self.health_interval = health_interval or DEFAULT_HEALTH_INTERVAL
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._probes = ThreadPoolExecutor(max_workers=len(self.backends))
+        self._thread = threading.Thread(target=self._health_loop, name="sd-pool-health", daemon=True)
+        self._thread.start()
+
+    def _probe(self, backend):
+        try:
+            rtt = backend["client"].ping()
+        except requests.RequestException:
+            with self._lock:
+                backend["healthy"] = False
+            return False
+        with self._lock:
+            backend["healthy"] = True
+            backend["ping"] = rtt
+        return True
+
+    def check_health(self):
+        """
+        Ping every backend now.
+
+        Returns:
+            Number of healthy backends
+        """
+        return sum(self._probes.map(self._probe, self.backends))
+
+    def _health_loop(self):
+        while True:
+            self.check_health()
+            if self._stopped.wait(self.health_interval):
+                return
+
+    def _acquire(self, excluded):
+        """
+        Pick the backend for the next request and count it as in flight.
+        """
+        with self._lock:
+            candidates = [backend for backend in self.backends if id(backend) not in excluded]
+            if not candidates:
+                raise BackendUnavailable("All Stable Diffusion backends failed")
+            # Every backend down by the last probe: try them anyway, the probe may be stale
+            candidates = [backend for backend in candidates if backend["healthy"]] or candidates
+            measured = [backend["latency"] for backend in candidates if backend["latency"]]
+            fastest = min(measured) if measured else 1.0
+
+            def expected(backend):
+                rounds = backend["in_flight"] // backend["client"].max_concurrency + 1
+                return rounds * (backend["latency"] or fastest), backend["in_flight"]
+
+            backend = min(candidates, key=expected)
+            backend["in_flight"] += 1
+            return backend
+
+    def _release(self, backend, seconds=None, failed=False, down=False):
+        with self._lock:
+            backend["in_flight"] -= 1
+            backend["requests"] += 1
+            if failed:
+                backend["failures"] += 1
+            if down:
+                backend["healthy"] = False
+            if seconds is not None:
+                previous = backend["latency"]
+                backend["latency"] = seconds if previous is None \
+                    else previous + LATENCY_SMOOTHING * (seconds - previous)
+
+    def _call(self, method, *args, **kwargs):
+        """
+        Run an SDClient method on the best backend, failing over to the others.
+        """
+        tried = set()
+        error = None
+        while True:
+            try:
+                backend = self._acquire(tried)
+            except BackendUnavailable as e:
+                raise BackendUnavailable(f"{e}: {error}") from error
+            tried.add(id(backend))
+            start = time.perf_counter()
+            try:
+                result = getattr(backend["client"], method)(*args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # The node dropped: out of rotation until a health probe succeeds
+                self._release(backend, failed=True, down=True)
+                error = e
+            except requests.HTTPError as e:
+                self._release(backend, failed=True)
+                if e.response is None or e.response.status_code < 500:
+                    raise
+                error = e
+            except BaseException:
+                self._release(backend)
+                raise
+            else:
+                self._release(backend, time.perf_counter() - start)
+                return result
+            metrics.REGISTRY.inc("sd_failovers_total", {"backend": backend["client"].base_url})
+            print(f"Stable Diffusion backend {backend['client'].base_url} failed ({error}), trying another")
+
+    def post(self, path, payload):
+        return self._call("post", path, payload)
+
+    def post_images(self, path, payload, images):
+        return self._call("post_images", path, payload, images)
+
+    def img2img(self, image, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4,
+                steps=40, **params):
+        """
+        Run img2img on one image on the best backend (see SDClient.img2img).
+        """
+        return self._call("img2img", image, prompt, negative_prompt, denoising_strength, cfg_scale, steps,
+                          **params)
+
+    def img2img_batch(self, images, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4,
+                      steps=40, **params):
+        """
+        Run img2img on several images in one request on the best backend (see SDClient.img2img_batch).
+        """
+        return self._call("img2img_batch", images, prompt, negative_prompt, denoising_strength, cfg_scale,
+                          steps, **params)
+
+    async def post_async(self, path, payload):
+        return await asyncio.to_thread(self.post, path, payload)
+
+    async def img2img_async(self, image, prompt, negative_prompt="", denoising_strength=0.25,
+                            cfg_scale=4, steps=40, **params):
+        return await asyncio.to_thread(self.img2img, image, prompt, negative_prompt,
+                                       denoising_strength, cfg_scale, steps, **params)
+
+    def status(self):
+        """
+        Snapshot of every backend.
+
+        Returns:
+            List of dictionaries with url, healthy, in_flight, latency (moving average
+            seconds per request), ping, requests and failures
+        """
+        with self._lock:
+            return [
+                {"url": backend["client"].base_url,
+                 **{key: value for key, value in backend.items() if key != "client"}}
+                for backend in self.backends
+            ]
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+        self._probes.shutdown(wait=True)
+        for backend in self.backends:
+            backend["client"].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ProgressTracker:
+    def __init__(self, interval=DEFAULT_POLL_INTERVAL, live_preview=True, should_cancel=None, on_progress=None):
+        """
+        Live progress and cancellation for the img2img requests of one job.
+
+        Used as a context manager: requests sent inside it (including tile threads
+        running in a copy of the context) carry a task ID, a background thread polls
+        their progress, and cancel() interrupts them on the WebUI, only once they are
+        actually running, so other users' generations are left alone. Requests not
+        yet sent raise JobCancelled instead.
+
+        Args:
+            interval: Seconds between polls
+            live_preview: Fetch preview images
+            should_cancel: Optional callable checked on every poll; True cancels the job
+            on_progress: Optional callable receiving each progress update (runs on the
+                polling thread)
+        """
+        self.interval = interval
+        self.live_preview = live_preview
+        self.should_cancel = should_cancel
+        self.on_progress = on_progress
+        self.latest = None
+        self.completed = 0
+        self._cancelled = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._interrupted = set()
+        self._thread = None
+        self._token = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """
+        Abandon the job: in-flight generations are interrupted, new requests refused.
+        """
+        self._cancelled.set()
+
+    def check(self):
+        """
+        Raise JobCancelled if the job was cancelled.
+        """
+        if self._cancelled.is_set():
+            raise JobCancelled("Enhancement cancelled")
+
+    def started(self, task_id, client):
+        with self._lock:
+            self._tasks[task_id] = client
+
+    def finished(self, task_id):
+        with self._lock:
+            self._tasks.pop(task_id, None)
+            self.completed += 1
+
+    def _poll(self):
+        while not self._stopped.wait(self.interval):
+            if self.should_cancel is not None and not self.cancelled and self.should_cancel():
+                self.cancel()
+            with self._lock:
+                tasks = list(self._tasks.items())
+            for task_id, client in tasks:
+                try:
+                    info = client.progress(task_id, self.live_preview)
+                    if self.cancelled and info["active"] and task_id not in self._interrupted:
+                        self._interrupted.add(task_id)
+                        client.interrupt()
+                except requests.RequestException:
+                    continue
+                info = dict(info, task_id=task_id, completed_requests=self.completed, cancelled=self.cancelled)
+                if info["active"] or self.latest is None:
+                    self.latest = info
+                if self.on_progress is not None:
+                    self.on_progress(info)
+
+    def __enter__(self):
+        self._token = _TRACKER.set(self)
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        _TRACKER.reset(self._token)
+        self._stopped.set()
+        self._thread.join()
+
+
+def create_client(base_url=None, **kwargs):
+    """
+    Client for one WebUI address, or a load-balanced pool for several.
+
+    Args:
+        base_url: Address, comma-separated addresses or list (default: SD_WEBUI_URL)
+        **kwargs: SDClient constructor arguments (and health_interval for a pool)
+
+    Returns:
+        SDClient or SDPool
+    """
+    urls = backend_urls(base_url)
+    if len(urls) > 1:
+        return SDPool(urls, **kwargs)
+    kwargs.pop("health_interval", None)
+    return SDClient(urls[0], **kwargs)
+
+
+def get_client():
+    """
+    Shared process-wide client, created on first use.
+
+    Returns:
+        SDClient, or SDPool when SD_WEBUI_URL lists several WebUI instances
+    """
+    global _DEFAULT_CLIENT
+    with _DEFAULT_CLIENT_LOCK:
+        if _DEFAULT_CLIENT is None:
+            _DEFAULT_CLIENT = create_client()
+        return _DEFAULT_CLIENT
+
+
+def configure(**kwargs):
+    """
+    Replace the shared client (e.g. to point at other WebUIs or change timeouts).
+
+    Args:
+        **kwargs: create_client arguments
+
+    Returns:
+        The new shared SDClient or SDPool
+    """
+    global _DEFAULT_CLIENT
+    with _DEFAULT_CLIENT_LOCK:
+        if _DEFAULT_CLIENT is not None:
+            _DEFAULT_CLIENT.close()
+        _DEFAULT_CLIENT = create_client(**kwargs)
+        return _DEFAULT_CLIENT
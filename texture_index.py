@@ -0,0 +1,374 @@
+"""Header-only texture library index in SQLite: scan DDS/VTF folders and VPKs, then query."""
+import argparse
+import hashlib
+import mmap
+import os
+import sqlite3
+import time
+
+import dds_codec
+import remaster
+import vtf_codec
+import vpk_extract
+
+DEFAULT_DB = "texture_index.db"
+TEXTURE_EXTENSIONS = (".dds", ".vtf")
+
+# Rows written per transaction during a scan
+_BATCH_SIZE = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS textures (
+    source TEXT NOT NULL,
+    path TEXT NOT NULL,
+    container TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    depth INTEGER,
+    mipmaps INTEGER,
+    format TEXT,
+    flags INTEGER,
+    frames INTEGER,
+    faces INTEGER,
+    elements INTEGER,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    hash TEXT,
+    error TEXT,
+    enhanced_at REAL,
+    PRIMARY KEY (source, path)
+);
+CREATE INDEX IF NOT EXISTS textures_format ON textures (format, width, height);
+CREATE INDEX IF NOT EXISTS textures_hash ON textures (hash);
+CREATE INDEX IF NOT EXISTS textures_enhanced ON textures (enhanced_at);
+"""
+
+_COLUMNS = ("source", "path", "container", "width", "height", "depth", "mipmaps", "format", "flags",
+            "frames", "faces", "elements", "size", "mtime", "hash", "error")
+
+
+def read_header(data, container):
+    """
+    Parse the header of a DDS or VTF held in a bytes-like object (e.g. an mmap).
+
+    Only the header (and, for VTF 7.3+, the resource directory) is touched, so pages
+    holding pixel data are never read from disk.
+
+    Args:
+        data: bytes-like object with the file contents
+        container: 'dds' or 'vtf'
+
+    Returns:
+        Dictionary with width, height, depth, mipmaps, format, flags, frames, faces and elements
+    """
+    if container == "vtf":
+        metadata = vtf_codec.parse_vtf_header(data)
+        flags = int(metadata["flags"], 16)
+        frames = metadata["frames"]
+    else:
+        metadata = dds_codec.parse_dds_header(data)
+        flags = metadata.get("caps2", 0)
+        frames = metadata.get("array_size", 1)
+    return {
+        "width": metadata["width"],
+        "height": metadata["height"],
+        "depth": max(1, metadata.get("depth", 1)),
+        "mipmaps": metadata.get("mipmaps", 1),
+        "format": metadata.get("dxgi_format_name") or metadata.get("format"),
+        "flags": flags,
+        "frames": frames,
+        "faces": metadata.get("faces", 1),
+        "elements": metadata.get("elements", 1),
+    }
+
+
+def _index_file(path, hash_contents):
+    """
+    Header fields, size and content hash of one texture file, via a read-only mmap.
+    """
+    container = os.path.splitext(path)[1][1:].lower()
+    stat = os.stat(path)
+    row = {"container": container, "size": stat.st_size, "mtime": stat.st_mtime, "hash": None, "error": None}
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            row.update(read_header(view, container))
+            if hash_contents:
+                row["hash"] = hashlib.blake2b(view, digest_size=16).hexdigest()
+    except Exception as e:
+        row["error"] = str(e)
+    return row
+
+
+class TextureIndex:
+    def __init__(self, db_path=DEFAULT_DB):
+        """
+        Open (or create) a texture index.
+
+        Args:
+            db_path: Path to the SQLite database
+        """
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def _known(self, source):
+        """
+        (mtime, size) of every indexed texture of a source, keyed by path.
+        """
+        rows = self.conn.execute("SELECT path, mtime, size FROM textures WHERE source = ?", (source,))
+        return {row["path"]: (row["mtime"], row["size"]) for row in rows}
+
+    def _write(self, source, rows, removed):
+        """
+        Upsert scanned rows and drop textures that no longer exist, in batched transactions.
+        """
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in _COLUMNS[2:])
+        # A replaced texture is no longer enhanced: compare content hashes where both
+        # rows have one (VPK entries share the archive's mtime), else mtime and size
+        updates += (", enhanced_at = CASE WHEN textures.size = excluded.size AND "
+                    "CASE WHEN textures.hash IS NOT NULL AND excluded.hash IS NOT NULL "
+                    "THEN textures.hash = excluded.hash ELSE textures.mtime = excluded.mtime END "
+                    "THEN textures.enhanced_at END")
+        statement = (f"INSERT INTO textures ({', '.join(_COLUMNS)}) VALUES ({placeholders}) "
+                     f"ON CONFLICT (source, path) DO UPDATE SET {updates}")
+        batch = []
+        for path, row in rows:
+            batch.append((source, path) + tuple(row.get(column) for column in _COLUMNS[2:]))
+            if len(batch) >= _BATCH_SIZE:
+                with self.conn:
+                    self.conn.executemany(statement, batch)
+                batch = []
+        with self.conn:
+            if batch:
+                self.conn.executemany(statement, batch)
+            self.conn.executemany("DELETE FROM textures WHERE source = ? AND path = ?",
+                                  [(source, path) for path in removed])
+
+    def scan_folder(self, folder, hash_contents=True, extensions=TEXTURE_EXTENSIONS):
+        """
+        Index every DDS/VTF under a folder, skipping files whose mtime and size are unchanged.
+
+        Args:
+            folder: Folder to scan recursively
+            hash_contents: Store a BLAKE2b hash of each file's bytes
+            extensions: Texture extensions to index
+
+        Returns:
+            Dictionary with counts of indexed, unchanged and removed textures
+        """
+        source = os.path.abspath(folder)
+        known = self._known(source)
+        seen = set()
+        counts = {"indexed": 0, "unchanged": 0, "removed": 0}
+
+        def changed_rows():
+            for root, _, files in os.walk(source):
+                for filename in files:
+                    if not filename.lower().endswith(extensions):
+                        continue
+                    full_path = os.path.join(root, filename)
+                    rel = os.path.relpath(full_path, source).replace(os.sep, "/")
+                    seen.add(rel)
+                    stat = os.stat(full_path)
+                    if known.get(rel) == (stat.st_mtime, stat.st_size):
+                        counts["unchanged"] += 1
+                        continue
+                    counts["indexed"] += 1
+                    yield rel, _index_file(full_path, hash_contents)
+
+        self._write(source, changed_rows(), ())
+        removed = set(known) - seen
+        self._write(source, (), removed)
+        counts["removed"] = len(removed)
+        return counts
+
+    def scan_vpk(self, vpk_path, extensions=TEXTURE_EXTENSIONS):
+        """
+        Index the textures of a VPK from their headers, without extracting them.
+
+        Entries are keyed by their path in the archive; the content hash is the CRC32
+        stored in the VPK directory. The archive is skipped entirely if the directory
+        file is unchanged.
+
+        Args:
+            vpk_path: Path to the <name>_dir.vpk file
+            extensions: Texture extensions to index
+
+        Returns:
+            Dictionary with counts of indexed, unchanged and removed textures
+        """
+        source = os.path.abspath(vpk_path)
+        stat = os.stat(source)
+        known = self._known(source)
+        if known and all(mtime == stat.st_mtime for mtime, _ in known.values()):
+            return {"indexed": 0, "unchanged": len(known), "removed": 0}
+
+        with vpk_extract.VPKArchive(source) as archive:
+            paths = archive.paths(extensions)
+
+            def rows():
+                for path in paths:
+                    entry = archive.entries[path]
+                    row = {"container": os.path.splitext(path)[1][1:].lower(),
+                           "size": len(entry.preload) + entry.length, "mtime": stat.st_mtime,
+                           "hash": f"crc32:{entry.crc:08x}", "error": None}
+                    try:
+                        row.update(read_header(archive.read(path), row["container"]))
+                    except Exception as e:
+                        row["error"] = str(e)
+                    yield path, row
+
+            removed = set(known) - set(paths)
+            self._write(source, rows(), removed)
+        return {"indexed": len(paths), "unchanged": 0, "removed": len(removed)}
+
+    def scan(self, source, hash_contents=True):
+        """
+        Index a folder or a _dir.vpk.
+        """
+        if source.lower().endswith(".vpk"):
+            return self.scan_vpk(source)
+        return self.scan_folder(source, hash_contents)
+
+    def query(self, format_name=None, min_size=None, max_size=None, container=None, enhanced=None,
+              source=None, limit=None):
+        """
+        Find indexed textures.
+
+        Args:
+            format_name: Format name (e.g. 'DXT1', 'BC7_UNORM')
+            min_size: Minimum of the larger dimension in pixels
+            max_size: Maximum of the larger dimension in pixels
+            container: 'dds' or 'vtf'
+            enhanced: True / False to filter on whether the texture was marked enhanced
+            source: Folder or VPK path the textures were scanned from
+            limit: Maximum number of rows
+
+        Returns:
+            List of sqlite3.Row objects (indexable by column name)
+        """
+        clauses, params = ["error IS NULL"], []
+        if format_name:
+            clauses.append("format = ?")
+            params.append(format_name)
+        if min_size:
+            clauses.append("(width >= ? OR height >= ?)")
+            params += [min_size, min_size]
+        if max_size:
+            clauses.append("width <= ? AND height <= ?")
+            params += [max_size, max_size]
+        if container:
+            clauses.append("container = ?")
+            params.append(container.lower().lstrip("."))
+        if enhanced is not None:
+            clauses.append("enhanced_at IS NOT NULL" if enhanced else "enhanced_at IS NULL")
+        if source:
+            clauses.append("source = ?")
+            params.append(os.path.abspath(source))
+        statement = "SELECT * FROM textures WHERE " + " AND ".join(clauses) + " ORDER BY source, path"
+        if limit:
+            statement += f" LIMIT {int(limit)}"
+        return self.conn.execute(statement, params).fetchall()
+
+    def mark_enhanced(self, source, paths, enhanced=True):
+        """
+        Record that textures were (or were not) enhanced.
+
+        Args:
+            source: Folder or VPK path the textures were scanned from
+            paths: Texture paths relative to the source
+            enhanced: False clears the mark
+        """
+        stamp = time.time() if enhanced else None
+        with self.conn:
+            self.conn.executemany("UPDATE textures SET enhanced_at = ? WHERE source = ? AND path = ?",
+                                  [(stamp, os.path.abspath(source), path) for path in paths])
+
+    def mark_from_manifest(self, source, manifest_path):
+        """
+        Mark the textures a remaster.py run finished as enhanced.
+
+        Args:
+            source: Folder or VPK path the batch job read
+            manifest_path: The job's manifest.jsonl
+
+        Returns:
+            Number of textures marked
+        """
+        done = [rel for rel, record in remaster.load_manifest(manifest_path).items()
+                if record["stage"] == remaster.STAGE_DONE]
+        self.mark_enhanced(source, done)
+        return len(done)
+
+    def stats(self):
+        """
+        Texture counts per container and format.
+
+        Returns:
+            List of (container, format, count) tuples
+        """
+        return [tuple(row) for row in self.conn.execute(
+            "SELECT container, format, COUNT(*) FROM textures GROUP BY container, format ORDER BY 3 DESC")]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index DDS/VTF headers into SQLite and query the index.")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = commands.add_parser("scan", help="Index folders and/or _dir.vpk files (incremental)")
+    scan.add_argument("sources", nargs="+", help="Folders or <name>_dir.vpk files")
+    scan.add_argument("--no-hash", action="store_true", help="Skip hashing file contents")
+
+    query = commands.add_parser("query", help="List indexed textures")
+    query.add_argument("--format", help="Format name (e.g. DXT1, BC7_UNORM)")
+    query.add_argument("--min-size", type=int, help="Minimum of the larger dimension in pixels")
+    query.add_argument("--max-size", type=int, help="Maximum of the larger dimension in pixels")
+    query.add_argument("--container", choices=["dds", "vtf"])
+    query.add_argument("--not-enhanced", action="store_true", help="Only textures not marked enhanced")
+    query.add_argument("--source", help="Only textures from this folder or VPK")
+    query.add_argument("--limit", type=int)
+
+    mark = commands.add_parser("mark", help="Mark textures finished by a remaster.py run as enhanced")
+    mark.add_argument("source", help="Folder or VPK the batch job read")
+    mark.add_argument("manifest", help="The job's manifest.jsonl")
+
+    commands.add_parser("stats", help="Texture counts per format")
+    args = parser.parse_args()
+
+    with TextureIndex(args.db) as index:
+        if args.command == "scan":
+            for source in args.sources:
+                start = time.perf_counter()
+                counts = index.scan(source, hash_contents=not args.no_hash)
+                print(f"✅ {source}: {counts['indexed']} indexed, {counts['unchanged']} unchanged, "
+                      f"{counts['removed']} removed ({time.perf_counter() - start:.1f}s)")
+        elif args.command == "query":
+            rows = index.query(args.format, args.min_size, args.max_size, args.container,
+                               False if args.not_enhanced else None, args.source, args.limit)
+            for row in rows:
+                print(f"{row['source']}:{row['path']}\t{row['format']}\t{row['width']}x{row['height']}"
+                      f"\t{row['mipmaps']} mips")
+            print(f"{len(rows)} textures")
+        elif args.command == "mark":
+            print(f"✅ Marked {index.mark_from_manifest(args.source, args.manifest)} textures as enhanced")
+        else:
+            for container, format_name, count in index.stats():
+                print(f"{container}\t{format_name}\t{count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Texture roles: colour maps go to Stable Diffusion, normal maps and masks stay on the CPU."""
+import os
+
+import numpy as np
+
+import dds_codec
+import vtf_codec
+from mipmaps import resize
+
+# Albedo/diffuse carries colour; normal maps carry vectors; masks carry data
+# (specular, exponent, alpha and self-illumination masks, SSBump, DuDv maps)
+ROLE_ALBEDO = "albedo"
+ROLE_NORMAL = "normal"
+ROLE_MASK = "mask"
+ROLES = (ROLE_ALBEDO, ROLE_NORMAL, ROLE_MASK)
+
+# File name suffixes (before the extension) of each non-colour role
+NORMAL_SUFFIXES = ("_normal", "_normals", "_normalmap", "_nrm", "_norm", "_nm", "_n", "_bump", "_bumpmap", "_ddn")
+MASK_SUFFIXES = ("_spec", "_specular", "_mask", "_masks", "_exponent", "_phongexponent", "_gloss", "_rough",
+                 "_roughness", "_metal", "_metallic", "_ao", "_height", "_selfillum", "_illum", "_ssbump", "_dudv")
+
+# Block and pixel formats that only ever hold vectors or a single data channel
+NORMAL_FORMATS = ("BC5", "ATI2N")
+MASK_FORMATS = ("BC4", "ATI1N", "I8", "A8", "UV88", "UVWQ8888", "UVLX8888")
+
+# Channel statistics: pixels sampled at most, mean deviation from unit length and
+# minimum mean Z for a tangent-space normal map
+MAX_SAMPLES = 65536
+NORMAL_LENGTH_TOLERANCE = 0.1
+NORMAL_MIN_Z = 0.4
+
+
+def _flags(metadata):
+    """
+    VTF texture flags as an int (stored as a hex string in the metadata JSON).
+    """
+    flags = metadata.get("flags", 0)
+    return int(flags, 16) if isinstance(flags, str) else int(flags)
+
+
+def looks_like_normal_map(image):
+    """
+    Whether an image's pixels decode to unit vectors pointing out of the surface.
+
+    Args:
+        image: uint8 array (H, W, C)
+
+    Returns:
+        True for a tangent-space normal map
+    """
+    pixels = np.asarray(image)
+    if pixels.ndim != 3 or pixels.shape[2] < 3:
+        return False
+    step = max(1, int(np.sqrt(pixels.shape[0] * pixels.shape[1] / MAX_SAMPLES)))
+    vectors = pixels[::step, ::step, :3].reshape(-1, 3).astype(np.float32) / 127.5 - 1.0
+    lengths = np.linalg.norm(vectors, axis=1)
+    return bool(
+        np.abs(lengths - 1.0).mean() < NORMAL_LENGTH_TOLERANCE
+        and vectors[:, 2].mean() > NORMAL_MIN_Z
+        and (vectors[:, 2] > 0).mean() > 0.99
+    )
+
+
+def classify(name, metadata=None, image=None):
+    """
+    Role of a texture, from the most to the least reliable evidence.
+
+    Source flags come first (VTF NORMAL and SSBUMP, the DDS normal-map pixel format
+    flag), then formats that only hold vectors or data (BC5, BC4, I8, ...), then name
+    suffixes (_normal, _n, _spec, _mask, ...), and finally channel statistics: pixels
+    that decode to unit vectors are a normal map, single-channel pixels a mask.
+
+    Args:
+        name: Texture file name or path
+        metadata: Decoded DDS/VTF metadata (optional)
+        image: Decoded uint8 pixels (optional)
+
+    Returns:
+        ROLE_ALBEDO, ROLE_NORMAL or ROLE_MASK
+    """
+    metadata = metadata or {}
+    if metadata.get("magic") == "VTF":
+        flags = _flags(metadata)
+        if flags & vtf_codec.TEXTUREFLAGS_NORMAL:
+            return ROLE_NORMAL
+        if flags & vtf_codec.TEXTUREFLAGS_SSBUMP:
+            return ROLE_MASK
+    elif metadata.get("pf_flags", 0) & dds_codec.DDPF_NORMAL:
+        return ROLE_NORMAL
+
+    if metadata.get("format") in NORMAL_FORMATS:
+        return ROLE_NORMAL
+    if metadata.get("format") in MASK_FORMATS:
+        return ROLE_MASK
+
+    stem = os.path.splitext(os.path.basename(name))[0].lower()
+    if stem.endswith(NORMAL_SUFFIXES):
+        return ROLE_NORMAL
+    if stem.endswith(MASK_SUFFIXES):
+        return ROLE_MASK
+
+    if image is not None:
+        image = np.asarray(image)
+        if image.ndim == 2 or image.shape[2] == 1:
+            return ROLE_MASK
+        if looks_like_normal_map(image):
+            return ROLE_NORMAL
+    return ROLE_ALBEDO
+
+
+def renormalize(image):
+    """
+    Rescale every normal back to unit length (alpha, often a mask, is kept).
+
+    Args:
+        image: uint8 RGB(A) normal map
+
+    Returns:
+        uint8 array of the same shape
+    """
+    image = np.asarray(image)
+    vectors = image[..., :3].astype(np.float32) / 127.5 - 1.0
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    # Degenerate texels point straight out of the surface
+    flat = lengths[..., 0] < 1e-3
+    vectors[flat] = (0.0, 0.0, 1.0)
+    lengths[flat] = 1.0
+    out = image.copy()
+    out[..., :3] = np.clip((vectors / lengths + 1.0) * 127.5 + 0.5, 0, 255).astype(np.uint8)
+    return out
+
+
+def upscale(image, role, width=None, height=None, wrap=False):
+    """
+    Deterministic CPU upscale of a normal map or mask, in place of Stable Diffusion.
+
+    Values are filtered as stored (no sRGB conversion); normals are renormalized
+    after filtering, which also repairs the length lost to block compression.
+
+    Args:
+        image: uint8 array (H, W[, C])
+        role: ROLE_NORMAL or ROLE_MASK
+        width: Target width (default: unchanged)
+        height: Target height (default: unchanged)
+        wrap: Wrap around the edges (tiling textures) instead of clamping
+
+    Returns:
+        uint8 array at the target size
+    """
+    image = np.asarray(image)
+    resized = resize(image, width or image.shape[1], height or image.shape[0], srgb=False, wrap=wrap)
+    if role == ROLE_NORMAL and resized.ndim == 3 and resized.shape[2] >= 3:
+        return renormalize(resized)
+    return resized
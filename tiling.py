@@ -0,0 +1,271 @@
+"""Tiled img2img for large textures: overlapping tiles, feathered back together."""
+import contextvars
+import io
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import imageio.v3 as iio
+import numpy as np
+from PIL import Image
+
+import metrics
+import resolution
+from sd_client import DEFAULT_CONCURRENCY
+
+# SD-native tile edge and the overlap feathered between neighbouring tiles (pixels)
+DEFAULT_TILE_SIZE = 512
+DEFAULT_OVERLAP = 64
+
+
+def tile_positions(length, tile, overlap, wrap=False):
+    """
+    Tile start offsets along one axis.
+
+    Without wrapping, tiles are spread evenly from 0 to length - tile. With wrapping,
+    they are spread over one period and the last tile runs past the end onto the
+    start of the texture.
+
+    Args:
+        length: Texture size along the axis
+        tile: Tile size along the axis
+        overlap: Minimum overlap between neighbouring tiles
+        wrap: Treat the axis as periodic
+
+    Returns:
+        Tuple of (list of offsets, tile size actually used)
+    """
+    if wrap:
+        count = max(1, math.ceil(length / (tile - overlap)))
+        return [round(i * length / count) for i in range(count)], tile
+    if length <= tile:
+        return [0], length
+    count = math.ceil((length - overlap) / (tile - overlap))
+    return [round(x) for x in np.linspace(0, length - tile, count)], tile
+
+
+def _ramp(size, overlap, start, end):
+    """
+    1D feather weights: linear ramps over the overlap at the requested ends, 1 elsewhere.
+    """
+    weights = np.ones(size, dtype=np.float32)
+    overlap = min(overlap, size // 2)
+    if overlap:
+        ramp = (np.arange(overlap, dtype=np.float32) + 0.5) / overlap
+        if start:
+            weights[:overlap] = np.minimum(weights[:overlap], ramp)
+        if end:
+            weights[-overlap:] = np.minimum(weights[-overlap:], ramp[::-1])
+    return weights
+
+
+def feather_window(height, width, overlap, top=True, bottom=True, left=True, right=True):
+    """
+    2D blending weights of one tile (outer product of 1D ramps).
+
+    Edges on the texture border are not feathered, since no other tile covers them.
+
+    Returns:
+        float32 array of shape (height, width)
+    """
+    return np.outer(_ramp(height, overlap, top, bottom), _ramp(width, overlap, left, right))
+
+
+def _crop(image, y, x, height, width):
+    """
+    Tile crop with wrap-around indexing past the texture edges.
+    """
+    rows = np.arange(y, y + height) % image.shape[0]
+    cols = np.arange(x, x + width) % image.shape[1]
+    return image[rows[:, None], cols]
+
+
+def _to_png(pixels):
+    with metrics.span("encode_png"):
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
+
+
+def _enhance_tile(client, pixels, prompt, negative_prompt, denoising_strength, cfg_scale, steps, params):
+    """
+    Send one tile through img2img at its own size.
+
+    Returns:
+        float32 RGB array with the tile's shape
+    """
+    height, width = pixels.shape[:2]
+    result = client.img2img(_to_png(pixels), prompt, negative_prompt, denoising_strength, cfg_scale, steps,
+                            width=width, height=height, **params)
+    with metrics.span("decode_png"):
+        image = Image.open(io.BytesIO(result)).convert("RGB")
+
+        # The WebUI rounds sizes to multiples of 8
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.LANCZOS)
+        return np.asarray(image, dtype=np.float32)
+
+
+def enhance_tiled(image, client, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4, steps=40,
+                  tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP, seamless=False, workers=None, **params):
+    """
+    Enhance a texture of any size as overlapping tiles.
+
+    Tiles are sent concurrently and blended with feathered weights. Rows of the result
+    are finalized as soon as no later tile can touch them, so the float accumulator and
+    the tiles in flight stay bounded by the tile size rather than the texture size.
+    With seamless=True, tiles wrap around the texture edges and the wrapped parts are
+    blended into the opposite side, so tileable textures stay tileable.
+
+    Args:
+        image: uint8 array (H, W, 3) or (H, W, 4); alpha is kept from the source
+        client: SDClient, BatchDispatcher or CachedClient
+        prompt, negative_prompt, denoising_strength, cfg_scale, steps: img2img parameters
+        tile_size: Tile edge in pixels
+        overlap: Overlap between neighbouring tiles in pixels
+        seamless: Wrap tiles around the edges of tileable textures
+        workers: Tiles in flight (defaults to the client's concurrency)
+        **params: Extra img2img parameters passed through to the API
+
+    Returns:
+        uint8 array with the shape of the input
+    """
+    if image.ndim == 2:
+        image = image[..., None]
+    if image.shape[2] < 3:
+        # Grey (+ alpha): expand to RGB (+ alpha)
+        image = np.concatenate([image[..., :1]] * 3 + [image[..., 1:]], axis=-1)
+    height, width = image.shape[:2]
+    rgb = image[..., :3]
+    overlap = max(0, min(overlap, tile_size // 2))
+    ys, tile_h = tile_positions(height, tile_size, overlap, wrap=seamless)
+    xs, tile_w = tile_positions(width, tile_size, overlap, wrap=seamless)
+
+    # Unwrapped extent covered by the tiles; anything past the texture folds back to the start
+    extent_w = xs[-1] + tile_w
+    wrap_rows = min(ys[-1] + tile_h - height, height)
+    workers = workers or getattr(client, "max_concurrency", None) or DEFAULT_CONCURRENCY
+
+    output = image.copy()
+    band = np.zeros((0, extent_w, 3), dtype=np.float32)
+    band_weight = np.zeros((0, extent_w), dtype=np.float32)
+    band_top = 0
+    held = np.zeros((max(wrap_rows, 0), width, 3), dtype=np.float32)
+    held_weight = np.zeros((max(wrap_rows, 0), width), dtype=np.float32)
+
+    def fold_columns(values):
+        # Add columns that ran past the right edge onto the left edge
+        folded = values[:, :width].copy()
+        for start in range(width, extent_w, width):
+            chunk = values[:, start:start + width]
+            folded[:, :chunk.shape[1]] += chunk
+        return folded
+
+    def flush(rows):
+        # Finalize the first `rows` rows of the band
+        nonlocal band, band_weight, band_top
+        values = fold_columns(band[:rows])
+        weights = fold_columns(band_weight[:rows])
+        for offset in range(rows):
+            y = band_top + offset
+            if y < wrap_rows or y >= height:
+                held[y % height] += values[offset]
+                held_weight[y % height] += weights[offset]
+            else:
+                output[y, :, :3] = np.clip(values[offset] / weights[offset][:, None] + 0.5, 0, 255)
+        band, band_weight = band[rows:], band_weight[rows:]
+        band_top += rows
+
+    tiles = [(y, x) for y in ys for x in xs]
+    window = workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(y, x):
+            # Run in a copy of the caller's context so tile spans count towards its metrics job
+            return pool.submit(contextvars.copy_context().run, _enhance_tile, client,
+                               _crop(rgb, y, x, tile_h, tile_w), prompt, negative_prompt,
+                               denoising_strength, cfg_scale, steps, params)
+
+        futures = [submit(*tile) for tile in tiles[:window]]
+        for index, (y, x) in enumerate(tiles):
+            enhanced = futures[index].result()
+            futures[index] = None
+            if index + window < len(tiles):
+                futures.append(submit(*tiles[index + window]))
+
+            # Grow the band down to this tile's bottom edge
+            missing = y + tile_h - (band_top + band.shape[0])
+            if missing > 0:
+                band = np.concatenate([band, np.zeros((missing, extent_w, 3), dtype=np.float32)])
+                band_weight = np.concatenate([band_weight, np.zeros((missing, extent_w), dtype=np.float32)])
+
+            weight = feather_window(
+                tile_h, tile_w, overlap,
+                top=seamless or y > 0, bottom=seamless or y + tile_h < height,
+                left=seamless or x > 0, right=seamless or x + tile_w < width,
+            )
+            rows = slice(y - band_top, y - band_top + tile_h)
+            band[rows, x:x + tile_w] += enhanced * weight[..., None]
+            band_weight[rows, x:x + tile_w] += weight
+
+            # At the end of a tile row, rows above the next tile row are final
+            if x == xs[-1]:
+                next_y = ys[ys.index(y) + 1] if y != ys[-1] else band_top + band.shape[0]
+                flush(next_y - band_top)
+
+    if len(held):
+        output[:len(held), :, :3] = np.clip(held / held_weight[..., None] + 0.5, 0, 255)
+    return output
+
+
+def enhance_png(image_bytes, client, prompt, negative_prompt="", denoising_strength=0.25, cfg_scale=4, steps=40,
+                tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP, seamless=False,
+                working_area=resolution.DEFAULT_AREA, **params):
+    """
+    Enhance a PNG, tiling it when it does not fit in one SD-native tile.
+
+    Textures up to tile_size (and not seamless) go to img2img in one request. They are
+    resized to their planned working resolution first (multiples of 64 near
+    working_area pixels, aspect kept) and brought back to their exact size
+    afterwards, so re-encoded DDS/VTF headers still match. Textures planned to the
+    same size land in the same BatchDispatcher batch.
+
+    Args:
+        image_bytes: PNG bytes
+        client: SDClient, BatchDispatcher or CachedClient
+        prompt, negative_prompt, denoising_strength, cfg_scale, steps: img2img parameters
+        tile_size: Tile edge in pixels (None disables tiling)
+        overlap: Overlap between neighbouring tiles in pixels
+        seamless: Wrap tiles around the edges of tileable textures
+        working_area: Area budget of the working resolution (None sends textures at
+            their own size, as do explicit width/height parameters)
+        **params: Extra img2img parameters passed through to the API
+
+    Returns:
+        PNG bytes of the enhanced image
+    """
+    with metrics.span("decode_png"):
+        image = iio.imread(image_bytes)
+    single = not tile_size or (max(image.shape[:2]) <= tile_size and not seamless)
+    if single and (not working_area or "width" in params or "height" in params):
+        return client.img2img(image_bytes, prompt, negative_prompt, denoising_strength, cfg_scale, steps, **params)
+    if image.dtype != np.uint8:
+        image = (image >> 8).astype(np.uint8)
+    if single:
+        with metrics.span("resize_working"):
+            working = resolution.to_working(image, working_area)
+        height, width = working.shape[:2]
+        result = client.img2img(_to_png(working), prompt, negative_prompt, denoising_strength, cfg_scale, steps,
+                                width=width, height=height, **params)
+        with metrics.span("decode_png"):
+            enhanced = iio.imread(result)
+        with metrics.span("resize_restore"):
+            enhanced = resolution.restore(enhanced, image)
+        with metrics.span("encode_png"):
+            buffer = io.BytesIO()
+            Image.fromarray(enhanced).save(buffer, format="PNG")
+            return buffer.getvalue()
+    enhanced = enhance_tiled(image, client, prompt, negative_prompt, denoising_strength, cfg_scale, steps,
+                             tile_size=tile_size, overlap=overlap, seamless=seamless, **params)
+    with metrics.span("encode_png"):
+        buffer = io.BytesIO()
+        Image.fromarray(enhanced).save(buffer, format="PNG")
+        return buffer.getvalue()
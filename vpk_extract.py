@@ -0,0 +1,319 @@
+"""Streaming VPK texture extraction: memory-mapped archive reads decoded across a worker pool."""
+import argparse
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import imageio
+
+import dds_codec
+import vtf_codec
+
+VPK_SIGNATURE = 0x55AA1234
+
+# Entries stored in the _dir.vpk file itself rather than a numbered chunk
+VPK_DIR_ARCHIVE = 0x7FFF
+
+# Paths handed to each worker per task (amortizes inter-process overhead)
+_CHUNK_SIZE = 64
+
+# Directory entry of a single file inside the archive
+VPKEntry = namedtuple("VPKEntry", "path crc preload archive_index offset length")
+
+# Archive opened once per worker process by the pool initializer
+_WORKER_ARCHIVE = None
+
+
+def _read_string(buffer, position):
+    """
+    Read a null-terminated string from the directory tree.
+
+    Returns:
+        Tuple of (string, position after the terminator)
+    """
+    end = buffer.find(b"\x00", position)
+    return buffer[position:end].decode("utf-8", errors="replace"), end + 1
+
+
+class VPKArchive:
+    def __init__(self, dir_path):
+        """
+        Open a VPK directory file and index its entries.
+
+        Numbered chunk archives (<name>_NNN.vpk) are memory-mapped lazily on first use.
+
+        Args:
+            dir_path: Path to the <name>_dir.vpk file
+        """
+        self.dir_path = dir_path
+        self._file = open(dir_path, "rb")
+        self._dir_map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._chunks = {}
+
+        signature, version, tree_size = struct.unpack_from("<3I", self._dir_map, 0)
+        if signature != VPK_SIGNATURE:
+            raise ValueError("Invalid VPK signature")
+        if version == 1:
+            header_size = 12
+        elif version == 2:
+            header_size = 28
+        else:
+            raise ValueError(f"Unsupported VPK version: {version}")
+        self.version = version
+
+        # Embedded file data starts right after the directory tree
+        self._data_offset = header_size + tree_size
+        self.entries = self._read_tree(header_size, header_size + tree_size)
+
+        base = dir_path[:-len("_dir.vpk")] if dir_path.endswith("_dir.vpk") else os.path.splitext(dir_path)[0]
+        self._chunk_prefix = base
+
+    def _read_tree(self, position, end):
+        """
+        Walk the extension / directory / file-name tree.
+
+        Returns:
+            Dictionary mapping full paths to VPKEntry tuples
+        """
+        tree = self._dir_map[position:end]
+        position = 0
+        entries = {}
+        while True:
+            extension, position = _read_string(tree, position)
+            if not extension:
+                break
+            while True:
+                directory, position = _read_string(tree, position)
+                if not directory:
+                    break
+                while True:
+                    name, position = _read_string(tree, position)
+                    if not name:
+                        break
+                    crc, preload_size, archive_index, offset, length, terminator = struct.unpack_from(
+                        "<IHHIIH", tree, position)
+                    position += 18
+                    if terminator != 0xFFFF:
+                        raise ValueError(f"Corrupt VPK directory entry: {name}")
+                    preload = tree[position:position + preload_size]
+                    position += preload_size
+
+                    # A single space stands for "no directory" / "no extension"
+                    path = name if extension == " " else f"{name}.{extension}"
+                    if directory != " ":
+                        path = f"{directory}/{path}"
+                    entries[path] = VPKEntry(path, crc, preload, archive_index, offset, length)
+        return entries
+
+    def _chunk(self, archive_index):
+        """
+        Memory-mapped view of a numbered chunk archive.
+        """
+        if archive_index == VPK_DIR_ARCHIVE:
+            return self._dir_map
+        chunk = self._chunks.get(archive_index)
+        if chunk is None:
+            with open(f"{self._chunk_prefix}_{archive_index:03d}.vpk", "rb") as f:
+                chunk = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._chunks[archive_index] = chunk
+        return chunk
+
+    def read(self, path, verify=False):
+        """
+        Read a file from the archive.
+
+        Args:
+            path: Full path of the entry (e.g. 'materials/brick/wall01.vtf')
+            verify: Check the CRC32 stored in the directory
+
+        Returns:
+            bytes-like object with the file contents (a zero-copy memoryview when the
+            entry has no preload data)
+        """
+        entry = self.entries[path]
+        data = entry.preload
+        if entry.length:
+            offset = entry.offset
+            if entry.archive_index == VPK_DIR_ARCHIVE:
+                offset += self._data_offset
+            view = memoryview(self._chunk(entry.archive_index))[offset:offset + entry.length]
+            data = bytes(data) + view if data else view
+        if verify and zlib.crc32(data) != entry.crc:
+            raise ValueError(f"CRC mismatch: {path}")
+        return data
+
+    def paths(self, extensions=None):
+        """
+        Entry paths in on-disk order (chunk, then offset) for sequential reads.
+
+        Args:
+            extensions: Optional iterable of extensions to keep (e.g. ('.vtf', '.dds'))
+
+        Returns:
+            List of paths
+        """
+        entries = self.entries.values()
+        if extensions:
+            extensions = tuple(ext.lower() for ext in extensions)
+            entries = [entry for entry in entries if entry.path.lower().endswith(extensions)]
+        return [entry.path for entry in sorted(entries, key=lambda entry: (entry.archive_index, entry.offset))]
+
+    def close(self):
+        for chunk in self._chunks.values():
+            chunk.close()
+        self._chunks = {}
+        self._dir_map.close()
+        self._file.close()
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def decode_texture(path, data):
+    """
+    Decode a DDS or VTF texture held in memory.
+
+    Args:
+        path: Entry path (the extension selects the decoder)
+        data: bytes-like object with the file contents
+
+    Returns:
+        Tuple of (uint8 RGBA array with elements stacked vertically, metadata dictionary)
+    """
+    if path.lower().endswith(".vtf"):
+        metadata = vtf_codec.parse_vtf_header(data)
+        image = vtf_codec.decode_vtf_array(data, metadata)
+    else:
+        metadata = dds_codec.parse_dds_header(data)
+        image = dds_codec.decode_dds_array(data, metadata)
+    metadata["source"] = path
+    return image.reshape((-1,) + image.shape[2:]), metadata
+
+
+def _init_worker(vpk_path):
+    """
+    Pool initializer: each worker maps the archive once.
+    """
+    global _WORKER_ARCHIVE
+    _WORKER_ARCHIVE = VPKArchive(vpk_path)
+
+
+def _extract_one(path, output_dir, metadata_dir, archive=None):
+    """
+    Read, decode and save one texture inside a worker process.
+
+    Args:
+        archive: VPKArchive to read from (defaults to the worker's)
+
+    Returns:
+        Tuple of (path, error message or None)
+    """
+    try:
+        image, metadata = decode_texture(path, (archive or _WORKER_ARCHIVE).read(path))
+
+        # Keep the archive's directory layout and extension so neither equal basenames
+        # nor x.dds next to x.vtf can collide (matching the metadata naming below)
+        png_path = os.path.join(output_dir, path + ".png")
+        os.makedirs(os.path.dirname(png_path), exist_ok=True)
+        imageio.imwrite(png_path, image, format='png')
+
+        meta_path = os.path.join(metadata_dir, path + ".json")
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(meta_path, "w") as f:
+            json.dump(metadata, f, indent=2)
+        return path, None
+    except Exception as e:
+        return path, str(e)
+
+
+def _extract_chunk(paths, output_dir, metadata_dir, archive=None):
+    return [_extract_one(path, output_dir, metadata_dir, archive) for path in paths]
+
+
+def extract_textures(vpk_path, output_dir, metadata_dir=None, extensions=(".vtf", ".dds"), workers=None):
+    """
+    Decode every texture in a VPK straight to PNG + metadata JSON, keeping full paths.
+
+    Entries are read through memory-mapped chunk archives inside the workers; no
+    intermediate .vtf/.dds files are written.
+
+    Args:
+        vpk_path: Path to the <name>_dir.vpk file
+        output_dir: Root folder for the PNG files
+        metadata_dir: Root folder for the metadata JSON files (defaults to output_dir)
+        extensions: Extensions of the entries to decode
+        workers: Number of worker processes (None uses all cores)
+
+    Yields:
+        Tuple of (entry path, error message or None) as textures finish
+    """
+    metadata_dir = metadata_dir or output_dir
+    with VPKArchive(vpk_path) as archive:
+        paths = archive.paths(extensions)
+    chunks = [paths[i:i + _CHUNK_SIZE] for i in range(0, len(paths), _CHUNK_SIZE)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        # In-process: the archive is closed (mmaps and handles released) when done
+        with VPKArchive(vpk_path) as archive:
+            for chunk in chunks:
+                yield from _extract_chunk(chunk, output_dir, metadata_dir, archive)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(vpk_path,)) as pool:
+        futures = [pool.submit(_extract_chunk, chunk, output_dir, metadata_dir) for chunk in chunks]
+        for future in futures:
+            yield from future.result()
+
+
+def iter_textures(vpk_path, extensions=(".vtf", ".dds")):
+    """
+    Decode textures from a VPK in-process, without touching the disk.
+
+    Args:
+        vpk_path: Path to the <name>_dir.vpk file
+        extensions: Extensions of the entries to decode
+
+    Yields:
+        Tuple of (entry path, RGBA image, metadata)
+    """
+    with VPKArchive(vpk_path) as archive:
+        for path in archive.paths(extensions):
+            image, metadata = decode_texture(path, archive.read(path))
+            yield path, image, metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode every texture in a VPK to PNG + metadata JSON.")
+    parser.add_argument("vpk_path", help="Path to the <name>_dir.vpk file")
+    parser.add_argument("output_dir", help="Folder for the PNG files")
+    parser.add_argument("--metadata-dir", help="Folder for the metadata JSON files (default: output_dir)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--ext", nargs="+", default=[".vtf", ".dds"], help="Entry extensions to decode")
+    args = parser.parse_args()
+
+    done = failed = 0
+    for path, error in extract_textures(args.vpk_path, args.output_dir, args.metadata_dir, args.ext, args.workers):
+        if error:
+            failed += 1
+            print(f"[!] {path}: {error}")
+        else:
+            done += 1
+    print(f"✅ Extracted {done} textures ({failed} failed).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,551 @@
+"""Valve Texture Format (VTF 7.0 - 7.5) reader and writer."""
+import struct
+import numpy as np
+
+import dds_codec
+from mipmaps import _SRGB_TO_LINEAR, _linear_to_srgb, generate_mipmaps, mip_count_like, mipmap_count
+
+# VTF texture flags
+TEXTUREFLAGS_CLAMPS = 0x4
+TEXTUREFLAGS_CLAMPT = 0x8
+TEXTUREFLAGS_NORMAL = 0x80
+TEXTUREFLAGS_NOMIP = 0x100
+TEXTUREFLAGS_NOLOD = 0x200
+TEXTUREFLAGS_ONEBITALPHA = 0x1000
+TEXTUREFLAGS_EIGHTBITALPHA = 0x2000
+TEXTUREFLAGS_ENVMAP = 0x4000
+TEXTUREFLAGS_SSBUMP = 0x8000000
+
+# Resource entries (7.3+); entries flagged NO_DATA store their value inline
+RESOURCE_LOWRES = b"\x01\x00\x00"
+RESOURCE_HIGHRES = b"\x30\x00\x00"
+RESOURCE_NO_DATA = 0x2
+
+# Header fields after the signature: version, header size, width, height, flags, frames,
+# start frame, reflectivity, bumpmap scale, high-res format, mipmaps, low-res format and size
+_HEADER = struct.Struct("<2IIHHIHH4x3f4xfiBiBB")
+_HEADER_START = 4
+
+# Image format enumeration; 34/35 are ATI2N/ATI1N in Alien Swarm and later engine branches
+VTF_FORMATS = {
+    0: "RGBA8888", 1: "ABGR8888", 2: "RGB888", 3: "BGR888", 4: "RGB565", 5: "I8",
+    6: "IA88", 7: "P8", 8: "A8", 9: "RGB888_BLUESCREEN", 10: "BGR888_BLUESCREEN",
+    11: "ARGB8888", 12: "BGRA8888", 13: "DXT1", 14: "DXT3", 15: "DXT5", 16: "BGRX8888",
+    17: "BGR565", 18: "BGRX5551", 19: "BGRA4444", 20: "DXT1_ONEBITALPHA", 21: "BGRA5551",
+    22: "UV88", 23: "UVWQ8888", 24: "RGBA16161616F", 25: "RGBA16161616", 26: "UVLX8888",
+    27: "R32F", 28: "RGB323232F", 29: "RGBA32323232F", 30: "NV_DST16", 31: "NV_DST24",
+    32: "NV_INTZ", 33: "NV_RAWZ", 34: "ATI2N", 35: "ATI1N", 36: "NV_NULL", 37: "ATI2N",
+    38: "ATI1N", 70: "BC7",
+}
+VTF_FORMAT_IDS = {
+    "RGBA8888": 0, "ABGR8888": 1, "RGB888": 2, "BGR888": 3, "RGB565": 4, "I8": 5,
+    "IA88": 6, "A8": 8, "RGB888_BLUESCREEN": 9, "BGR888_BLUESCREEN": 10, "ARGB8888": 11,
+    "BGRA8888": 12, "DXT1": 13, "DXT3": 14, "DXT5": 15, "BGRX8888": 16, "BGR565": 17,
+    "BGRX5551": 18, "BGRA4444": 19, "DXT1_ONEBITALPHA": 20, "BGRA5551": 21, "UV88": 22,
+    "UVWQ8888": 23, "RGBA16161616F": 24, "RGBA16161616": 25, "UVLX8888": 26, "R32F": 27,
+    "RGB323232F": 28, "RGBA32323232F": 29, "ATI2N": 37, "ATI1N": 38, "BC7": 70,
+}
+
+# Block-compressed VTF formats and the matching dds_codec format
+VTF_BLOCK_FORMATS = {
+    "DXT1": "DXT1",
+    "DXT1_ONEBITALPHA": "DXT1",
+    "DXT3": "DXT3",
+    "DXT5": "DXT5",
+    "ATI1N": "BC4",
+    "ATI2N": "BC5",
+    "BC7": "BC7",
+}
+
+_RGB = dds_codec.DDPF_RGB
+_RGBA = dds_codec.DDPF_RGB | dds_codec.DDPF_ALPHAPIXELS
+
+# Uncompressed formats: bit count, R/G/B/A masks (little-endian pixel) and DDS pixel flags
+VTF_UNCOMPRESSED = {
+    "RGBA8888": (32, 0xFF, 0xFF00, 0xFF0000, 0xFF000000, _RGBA),
+    "ABGR8888": (32, 0xFF000000, 0xFF0000, 0xFF00, 0xFF, _RGBA),
+    "RGB888": (24, 0xFF, 0xFF00, 0xFF0000, 0, _RGB),
+    "BGR888": (24, 0xFF0000, 0xFF00, 0xFF, 0, _RGB),
+    "RGB565": (16, 0x1F, 0x7E0, 0xF800, 0, _RGB),
+    "I8": (8, 0xFF, 0, 0, 0, dds_codec.DDPF_LUMINANCE),
+    "IA88": (16, 0xFF, 0, 0, 0xFF00, dds_codec.DDPF_LUMINANCE | dds_codec.DDPF_ALPHAPIXELS),
+    "A8": (8, 0, 0, 0, 0xFF, dds_codec.DDPF_ALPHA),
+    "RGB888_BLUESCREEN": (24, 0xFF, 0xFF00, 0xFF0000, 0, _RGB),
+    "BGR888_BLUESCREEN": (24, 0xFF0000, 0xFF00, 0xFF, 0, _RGB),
+    "ARGB8888": (32, 0xFF000000, 0xFF, 0xFF00, 0xFF0000, _RGBA),
+    "BGRA8888": (32, 0xFF0000, 0xFF00, 0xFF, 0xFF000000, _RGBA),
+    "BGRX8888": (32, 0xFF0000, 0xFF00, 0xFF, 0, _RGB),
+    "BGR565": (16, 0xF800, 0x7E0, 0x1F, 0, _RGB),
+    "BGRX5551": (16, 0x7C00, 0x3E0, 0x1F, 0, _RGB),
+    "BGRA4444": (16, 0xF00, 0xF0, 0xF, 0xF000, _RGBA),
+    "BGRA5551": (16, 0x7C00, 0x3E0, 0x1F, 0x8000, _RGBA),
+    "UV88": (16, 0xFF, 0xFF00, 0, 0, _RGB),
+    "UVWQ8888": (32, 0xFF, 0xFF00, 0xFF0000, 0xFF000000, _RGBA),
+    "UVLX8888": (32, 0xFF, 0xFF00, 0xFF0000, 0xFF000000, _RGBA),
+}
+
+# 16-bit and float formats: channel dtype and channel count (R, RGB or RGBA)
+VTF_HDR = {
+    "RGBA16161616F": ("<f2", 4),
+    "RGBA16161616": ("<u2", 4),
+    "R32F": ("<f4", 1),
+    "RGB323232F": ("<f4", 3),
+    "RGBA32323232F": ("<f4", 4),
+}
+
+# Bits per pixel of formats that are sized but not decoded
+_OTHER_FORMAT_BITS = {
+    "P8": 8, "NV_DST16": 16, "NV_DST24": 32, "NV_INTZ": 32, "NV_RAWZ": 32, "NV_NULL": 32,
+}
+
+# Largest dimension of the low-resolution thumbnail
+_LOWRES_SIZE = 16
+
+
+def _layout(format_name):
+    """
+    Pixel format dictionary (as used by dds_codec) for an uncompressed VTF format.
+    """
+    return dict(zip(("rgb_bit_count", "r_mask", "g_mask", "b_mask", "a_mask", "pf_flags"),
+                    VTF_UNCOMPRESSED[format_name]))
+
+
+def surface_size(width, height, format_name):
+    """
+    Size in bytes of one surface in a VTF image format.
+
+    Args:
+        width: Surface width in pixels
+        height: Surface height in pixels
+        format_name: VTF image format name (e.g. 'DXT5', 'BGRA8888')
+
+    Returns:
+        Number of bytes
+    """
+    if format_name == "NONE":
+        return 0
+    if format_name in VTF_BLOCK_FORMATS:
+        return dds_codec.surface_size(width, height, VTF_BLOCK_FORMATS[format_name])
+    if format_name in VTF_UNCOMPRESSED:
+        return width * height * VTF_UNCOMPRESSED[format_name][0] // 8
+    if format_name in VTF_HDR:
+        dtype, channels = VTF_HDR[format_name]
+        return width * height * channels * np.dtype(dtype).itemsize
+    if format_name in _OTHER_FORMAT_BITS:
+        return width * height * _OTHER_FORMAT_BITS[format_name] // 8
+    raise NotImplementedError(f"Unsupported VTF format: {format_name}")
+
+
+def _face_count(flags, version_minor, start_frame):
+    """
+    Number of faces per frame; environment maps before 7.5 may carry a seventh sphere-map face.
+    """
+    if not flags & TEXTUREFLAGS_ENVMAP:
+        return 1
+    return 7 if version_minor < 5 and start_frame != 0xFFFF else 6
+
+
+def parse_vtf_header(data):
+    """
+    Parse a VTF header and its resource directory.
+
+    Resource data is resolved (as hex) when data holds the whole file; with only the
+    header available, data-bearing resources keep their file offset instead.
+
+    Args:
+        data: bytes-like object starting with the 'VTF\\0' signature
+
+    Returns:
+        Dictionary containing metadata
+    """
+    data = memoryview(data)
+    if bytes(data[0:4]) != b"VTF\x00":
+        raise ValueError("Invalid VTF signature")
+
+    (major, minor, header_size, width, height, flags, frames, start_frame,
+     refl_r, refl_g, refl_b, bumpmap_scale, high_format, mipmaps, low_format,
+     low_width, low_height) = _HEADER.unpack_from(data, _HEADER_START)
+    if major != 7:
+        raise ValueError(f"Unsupported VTF version: {major}.{minor}")
+
+    metadata = {}
+    metadata["magic"] = "VTF"
+    metadata["version"] = float(f"{major}.{minor}")
+    metadata["header_size"] = header_size
+    metadata["width"] = width
+    metadata["height"] = height
+    metadata["depth"] = 1
+    metadata["frames"] = max(1, frames)
+    metadata["start_frame"] = start_frame
+    metadata["faces"] = _face_count(flags, minor, start_frame)
+    metadata["mipmaps"] = max(1, mipmaps)
+    metadata["flags"] = f"0x{flags:08X}"
+    metadata["format"] = VTF_FORMATS.get(high_format, "UNKNOWN")
+    metadata["format_id"] = high_format
+    metadata["reflectivity"] = {
+        "r": round(refl_r, 6),
+        "g": round(refl_g, 6),
+        "b": round(refl_b, 6),
+    }
+    metadata["bumpmap_scale"] = round(bumpmap_scale, 6)
+    metadata["lowres_format"] = VTF_FORMATS.get(low_format, "NONE")
+    metadata["lowres_width"] = low_width
+    metadata["lowres_height"] = low_height
+
+    # Volume textures (7.2+)
+    end = _HEADER_START + _HEADER.size
+    if minor >= 2:
+        depth, = struct.unpack_from("<H", data, end)
+        metadata["depth"] = max(1, depth)
+
+    # Resource directory (7.3+) locates the thumbnail and image data
+    lowres_offset = header_size
+    image_offset = header_size + surface_size(low_width, low_height, metadata["lowres_format"])
+    resources = []
+    if minor >= 3:
+        count, = struct.unpack_from("<I", data, end + 5)
+        for index in range(count):
+            tag, res_flags, value = struct.unpack_from("<3sBI", data, 80 + index * 8)
+            if tag == RESOURCE_LOWRES:
+                lowres_offset = value
+            elif tag == RESOURCE_HIGHRES:
+                image_offset = value
+            elif res_flags & RESOURCE_NO_DATA:
+                resources.append({"tag": tag.hex(), "flags": res_flags, "value": value})
+            elif value + 4 <= len(data):
+                size, = struct.unpack_from("<I", data, value)
+                resources.append({"tag": tag.hex(), "flags": res_flags,
+                                  "data_hex": bytes(data[value + 4:value + 4 + size]).hex()})
+            else:
+                resources.append({"tag": tag.hex(), "flags": res_flags, "offset": value})
+    metadata["resources"] = resources
+    metadata["lowres_offset"] = lowres_offset
+    metadata["image_offset"] = image_offset
+    metadata["elements"] = metadata["frames"] * metadata["faces"] * metadata["depth"]
+    return metadata
+
+
+def vtf_surface_offset(metadata, frame=0, face=0, mip=0, slice=0):
+    """
+    Byte offset of one surface of the high-resolution image data.
+
+    Mip levels are stored smallest first; each level holds every frame, each frame
+    every face, and each face every depth slice.
+
+    Args:
+        metadata: Metadata dictionary from parse_vtf_header
+        frame: Animation frame
+        face: Cube map face
+        mip: Mip level (0 is the full-size image)
+        slice: Depth slice of a volume texture
+
+    Returns:
+        Byte offset from the start of the file
+    """
+    width, height, depth = metadata["width"], metadata["height"], metadata["depth"]
+    images = metadata["frames"] * metadata["faces"]
+    offset = metadata["image_offset"]
+    for level in range(metadata["mipmaps"] - 1, mip, -1):
+        size = surface_size(max(1, width >> level), max(1, height >> level), metadata["format"])
+        offset += images * max(1, depth >> level) * size
+    level_depth = max(1, depth >> mip)
+    size = surface_size(max(1, width >> mip), max(1, height >> mip), metadata["format"])
+    return offset + ((frame * metadata["faces"] + face) * level_depth + slice) * size
+
+
+def _decode_hdr(data, width, height, format_name, offset=0):
+    """
+    Decode a 16-bit or float surface to uint8 RGBA.
+
+    Float formats hold linear light: values are clamped to [0, 1] and sRGB-encoded.
+    16-bit integer channels are scaled down to 8 bits as stored.
+    """
+    dtype, channels = VTF_HDR[format_name]
+    values = np.frombuffer(data, dtype=dtype, count=width * height * channels, offset=offset)
+    values = values.reshape(height, width, channels)
+    if values.dtype.kind == "u":
+        pixels = (values.astype(np.uint32) + 128) // 257
+    else:
+        pixels = values.astype(np.float32)
+        pixels[..., :3] = _linear_to_srgb(np.nan_to_num(pixels[..., :3]))
+        pixels = np.clip(np.nan_to_num(pixels) * 255.0 + 0.5, 0, 255)
+
+    image = np.empty((height, width, 4), dtype=np.uint8)
+    if channels == 1:
+        image[..., :3] = pixels
+    else:
+        image[..., :3] = pixels[..., :3]
+    image[..., 3] = pixels[..., 3] if channels == 4 else 255
+    return image
+
+
+def _decode_surface(data, width, height, format_name, offset):
+    """
+    Decode a single surface to RGBA.
+    """
+    if format_name in VTF_BLOCK_FORMATS:
+        decoder = dds_codec.FORMAT_DECODERS[VTF_BLOCK_FORMATS[format_name]]
+        return decoder(data, width, height, offset)
+    if format_name in VTF_HDR:
+        return _decode_hdr(data, width, height, format_name, offset)
+    if format_name not in VTF_UNCOMPRESSED:
+        raise NotImplementedError(f"Unsupported VTF format: {format_name} (palette and depth formats are not decoded)")
+
+    image = dds_codec.decode_uncompressed(data, width, height, _layout(format_name), offset)
+    if format_name.endswith("_BLUESCREEN"):
+        # Pure blue marks transparent pixels
+        key = (image[:, :, 0] == 0) & (image[:, :, 1] == 0) & (image[:, :, 2] == 255)
+        image[key] = 0
+    return image
+
+
+def decode_vtf(data, metadata=None, frame=0, face=0, mip=0, slice=0):
+    """
+    Decode one surface of a VTF file held in memory.
+
+    Args:
+        data: bytes-like object with the complete VTF file
+        metadata: Metadata from parse_vtf_header (parsed from data if omitted)
+        frame: Animation frame
+        face: Cube map face
+        mip: Mip level (0 is the full-size image)
+        slice: Depth slice of a volume texture
+
+    Returns:
+        uint8 RGBA array of shape (height, width, 4)
+    """
+    if metadata is None:
+        metadata = parse_vtf_header(data)
+    width = max(1, metadata["width"] >> mip)
+    height = max(1, metadata["height"] >> mip)
+    offset = vtf_surface_offset(metadata, frame, face, mip, slice)
+    return _decode_surface(data, width, height, metadata["format"], offset)
+
+
+def decode_vtf_array(data, metadata=None, mip=0):
+    """
+    Decode every frame, face and depth slice of one mip level.
+
+    Args:
+        data: bytes-like object with the complete VTF file
+        metadata: Metadata from parse_vtf_header (parsed from data if omitted)
+        mip: Mip level (0 is the full-size image)
+
+    Returns:
+        uint8 RGBA array of shape (elements, height, width, 4)
+    """
+    if metadata is None:
+        metadata = parse_vtf_header(data)
+    depth = max(1, metadata["depth"] >> mip)
+    return np.stack([
+        decode_vtf(data, metadata, frame, face, mip, slice)
+        for frame in range(metadata["frames"])
+        for face in range(metadata["faces"])
+        for slice in range(depth)
+    ])
+
+
+def _encode_hdr(image, format_name):
+    """
+    Encode a uint8 RGBA surface as a 16-bit or float surface (the inverse of _decode_hdr).
+    """
+    dtype, channels = VTF_HDR[format_name]
+    if np.dtype(dtype).kind == "u":
+        values = image.astype(np.uint16) * 257
+    else:
+        values = image.astype(np.float32) / 255.0
+        values[..., :3] = _SRGB_TO_LINEAR[image[..., :3]]
+    return values[..., :channels].astype(dtype).tobytes()
+
+
+def _encode_surface(image, format_name, quality, workers):
+    """
+    Encode a single RGBA surface.
+    """
+    if format_name in VTF_BLOCK_FORMATS:
+        encoder = dds_codec.FORMAT_ENCODERS[VTF_BLOCK_FORMATS[format_name]]
+        return encoder(image, quality, workers)
+    if format_name in VTF_HDR:
+        return _encode_hdr(image, format_name)
+    if format_name not in VTF_UNCOMPRESSED:
+        raise NotImplementedError(f"Unsupported VTF format: {format_name}")
+    if format_name.endswith("_BLUESCREEN"):
+        image = image.copy()
+        image[image[:, :, 3] < 128, :3] = (0, 0, 255)
+    return dds_codec.encode_uncompressed(image, _layout(format_name))
+
+
+def encode_vtf(image, format_name="DXT5", version=7.2, flags=0, mipmaps=None, start_frame=0,
+               bumpmap_scale=1.0, reflectivity=None, lowres_format="DXT1", resources=(),
+               format_id=None, quality="fast", workers=None, mip_filter="box", depth=1):
+    """
+    Encode an image (or a stack of frames / faces / depth slices) as a VTF file.
+
+    Args:
+        image: uint8 array of shape (height, width[, channels]), or
+            (elements, height, width, channels) ordered frame-major, then face, then slice
+        format_name: VTF image format name (e.g. 'DXT1', 'DXT5', 'BGRA8888')
+        version: VTF version (7.0 - 7.5)
+        flags: Texture flags (int or hex string)
+        mipmaps: Number of mip levels to store (None builds the full chain)
+        start_frame: First animation frame
+        bumpmap_scale: Bump map scale
+        reflectivity: Dict with r/g/b, computed from the image if omitted
+        lowres_format: Thumbnail format name, or 'NONE' to omit the thumbnail
+        resources: Extra resource entries (7.3+) as returned by parse_vtf_header
+        format_id: Image format number to write (keeps ASW/2013 ATIxN numbering)
+        quality: 'fast' or 'high'
+        workers: Number of worker processes (None uses all cores)
+        mip_filter: Mip filter ('box' or 'kaiser')
+        depth: Depth slices of a volume texture (7.2+)
+
+    Returns:
+        bytes with the VTF file
+    """
+    if isinstance(flags, str):
+        flags = int(flags, 16)
+    minor = int(round((version - 7) * 10))
+    if not 0 <= minor <= 5:
+        raise ValueError(f"Unsupported VTF version: {version}")
+    depth = max(1, int(depth))
+    if depth > 1 and minor < 2:
+        raise ValueError(f"Volume textures need VTF 7.2 or later, not {version}")
+    if format_id is None or VTF_FORMATS.get(format_id) != format_name:
+        format_id = VTF_FORMAT_IDS[format_name]
+
+    rgba = np.asarray(image)
+    elements = rgba if rgba.ndim == 4 else rgba[None]
+    elements = np.stack([dds_codec._to_rgba(element) for element in elements])
+    count, height, width = elements.shape[:3]
+    faces = _face_count(flags, minor, start_frame)
+    if count % (faces * depth):
+        raise ValueError(f"Expected a multiple of {faces} faces x {depth} slices, got {count} images")
+    frames = count // (faces * depth)
+
+    # Mip chain, full-size level first; normal maps are filtered as data, and textures
+    # wrap around unless they are clamped. Volume levels also halve the slice count.
+    full_chain = mipmap_count(width, height)
+    mipmaps = full_chain if mipmaps is None else max(1, min(int(mipmaps), full_chain))
+    levels = generate_mipmaps(elements, mipmaps, mip_filter, srgb=not flags & TEXTUREFLAGS_NORMAL,
+                              wrap=not flags & (TEXTUREFLAGS_CLAMPS | TEXTUREFLAGS_CLAMPT), depth=depth)
+
+    # Average linear color of the full-size image
+    if reflectivity is None:
+        linear = (elements[..., :3].reshape(-1, 3).astype(np.float64) / 255.0) ** 2.2
+        mean = linear.mean(axis=0)
+        reflectivity = {"r": mean[0], "g": mean[1], "b": mean[2]}
+
+    # Thumbnail from the first frame: the first level that fits in 16x16
+    lowres = b""
+    low_width = low_height = 0
+    if lowres_format != "NONE":
+        skip = 0
+        while max(width, height) >> skip > _LOWRES_SIZE:
+            skip += 1
+        if skip < len(levels):
+            thumbnail = levels[skip][0]
+        else:
+            thumbnail = generate_mipmaps(elements[0], skip + 1, mip_filter)[skip]
+        low_height, low_width = thumbnail.shape[:2]
+        lowres = _encode_surface(thumbnail, lowres_format, quality, 1)
+    low_format_id = VTF_FORMAT_IDS.get(lowres_format, -1)
+
+    # Image data, smallest mip first
+    highres = b"".join(
+        _encode_surface(surface, format_name, quality, workers)
+        for level in reversed(levels)
+        for surface in level
+    )
+
+    header = _HEADER.pack(
+        7, minor, 0, width, height, flags, frames, start_frame,
+        reflectivity["r"], reflectivity["g"], reflectivity["b"], bumpmap_scale,
+        format_id, mipmaps, low_format_id, low_width, low_height,
+    )
+    header = b"VTF\x00" + header
+    if minor >= 2:
+        header += struct.pack("<H", depth)
+
+    body = b""
+    if minor >= 3:
+        # Resource directory, sorted by tag; data-bearing resources follow the image data
+        entries = [(RESOURCE_HIGHRES, 0, highres)]
+        if lowres:
+            entries.append((RESOURCE_LOWRES, 0, lowres))
+        for resource in resources:
+            tag = bytes.fromhex(resource["tag"])
+            if "value" in resource:
+                entries.append((tag, resource["flags"] | RESOURCE_NO_DATA, resource["value"]))
+            elif "data_hex" in resource:
+                data = bytes.fromhex(resource["data_hex"])
+                entries.append((tag, resource["flags"] & ~RESOURCE_NO_DATA, struct.pack("<I", len(data)) + data))
+        entries.sort(key=lambda entry: entry[0])
+
+        header += b"\x00" * 3 + struct.pack("<I", len(entries)) + b"\x00" * 8
+        header_size = len(header) + 8 * len(entries)
+        directory = b""
+        for tag, res_flags, value in entries:
+            if isinstance(value, bytes):
+                directory += struct.pack("<3sBI", tag, res_flags, header_size + len(body))
+                body += value
+            else:
+                directory += struct.pack("<3sBI", tag, res_flags, value)
+        header += directory
+    else:
+        # 7.0 / 7.1 headers are padded to 64 bytes, 7.2 to 80
+        header = header.ljust(80 if minor == 2 else 64, b"\x00")
+        header_size = len(header)
+        body = lowres + highres
+
+    header = header[:12] + struct.pack("<I", header_size) + header[16:]
+    return header + body
+
+
+def encode_vtf_like(image, metadata, quality="fast", workers=None, mip_filter="box"):
+    """
+    Encode an image as a VTF file matching the source texture's metadata.
+
+    Format, version, flags, mip count (a full chain is rebuilt at the new size when the
+    source had one), start frame, bump scale, thumbnail format and
+    extra resources are reused; a vertical strip of frames / faces / depth slices (as
+    written by vtf_to_png) is split back into separate images.
+
+    Args:
+        image: uint8 array of shape (height, width[, channels])
+        metadata: Metadata dictionary from parse_vtf_header (may be partial)
+        quality: 'fast' or 'high'
+        workers: Number of worker processes (None uses all cores)
+        mip_filter: Mip filter ('box' or 'kaiser')
+
+    Returns:
+        bytes with the VTF file
+    """
+    image = np.asarray(image)
+    elements = metadata.get("elements", 1)
+    if elements > 1 and image.shape[0] % elements == 0:
+        image = image.reshape((elements, image.shape[0] // elements) + image.shape[1:])
+
+    format_name = metadata.get("format", "DXT5")
+    if format_name not in VTF_FORMAT_IDS:
+        format_name = "DXT5"
+    lowres_format = metadata.get("lowres_format", "DXT1")
+    if lowres_format not in VTF_FORMAT_IDS:
+        lowres_format = "NONE"
+    height, width = image.shape[1:3] if image.ndim == 4 else image.shape[:2]
+
+    return encode_vtf(
+        image,
+        format_name=format_name,
+        version=metadata.get("version", 7.2),
+        flags=metadata.get("flags", 0),
+        mipmaps=mip_count_like(metadata, width, height),
+        start_frame=metadata.get("start_frame", 0),
+        bumpmap_scale=metadata.get("bumpmap_scale", 1.0),
+        lowres_format=lowres_format,
+        resources=metadata.get("resources", ()),
+        format_id=metadata.get("format_id"),
+        quality=quality,
+        workers=workers,
+        mip_filter=mip_filter,
+        depth=metadata.get("depth", 1) if image.ndim == 4 else 1,
+    )